@@ -0,0 +1,191 @@
+import asyncio
+import json
+import pathlib
+from collections.abc import Iterable
+from http import HTTPStatus
+from typing import Any
+from urllib.parse import urlparse
+
+import httpx
+from pydantic import BaseModel
+
+from zimitfrontend.constants import ApiConfiguration, logger
+from zimitfrontend.metrics import Counter, Gauge
+
+BUNDLED_BLACKLIST_PATH = pathlib.Path(__file__).parent / "res/blacklist.json"
+
+
+class BlacklistMatch(BaseModel):
+    # blacklist entry, as configured
+    entry: dict[str, Any]
+    # blacklisted host which matched, i.e. the hostname or one of its parents
+    host: str
+    # why this host is blacklisted
+    reason: str | None
+
+
+def normalize_host(host: str) -> str:
+    """Lowercase host without trailing dot of fully qualified names"""
+    return host.strip().lower().rstrip(".")
+
+
+def get_url_hostname(url: str) -> str | None:
+    """Normalized hostname of a URL, which might lack a scheme"""
+    try:
+        parsed = urlparse(url)
+        # same as normalize_hostname, netloc is recognized only if introduced by '//'
+        if not (parsed.scheme or parsed.netloc):
+            parsed = urlparse("//" + url)
+        hostname = parsed.hostname
+    except ValueError:  # e.g. invalid IPv6 address
+        return None
+    return normalize_host(hostname) if hostname else None
+
+
+class Blacklist:
+    """Hosts which cannot be requested, along with their subdomains
+
+    Entries are indexed by host so that matching a hostname only costs one lookup
+    per label of the hostname, no matter how many entries are blacklisted.
+    """
+
+    def __init__(self, entries: Iterable[dict[str, Any]]):
+        self.entries = list(entries)
+        self._entries_by_host: dict[str, dict[str, Any]] = {}
+        for entry in self.entries:
+            # first entry wins should a host be listed twice
+            self._entries_by_host.setdefault(normalize_host(entry["host"]), entry)
+
+    @classmethod
+    def from_json(cls, content: bytes) -> "Blacklist":
+        """Blacklist from JSON document, raising ValueError if it is invalid"""
+        entries = json.loads(content).get("blacklist")
+        if not isinstance(entries, list):
+            raise ValueError("blacklist is not a list")
+        for entry in entries:  # pyright: ignore[reportUnknownVariableType]
+            if not isinstance(entry, dict) or not isinstance(
+                entry.get("host"), str  # pyright: ignore[reportUnknownMemberType]
+            ):
+                raise ValueError(f"Invalid blacklist entry: {entry}")
+            if not normalize_host(entry["host"]):  # pyright: ignore
+                raise ValueError(f"Empty host in blacklist entry: {entry}")
+        return cls(entries)  # pyright: ignore[reportUnknownArgumentType]
+
+    @classmethod
+    def from_file(cls, path: pathlib.Path) -> "Blacklist":
+        return cls.from_json(path.read_bytes())
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def match_host(self, hostname: str) -> BlacklistMatch | None:
+        """Most specific entry matching hostname or one of its parent domains"""
+        host = normalize_host(hostname)
+        while host:
+            if entry := self._entries_by_host.get(host):
+                return BlacklistMatch(
+                    entry=entry, host=host, reason=entry.get("reason")
+                )
+            _, _, host = host.partition(".")
+        return None
+
+    def match_url(self, url: str) -> BlacklistMatch | None:
+        """Entry matching hostname of URL, if any"""
+        hostname = get_url_hostname(url)
+        if not hostname:
+            return None
+        return self.match_host(hostname)
+
+
+class BlacklistManager:
+    """Current blacklist, reloaded from its location (file path or URL) on changes
+
+    New versions are parsed and indexed off the request path, then swapped in
+    atomically; the previous version is kept should the new one be invalid.
+    """
+
+    def __init__(self, location: str):
+        self.location = location
+        self.blacklist = Blacklist.from_file(BUNDLED_BLACKLIST_PATH)
+        # number of versions loaded from location so far
+        self.version = 0
+        # file modification time and size, or HTTP ETag, of current version
+        self._fingerprint: Any = None
+
+    @property
+    def nb_entries(self) -> int:
+        return len(self.blacklist)
+
+    @property
+    def is_url(self) -> bool:
+        return urlparse(self.location).scheme in ("http", "https")
+
+    async def _read_file(self) -> tuple[bytes, Any] | None:
+        path = pathlib.Path(self.location)
+        stat = await asyncio.to_thread(path.stat)
+        fingerprint = (stat.st_mtime_ns, stat.st_size)
+        if fingerprint == self._fingerprint:
+            return None
+        return await asyncio.to_thread(path.read_bytes), fingerprint
+
+    async def _read_url(self) -> tuple[bytes, Any] | None:
+        headers = {"If-None-Match": self._fingerprint} if self._fingerprint else {}
+        async with httpx.AsyncClient(
+            timeout=ApiConfiguration.blacklist_requests_timeout
+        ) as client:
+            resp = await client.get(self.location, headers=headers)
+        if resp.status_code == HTTPStatus.NOT_MODIFIED:
+            return None
+        resp.raise_for_status()
+        return resp.content, resp.headers.get("ETag")
+
+    async def reload(self) -> bool:
+        """Load blacklist from location if it has changed, return whether it did"""
+        read = await (self._read_url() if self.is_url else self._read_file())
+        if read is None:
+            return False
+        content, fingerprint = read
+        blacklist = await asyncio.to_thread(Blacklist.from_json, content)
+        # only now, so that a version which could not be read or parsed (e.g. file
+        # being written) is loaded again on next reload
+        self._fingerprint = fingerprint
+        self.blacklist = blacklist
+        self.version += 1
+        logger.info(
+            f"Blacklist version {self.version} loaded from {self.location}: "
+            f"{self.nb_entries} websites are blacklisted"
+        )
+        return True
+
+    async def reload_periodically(self):
+        """Reload blacklist in background, forever"""
+        while True:
+            await asyncio.sleep(ApiConfiguration.blacklist_refresh_interval)
+            try:
+                await self.reload()
+            except Exception as exc:
+                logger.warning(
+                    f"Failed to reload blacklist from {self.location}, keeping "
+                    f"version {self.version}: {exc}"
+                )
+
+
+blacklist_manager = BlacklistManager(
+    ApiConfiguration.blacklist_location or str(BUNDLED_BLACKLIST_PATH)
+)
+
+blacklist_hits = Counter(
+    "blacklist_hits_total",
+    "URLs found in blacklist, by source (task creation or URL check)",
+    ("source",),
+)
+Gauge(
+    "blacklist_version",
+    "Number of blacklist versions loaded from its location so far",
+    function=lambda: blacklist_manager.version,
+)
+Gauge(
+    "blacklist_entries",
+    "Websites in current blacklist",
+    function=lambda: blacklist_manager.nb_entries,
+)
@@ -0,0 +1,76 @@
+import asyncio
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Generic, TypeVar
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """Bounded in-memory cache whose entries expire after a per-entry TTL
+
+    Least recently used entries are evicted first once `maxsize` is reached.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._inflight: dict[K, asyncio.Task[V]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> V | None:
+        """Value stored for key, or None if missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: V, ttl: float) -> None:
+        """Store value for key during ttl seconds"""
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: K) -> None:
+        """Remove key from cache, if present"""
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def get_or_fetch(
+        self, key: K, fetch: Callable[[], Awaitable[tuple[V, float]]]
+    ) -> V:
+        """Cached value for key, or result of fetch which is then cached
+
+        `fetch` returns the value and its TTL; a TTL of 0 means the value must not
+        be cached (e.g. an error), it is only shared with concurrent callers.
+
+        Concurrent misses on the same key share a single fetch.
+        """
+        if (value := self.get(key)) is not None:
+            return value
+        if (task := self._inflight.get(key)) is None:
+            task = asyncio.create_task(self._fetch(key, fetch))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield the shared fetch from cancellation of one of its waiters
+        return await asyncio.shield(task)
+
+    async def _fetch(
+        self, key: K, fetch: Callable[[], Awaitable[tuple[V, float]]]
+    ) -> V:
+        value, ttl = await fetch()
+        if ttl > 0:
+            self.set(key, value, ttl)
+        return value
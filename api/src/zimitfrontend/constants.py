@@ -1,5 +1,4 @@
 import datetime
-import json
 import os
 import pathlib
 import random
@@ -10,18 +9,16 @@ from zimitfrontend.logging import get_logger
 
 src_dir = pathlib.Path(__file__).parent.resolve()
 
-logger = get_logger(
-    "zimitfrontend",
-    level=os.getenv(
-        "LOG_LEVEL",
-        "INFO",
-    ),
-)
+# errors of settings read before logger is set up (i.e. its own settings), reported
+# once it is
+_pending_setting_errors: list[str] | None = []
 
-blacklist = json.loads(
-    (pathlib.Path(__file__).parent / "res/blacklist.json").read_bytes()
-)["blacklist"]
-logger.info(f"{len(blacklist)} websites are blacklisted")
+
+def _report_setting_error(message: str):
+    if _pending_setting_errors is not None:
+        _pending_setting_errors.append(message)
+    else:
+        logger.error(message)
 
 
 def _get_int_setting(environment_variable_name: str, default_value: int) -> int:
@@ -29,9 +26,9 @@ def _get_int_setting(environment_variable_name: str, default_value: int) -> int:
     try:
         return int(os.getenv(environment_variable_name) or default_value)
     except Exception as exc:
-        logger.error(
+        _report_setting_error(
             f"Unable to parse {environment_variable_name}: "
-            f"{os.getenv(environment_variable_name)}."
+            f"{os.getenv(environment_variable_name)}. "
             f"Using {default_value}. Error: {exc}"
         )
         return default_value
@@ -44,7 +41,7 @@ def _get_size_setting(environment_variable_name: str, default_value: str) -> int
             os.getenv(environment_variable_name) or default_value
         )
     except Exception as exc:
-        logger.error(
+        _report_setting_error(
             f"Unable to apply custom {environment_variable_name}: "
             f"{os.getenv(environment_variable_name)}. "
             f"Using {default_value}. Error: {exc}"
@@ -62,7 +59,7 @@ def _get_time_setting(environment_variable_name: str, default_value: str) -> flo
             os.getenv(environment_variable_name) or default_value
         )
     except Exception as exc:
-        logger.error(
+        _report_setting_error(
             f"Unable to apply custom {environment_variable_name}: "
             f"{os.getenv(environment_variable_name)}. "
             f"Using {default_value}. Error: {exc}"
@@ -70,6 +67,27 @@ def _get_time_setting(environment_variable_name: str, default_value: str) -> flo
         return humanfriendly.parse_timespan(default_value)
 
 
+logger = get_logger(
+    "zimitfrontend",
+    level=os.getenv(
+        "LOG_LEVEL",
+        "INFO",
+    ),
+    # text or json
+    json_output=os.getenv("LOG_FORMAT", "text").lower() == "json",
+    # records are handed over to a background thread, and dropped when queue is full
+    queue_size=_get_int_setting("LOG_QUEUE_SIZE", 10000),
+    # max number of records of a given message logged per interval, 0 to disable
+    rate_limit=_get_int_setting("LOG_RATE_LIMIT", 10),
+    rate_interval=_get_time_setting("LOG_RATE_INTERVAL", "1m"),
+)
+
+# report errors of logger settings, now that it is set up
+for _message in _pending_setting_errors or []:
+    logger.error(_message)
+_pending_setting_errors = None
+
+
 class ApiConfiguration:
     """Shared backend configuration"""
 
@@ -82,6 +100,16 @@ class ApiConfiguration:
         "INTERNAL_ZIMFARM_WEBAPI", "https://api.farm.zimit.kiwix.org/v2"
     )
     zimfarm_requests_timeout = _get_time_setting("ZIMFARM_REQUESTS_TIMEOUT", "10s")
+    # connection pool shared by all calls to the Zimfarm
+    zimfarm_pool_size = _get_int_setting("ZIMFARM_POOL_SIZE", 100)
+    zimfarm_keepalive_connections = _get_int_setting(
+        "ZIMFARM_KEEPALIVE_CONNECTIONS", 20
+    )
+    zimfarm_keepalive_expiry = _get_time_setting("ZIMFARM_KEEPALIVE_EXPIRY", "30s")
+    # retries on connection errors and on transient upstream errors (idempotent
+    # methods only)
+    zimfarm_max_retries = _get_int_setting("ZIMFARM_MAX_RETRIES", 2)
+    zimfarm_retry_backoff = _get_time_setting("ZIMFARM_RETRY_BACKOFF", "0.5s")
     mailgun_requests_timeout = _get_time_setting("MAILGUN_REQUESTS_TIMEOUT", "10s")
     auth_mode = os.getenv("AUTH_MODE", default="local")
     zimfarm_oauth_issuer = os.getenv(
@@ -97,11 +125,69 @@ class ApiConfiguration:
             os.getenv("ZIMFARM_TOKEN_RENEWAL_WINDOW", default="2m")
         )
     )
+    # recipes are deleted in background once their task has been requested
+    recipe_delete_max_attempts = _get_int_setting("RECIPE_DELETE_MAX_ATTEMPTS", 5)
+    recipe_delete_retry_backoff = _get_time_setting("RECIPE_DELETE_RETRY_BACKOFF", "1s")
+    # recipes created are journaled, and those still there after max age are swept
+    # periodically, along with Zimfarm recipes named like ours (i.e. with our prefix,
+    # distinct per deployment sharing a Zimfarm) but unknown to the journal; journal
+    # is in memory when path is not set, so recipes left behind by a crash are then
+    # only found back by their name
+    recipe_name_prefix = os.getenv("RECIPE_NAME_PREFIX", "zimit-frontend_")
+    recipe_journal_path = os.getenv("RECIPE_JOURNAL_PATH", ":memory:")
+    recipe_max_age = _get_time_setting("RECIPE_MAX_AGE", "15m")
+    recipe_sweep_interval = _get_time_setting("RECIPE_SWEEP_INTERVAL", "30m")
+    recipe_sweep_concurrency = _get_int_setting("RECIPE_SWEEP_CONCURRENCY", 5)
+    # duration during which a repeated task creation gets the reply of the first one
+    idempotency_window = _get_time_setting("IDEMPOTENCY_WINDOW", "10m")
+    idempotency_cache_size = _get_int_setting("IDEMPOTENCY_CACHE_SIZE", 10000)
+    # identical requests are attached to the task of the first one while it is
+    # ongoing or once it has succeeded, up to this duration after its creation; tasks
+    # and clients attached to them are kept in memory, lost on restart (clients
+    # attached are then not notified), and not shared by workers, hence dedup is
+    # disabled when tracker is shared (TRACKER_DATABASE_PATH set)
+    dedup_window = _get_time_setting("DEDUP_WINDOW", "24h")
+    dedup_cache_size = _get_int_setting("DEDUP_CACHE_SIZE", 10000)
+    # cache of tasks status, served to UI
+    task_cache_size = _get_int_setting("TASK_CACHE_SIZE", 10000)
+    task_cache_ttl_ongoing = _get_time_setting("TASK_CACHE_TTL_ONGOING", "10s")
+    task_cache_ttl_ended = _get_time_setting("TASK_CACHE_TTL_ENDED", "1h")
+    # task events streams: interval between polls of the task (through the cache)
+    # and between keep-alive comments
+    task_events_interval = _get_time_setting("TASK_EVENTS_INTERVAL", "10s")
+    task_events_keepalive = _get_time_setting("TASK_EVENTS_KEEPALIVE", "15s")
+
+    # whether metrics are exposed at /metrics; those are kept per process, so each
+    # worker only exposes its own (scrape each worker, or run a single one)
+    metrics_enabled = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+
+    # file to which tracing spans are appended as JSON lines, none if empty, by a
+    # background thread (spans are dropped when its queue is full)
+    tracing_export_path = os.getenv("TRACING_EXPORT_PATH", "")
+    tracing_queue_size = _get_int_setting("TRACING_QUEUE_SIZE", 10000)
+
     zimit_image = os.getenv("ZIMIT_IMAGE", "openzim/zimit:1.2.0")
     zimit_definition_version = os.getenv("ZIMIT_DEFINITION_VERSION", "")
     if not zimit_definition_version:
         _, zimit_definition_version = zimit_image.split(":")
 
+    # offliner definition is cached in memory and revalidated periodically
+    offliner_definition_refresh_interval = _get_time_setting(
+        "OFFLINER_DEFINITION_REFRESH_INTERVAL", "15m"
+    )
+    # max-age of offliner definition in browsers and proxies caches
+    offliner_definition_max_age = _get_time_setting("OFFLINER_DEFINITION_MAX_AGE", "5m")
+
+    # blacklist file path or URL (bundled list when not set), reloaded when changed
+    blacklist_location = os.getenv("BLACKLIST_LOCATION", "")
+    blacklist_refresh_interval = _get_time_setting("BLACKLIST_REFRESH_INTERVAL", "10s")
+    blacklist_requests_timeout = _get_time_setting("BLACKLIST_REQUESTS_TIMEOUT", "10s")
+
+    # pre-flight check of URLs; reachability probe is disabled with a 0s timeout
+    check_url_probe_timeout = _get_time_setting("CHECK_URL_PROBE_TIMEOUT", "5s")
+    check_url_cache_size = _get_int_setting("CHECK_URL_CACHE_SIZE", 10000)
+    check_url_cache_ttl = _get_time_setting("CHECK_URL_CACHE_TTL", "5m")
+
     zimit_size_limit = _get_int_setting("ZIMIT_SIZE_LIMIT", 2**30 * 4)
     zimit_time_limit = _get_int_setting("ZIMIT_TIME_LIMIT", 3600 * 2)
 
@@ -117,6 +203,21 @@ class ApiConfiguration:
     mailgun_api_url = os.getenv(
         "MAILGUN_API_URL", "https://api.mailgun.net/v3/mg.zimit.kiwix.org"
     )
+    # mails are queued and sent in background by a pool of workers
+    mail_workers = _get_int_setting("MAIL_WORKERS", 4)
+    mail_queue_size = _get_int_setting("MAIL_QUEUE_SIZE", 1000)
+    mail_max_attempts = _get_int_setting("MAIL_MAX_ATTEMPTS", 5)
+    mail_retry_backoff = _get_time_setting("MAIL_RETRY_BACKOFF", "5s")
+    mail_dead_letters_size = _get_int_setting("MAIL_DEAD_LETTERS_SIZE", 100)
+    # rendered emails, by locale, task status and task id
+    email_cache_size = _get_int_setting("EMAIL_CACHE_SIZE", 1000)
+    email_cache_ttl = _get_time_setting("EMAIL_CACHE_TTL", "1h")
+    # identical mails waiting in queue are sent in one Mailgun call (max 1000)
+    mail_batch_size = min(_get_int_setting("MAIL_BATCH_SIZE", 500), 1000)
+    # max number of messages sent per second, as allowed by Mailgun plan (0: no max)
+    mailgun_rate_limit = _get_int_setting("MAILGUN_RATE_LIMIT", 50)
+    # time left to queued mails to be sent on shutdown
+    mail_shutdown_timeout = _get_time_setting("MAIL_SHUTDOWN_TIMEOUT", "10s")
 
     public_url = os.getenv("PUBLIC_URL", "https://zimit.kiwix.org")
     public_api_url = os.getenv("PUBLIC_API_URL", "https://zimit.kiwix.org/api/v1")
@@ -132,9 +233,29 @@ class ApiConfiguration:
     hook_token = os.getenv("HOOK_TOKEN", random.getrandbits(128).to_bytes(16).hex())
 
     # tracking
+    # all tasks notify their completion via webhook, reconciliation is only a safety
+    # net should a webhook call be lost
+    tracker_reconcile_interval = _get_time_setting("TRACKER_RECONCILE_INTERVAL", "5m")
+    tracker_refresh_concurrency = _get_int_setting("TRACKER_REFRESH_CONCURRENCY", 20)
+    tracker_refresh_timeout = _get_time_setting("TRACKER_REFRESH_TIMEOUT", "5s")
+    # slot of a task being created is held at most this long, e.g. if worker crashed
+    tracker_reservation_ttl = _get_time_setting("TRACKER_RESERVATION_TTL", "10m")
+    # SQLite database shared by all workers and persisted across restarts; tracker
+    # is kept in memory of each worker when not set
+    tracker_database_path = os.getenv("TRACKER_DATABASE_PATH", "")
     digest_key = bytes.fromhex(
         os.getenv("DIGEST_KEY", random.getrandbits(64).to_bytes(8).hex())
     )
+    # dedup state is local to each worker, see dedup settings above
+    dedup_enabled = not tracker_database_path
+    # unique ids and webhooks issued by a worker must be accepted by all others, and
+    # after a restart, hence keys cannot be random ones
+    if tracker_database_path and not (
+        os.getenv("DIGEST_KEY") and os.getenv("HOOK_TOKEN")
+    ):
+        raise ValueError(
+            "DIGEST_KEY and HOOK_TOKEN must be set along with TRACKER_DATABASE_PATH"
+        )
 
     locales_location = pathlib.Path(os.getenv("LOCALES_LOCATION", "../locales"))
 
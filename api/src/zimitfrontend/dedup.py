@@ -0,0 +1,126 @@
+import hashlib
+import json
+from http import HTTPStatus
+from typing import Any
+
+from pydantic import BaseModel
+
+from zimitfrontend.cache import TTLCache
+from zimitfrontend.constants import ApiConfiguration
+from zimitfrontend.tasks import get_task
+
+# flags which only name the ZIM produced, not what is crawled; unique per request
+# by default
+OUTPUT_NAME_FLAGS = ("name", "zim-file")
+# status of tasks which new identical requests can be attached to; not those being
+# cancelled, which will not produce anything
+SHAREABLE_TASK_STATUSES = (
+    "requested",
+    "reserved",
+    "scraper_running",
+    "scraper_started",
+    "started",
+    "succeeded",
+)
+# how long clients of a shared task are remembered; tasks might stay queued for days
+SHARED_TASK_TTL = 7 * 24 * 3600
+
+
+class Subscriber(BaseModel):
+    # unique ID of client on behalf of which email is notified
+    client_id: str
+    email: str
+    lang: str
+
+
+class SharedTask(BaseModel):
+    task_id: str
+    # unique ID of clients which requested the task, its creator first
+    client_ids: list[str]
+    # whom to notify once task has ended, besides its creator
+    subscribers: list[Subscriber] = []
+
+
+# task created for each fingerprint
+task_ids_by_fingerprint: TTLCache[str, str] = TTLCache(
+    maxsize=ApiConfiguration.dedup_cache_size
+)
+# clients and subscribers of each task created
+shared_tasks: TTLCache[str, SharedTask] = TTLCache(
+    maxsize=ApiConfiguration.dedup_cache_size
+)
+
+
+def get_task_fingerprint(flags: dict[str, Any], output_flags: dict[str, Any]) -> str:
+    """Fingerprint of what a task crawls and produces
+
+    Output name flags are only accounted for when requested explicitly
+    (`output_flags`), since they are otherwise generated for each request.
+    """
+    crawl_flags = {
+        key: value for key, value in flags.items() if key not in OUTPUT_NAME_FLAGS
+    }
+    return hashlib.sha256(
+        json.dumps([crawl_flags, output_flags], sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def record_task(fingerprint: str, task_id: str, client_id: str):
+    """Record a task just created by a client, so that others can attach to it"""
+    if not ApiConfiguration.dedup_enabled:
+        return
+    task_ids_by_fingerprint.set(fingerprint, task_id, ttl=ApiConfiguration.dedup_window)
+    shared_tasks.set(
+        task_id,
+        SharedTask(task_id=task_id, client_ids=[client_id]),
+        ttl=SHARED_TASK_TTL,
+    )
+
+
+async def find_task(fingerprint: str) -> Any | None:
+    """Task with this fingerprint which a new request can be attached to, if any"""
+    if not ApiConfiguration.dedup_enabled:
+        return None
+    task_id = task_ids_by_fingerprint.get(fingerprint)
+    if not task_id:
+        return None
+    status, task = await get_task(task_id)
+    if status != HTTPStatus.OK or task["status"] not in SHAREABLE_TASK_STATUSES:
+        task_ids_by_fingerprint.pop(fingerprint)
+        return None
+    return task
+
+
+def attach_client(task_id: str, client_id: str, subscriber: Subscriber | None):
+    """Attach a client, and whom to notify on its behalf, to an existing task"""
+    shared_task = shared_tasks.get(task_id)
+    if not shared_task:
+        shared_task = SharedTask(task_id=task_id, client_ids=[])
+        shared_tasks.set(task_id, shared_task, ttl=SHARED_TASK_TTL)
+    if client_id not in shared_task.client_ids:
+        shared_task.client_ids.append(client_id)
+    if subscriber and subscriber not in shared_task.subscribers:
+        shared_task.subscribers.append(subscriber)
+
+
+def detach_client(task_id: str, client_id: str) -> bool:
+    """Detach a client from a task, return whether other clients still need it"""
+    shared_task = shared_tasks.get(task_id)
+    if not shared_task or client_id not in shared_task.client_ids:
+        return False
+    shared_task.client_ids.remove(client_id)
+    shared_task.subscribers = [
+        subscriber
+        for subscriber in shared_task.subscribers
+        if subscriber.client_id != client_id
+    ]
+    return len(shared_task.client_ids) > 0
+
+
+def pop_subscribers(task_id: str) -> list[Subscriber]:
+    """Whom to notify of a task end besides its creator, once and only once"""
+    shared_task = shared_tasks.get(task_id)
+    if not shared_task:
+        return []
+    subscribers, shared_task.subscribers = shared_task.subscribers, []
+    return subscribers
@@ -0,0 +1,112 @@
+import re
+import threading
+from functools import cache
+from typing import Any
+
+from zimitfrontend import i18n
+from zimitfrontend.cache import TTLCache
+from zimitfrontend.constants import ApiConfiguration, logger
+from zimitfrontend.routes.schemas import ZimfarmTask
+from zimitfrontend.utils import jinja_env
+
+# placeholders in translations, e.g. `%{link}`
+PLACEHOLDER_PATTERN = re.compile(r"%\{(\w+)\}")
+
+# i18nice lazily loads locale files on first lookup, which is not thread-safe
+_translations_lock = threading.Lock()
+
+
+@cache
+def get_locales() -> frozenset[str]:
+    """Locales with a translation file, excluding message documentation"""
+    return frozenset(
+        path.stem
+        for path in ApiConfiguration.locales_location.glob("*.json")
+        if path.stem != "qqq"
+    )
+
+
+def resolve_locale(lang: str) -> str:
+    """Requested locale if it has translations, English otherwise"""
+    return lang if lang in get_locales() else "en"
+
+
+@cache
+def get_translation(lang: str, key: str) -> str:
+    """Translation of key in lang, placeholders not interpolated
+
+    Resolved once per locale and key, without relying on i18nice global locale.
+    Locale must be resolved first, so that the cache is bound by known locales.
+    """
+    with _translations_lock:
+        return i18n.t(key, locale=lang)
+
+
+def translate_to(lang: str):
+    """Translate function for templates, bound to a locale"""
+    lang = resolve_locale(lang)
+
+    def translate(key: str, **kwargs: Any) -> str:
+        return PLACEHOLDER_PATTERN.sub(
+            lambda match: (
+                str(kwargs[match.group(1)])
+                if match.group(1) in kwargs
+                else match.group(0)
+            ),
+            get_translation(lang, key),
+        )
+
+    return translate
+
+
+class EmailRenderer:
+    """Renders task notification emails, subject and body
+
+    Templates are compiled once and rendered with translations of the requested
+    locale, so renders in different locales can run concurrently. Rendered emails
+    are memoized by locale, task status and task id.
+    """
+
+    def __init__(self):
+        self.subject_template = jinja_env.get_template("email_subject.txt")
+        self.body_template = jinja_env.get_template("email_body.html")
+        self._rendered: TTLCache[tuple[str, str, str], tuple[str, str]] = TTLCache(
+            maxsize=ApiConfiguration.email_cache_size
+        )
+        self._lock = threading.Lock()
+
+    def _render(self, lang: str, task: ZimfarmTask) -> tuple[str, str]:
+        context = {
+            "base_url": ApiConfiguration.public_url,
+            "download_url": ApiConfiguration.zim_download_url,
+            "size_limit": ApiConfiguration.zimit_size_limit,
+            "time_limit": ApiConfiguration.zimit_time_limit,
+            "contact_us_url": ApiConfiguration.contact_us_url,
+            "task": task.model_dump(),
+            "rtl": lang in ApiConfiguration.rtl_language_codes,
+            "lang": lang,
+            "translate": translate_to(lang),
+        }
+        logger.info(f"Translating to {lang}")
+        subject = self.subject_template.render(**context).replace("\n", "")
+        body = self.body_template.render(**context)
+        return subject, body
+
+    def render(self, lang: str, task: ZimfarmTask) -> tuple[str, str]:
+        """Subject and body of email notifying task status in lang"""
+        lang = resolve_locale(lang)
+        key = (lang, task.status, task.id)
+        with self._lock:
+            rendered = self._rendered.get(key)
+        if rendered is None:
+            rendered = self._render(lang, task)
+            with self._lock:
+                self._rendered.set(key, rendered, ttl=ApiConfiguration.email_cache_ttl)
+        return rendered
+
+    def clear(self):
+        with self._lock:
+            self._rendered.clear()
+
+
+email_renderer = EmailRenderer()
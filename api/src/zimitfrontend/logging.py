@@ -1,8 +1,166 @@
+import atexit
+import copy
+import datetime
+import json
 import logging
+import queue
 import sys
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
 from typing import IO
 
-DEFAULT_FORMAT = "%(levelname)s: %(message)s"
+DEFAULT_FORMAT = "%(levelname)s: %(request_id_prefix)s%(message)s"
+
+# id of the HTTP request being handled, propagated to tasks it starts
+request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+
+class RequestIdFilter(logging.Filter):
+    """Add id of current request to log records, as `request_id_prefix`"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        current_request_id = request_id.get()
+        record.request_id = current_request_id
+        record.request_id_prefix = (
+            f"[{current_request_id}] " if current_request_id else ""
+        )
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Let at most `rate` records of a given message through every `interval` seconds
+
+    Records are grouped by logger, call site and unformatted message, so messages
+    logged with %-style arguments (e.g. same warning for various tasks) are limited
+    together. Number of records suppressed is appended to the first one let through
+    afterwards.
+    """
+
+    # number of messages tracked, above which least recently logged are forgotten
+    max_tracked = 1000
+
+    def __init__(self, rate: int, interval: float):
+        super().__init__()
+        self.rate = rate
+        self.interval = interval
+        # start of current window, records let through and suppressed, by message,
+        # least recently logged first
+        self._windows: OrderedDict[tuple[str, str, int, str], list[float]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        now = time.monotonic()
+        key = (record.name, record.pathname, record.lineno, str(record.msg))
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                previously_suppressed = int(window[2]) if window else 0
+                self._windows[key] = [now, 1, 0]
+                self._windows.move_to_end(key)
+                if len(self._windows) > self.max_tracked:
+                    self._windows.popitem(last=False)
+            else:
+                self._windows.move_to_end(key)
+                if window[1] < self.rate:
+                    window[1] += 1
+                    return True
+                window[2] += 1
+                self.suppressed += 1
+                return False
+        if previously_suppressed:
+            record.msg = (
+                f"{record.getMessage()} ({previously_suppressed} similar "
+                "message(s) suppressed)"
+            )
+            record.args = None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as JSON objects, one per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.datetime.fromtimestamp(
+                record.created, tz=datetime.UTC
+            ).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if request_id := getattr(record, "request_id", None):
+            entry["request_id"] = request_id
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hand records over to a bounded queue, drained by a listener thread
+
+    Records are dropped instead of blocking the caller when the queue is full, e.g.
+    when output cannot keep up; a warning with the number of records dropped is
+    queued once there is room again.
+    """
+
+    def __init__(self, records: "queue.Queue[logging.LogRecord]"):
+        super().__init__(records)
+        self.dropped = 0
+        self._unreported = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # merge arguments and exception now, they may change or not be usable from
+        # the listener thread, but leave formatting to the listener handlers
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(
+                record.exc_info
+            )
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                self._unreported += 1
+            return
+        if self._unreported:
+            with self._lock:
+                unreported, self._unreported = self._unreported, 0
+            try:
+                self.queue.put_nowait(
+                    logging.makeLogRecord(
+                        {
+                            "name": record.name,
+                            "levelno": logging.WARNING,
+                            "levelname": logging.getLevelName(logging.WARNING),
+                            "msg": f"{unreported} log record(s) dropped, "
+                            "log queue was full",
+                            "request_id_prefix": "",
+                        }
+                    )
+                )
+            except queue.Full:
+                with self._lock:
+                    self._unreported += unreported
+
+
 VERBOSE_DEPENDENCIES = ["urllib3", "PIL", "boto3", "botocore", "s3transfer"]
 
 
@@ -13,6 +171,11 @@ def get_logger(
     log_format: str | None = DEFAULT_FORMAT,
     deps_level: int | str = logging.WARNING,
     additional_verbose_deps: list[str] | None = None,
+    *,
+    json_output: bool = False,
+    queue_size: int = 0,
+    rate_limit: int = 0,
+    rate_interval: float = 60,
 ):
     """configured logger for most usages
 
@@ -22,7 +185,12 @@ def get_logger(
     - console: sys.stdout | sys.stderr | any other IO[str]
     - deps_level: log level for idendified verbose dependencies
     - additional_deps: additional modules names of verbose dependencies
-        to assign deps_level to"""
+        to assign deps_level to
+    - json_output: output records as JSON objects instead of log_format
+    - queue_size: hand records over to a background thread through a queue of this
+        size, dropping records when it is full ; 0 writes synchronously
+    - rate_limit: max number of records of a given message per rate_interval
+        (in seconds) ; 0 disables rate limiting"""
 
     if additional_verbose_deps is None:  # pragma: no branch
         additional_verbose_deps = []
@@ -37,8 +205,22 @@ def get_logger(
 
     # setup console logging
     console_handler = logging.StreamHandler(console)
-    console_handler.setFormatter(logging.Formatter(log_format))
+    console_handler.setFormatter(
+        JsonFormatter() if json_output else logging.Formatter(log_format)
+    )
     console_handler.setLevel(level)
-    logger.addHandler(console_handler)
+
+    # filters run on the logging thread, where request id is known
+    handler: logging.Handler = console_handler
+    if queue_size > 0:
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+        handler.setLevel(level)
+        listener = QueueListener(handler.queue, console_handler)
+        listener.start()
+        atexit.register(listener.stop)
+    handler.addFilter(RequestIdFilter())
+    if rate_limit > 0:
+        handler.addFilter(RateLimitFilter(rate_limit, rate_interval))
+    logger.addHandler(handler)
 
     return logger
@@ -0,0 +1,283 @@
+import asyncio
+import json
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+import httpx
+from pydantic import BaseModel
+
+from zimitfrontend.constants import ApiConfiguration, logger
+from zimitfrontend.metrics import CallbackCounter, Gauge, Histogram
+
+# client with a pool of keep-alive connections to Mailgun, one per worker
+mailgun_client = httpx.AsyncClient(
+    timeout=ApiConfiguration.mailgun_requests_timeout,
+    limits=httpx.Limits(
+        max_connections=ApiConfiguration.mail_workers,
+        max_keepalive_connections=ApiConfiguration.mail_workers,
+    ),
+)
+
+
+class MailJob(BaseModel):
+    to: str
+    subject: str
+    body: str
+    # number of attempts to send it so far
+    attempts: int = 0
+    # error of last attempt, if any
+    error: str | None = None
+
+
+class MailerMetrics(BaseModel):
+    # mails accepted in queue
+    enqueued: int = 0
+    # mails rejected because queue is full
+    rejected: int = 0
+    # mails sent
+    sent: int = 0
+    # mails not sent because Mailgun is not configured
+    skipped: int = 0
+    # Mailgun calls made to send mails, i.e. batches of identical mails
+    batches: int = 0
+    # failed attempts which have been retried
+    retried: int = 0
+    # mails given up on after too many attempts, moved to dead letters
+    failed: int = 0
+
+
+class RateLimiter:
+    """Spread messages so that no more than `rate` are sent per second
+
+    Each call reserves its slot before waiting, so concurrent callers are served in
+    order without a lock. A rate of 0 disables limiting.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next_at = 0.0
+
+    async def acquire(self, nb_messages: int = 1):
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        start_at = max(now, self._next_at)
+        self._next_at = start_at + nb_messages / self.rate
+        if start_at > now:
+            await asyncio.sleep(start_at - now)
+
+
+rate_limiter = RateLimiter(ApiConfiguration.mailgun_rate_limit)
+
+mailgun_request_duration = Histogram(
+    "mailgun_request_duration_seconds",
+    "Duration of Mailgun calls sending a batch of mails, by status",
+    ("status",),
+)
+
+
+async def send_via_mailgun(jobs: list[MailJob]) -> str | None:
+    """Send identical mails to their recipients in one call, return Mailgun id"""
+    if not ApiConfiguration.mailgun_api_url or not ApiConfiguration.mailgun_api_key:
+        logger.warning("Email not sent, Mailgun is not properly configured")
+        return
+
+    data: dict[str, Any] = {
+        "from": ApiConfiguration.mailgun_from,
+        "subject": jobs[0].subject,
+        "html": jobs[0].body,
+        "to": [job.to for job in jobs],
+    }
+    if len(jobs) > 1:
+        # with recipient variables, each recipient gets its own message instead of
+        # one message listing all of them
+        data["recipient-variables"] = json.dumps({job.to: {} for job in jobs})
+    await rate_limiter.acquire(len(jobs))
+    started_on = time.perf_counter()
+    status = "error"
+    try:
+        resp = await mailgun_client.post(
+            f"{ApiConfiguration.mailgun_api_url}/messages",
+            auth=("api", ApiConfiguration.mailgun_api_key),
+            data=data,
+        )
+        status = str(resp.status_code)
+    finally:
+        mailgun_request_duration.observe(
+            time.perf_counter() - started_on, status=status
+        )
+    resp.raise_for_status()
+    return resp.json().get("id") or resp.text
+
+
+class Mailer:
+    """Queue of mails to send, drained in background by a pool of workers
+
+    Identical mails (e.g. same task notification to several subscribers) waiting in
+    queue are grouped in a batch sent at once. Mails which could not be sent after
+    all attempts are kept in dead letters.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[list[MailJob]], Awaitable[Any]] = send_via_mailgun,
+    ):
+        self.send = send
+        self.queue: asyncio.Queue[list[MailJob]] = asyncio.Queue()
+        # batches still waiting in queue, by subject and body
+        self._batches: dict[tuple[str, str], list[MailJob]] = {}
+        self._depth = 0
+        self.dead_letters: deque[MailJob] = deque(
+            maxlen=ApiConfiguration.mail_dead_letters_size
+        )
+        self.metrics = MailerMetrics()
+        self._workers: list[asyncio.Task[None]] = []
+        # batches waiting to be put back in queue for a retry
+        self._retries: set[asyncio.TimerHandle] = set()
+
+    @property
+    def depth(self) -> int:
+        """Number of mails waiting to be sent"""
+        return self._depth
+
+    def enqueue(self, job: MailJob) -> bool:
+        """Add a mail to send, return whether it has been accepted"""
+        if self._depth >= ApiConfiguration.mail_queue_size:
+            logger.error("Mail queue is full, mail to %s not sent", job.to)
+            self.metrics.rejected += 1
+            self.dead_letters.append(job.model_copy(update={"error": "Queue full"}))
+            return False
+        self.metrics.enqueued += 1
+        key = (job.subject, job.body)
+        batch = self._batches.get(key)
+        if batch is not None and len(batch) < ApiConfiguration.mail_batch_size:
+            # same mail already waiting for this recipient is not sent twice
+            if all(queued.to != job.to for queued in batch):
+                batch.append(job)
+                self._depth += 1
+            return True
+        self._batches[key] = [job]
+        self._depth += 1
+        self.queue.put_nowait(self._batches[key])
+        return True
+
+    def _take(self, batch: list[MailJob]):
+        """Remove a batch picked by a worker from those still waiting"""
+        key = (batch[0].subject, batch[0].body)
+        if self._batches.get(key) is batch:
+            del self._batches[key]
+        self._depth -= len(batch)
+
+    async def _process(self, batch: list[MailJob]) -> float | None:
+        """Try to send a batch once, return delay before retrying it, if needed"""
+        for job in batch:
+            job.attempts += 1
+        attempts = batch[0].attempts
+        try:
+            resp = await self.send(batch)
+        except Exception as exc:
+            for job in batch:
+                job.error = str(exc)
+            if attempts >= ApiConfiguration.mail_max_attempts:
+                logger.error(
+                    "Failed to send mail to %s recipient(s) after %s attempts: %s",
+                    len(batch),
+                    attempts,
+                    exc,
+                )
+                self.metrics.failed += len(batch)
+                self.dead_letters.extend(batch)
+                return
+            logger.warning(
+                "Failed to send mail to %s recipient(s), retrying (%s/%s): %s",
+                len(batch),
+                attempts,
+                ApiConfiguration.mail_max_attempts,
+                exc,
+            )
+            self.metrics.retried += len(batch)
+            return ApiConfiguration.mail_retry_backoff * 2 ** (attempts - 1)
+        if resp is None:
+            self.metrics.skipped += len(batch)
+            return
+        logger.info("Mailgun notif sent to %s recipient(s): %s", len(batch), resp)
+        self.metrics.sent += len(batch)
+        self.metrics.batches += 1
+
+    def _retry_later(self, batch: list[MailJob], delay: float):
+        """Put a batch back in queue once its retry is due
+
+        Batch is only marked done once back in queue, so that it is still waited for
+        on shutdown, while workers keep sending other mails in the meantime.
+        """
+        self._depth += len(batch)
+
+        def requeue():
+            self._retries.discard(handle)
+            self.queue.put_nowait(batch)
+            self.queue.task_done()
+
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retries.add(handle)
+
+    async def _work(self):
+        while True:
+            batch = await self.queue.get()
+            self._take(batch)
+            retry_in = None
+            try:
+                retry_in = await self._process(batch)
+            except Exception as exc:
+                logger.error("Unexpected error sending mail: %s", exc, exc_info=exc)
+            finally:
+                if retry_in is None:
+                    self.queue.task_done()
+                else:
+                    self._retry_later(batch, retry_in)
+
+    def start(self):
+        """Start pool of workers draining the queue"""
+        # queue is bound to the event loop it is first awaited in, mails queued
+        # before start are moved to a new queue bound to the current loop
+        queue, self.queue = self.queue, asyncio.Queue()
+        while not queue.empty():
+            self.queue.put_nowait(queue.get_nowait())
+        self._workers = [
+            asyncio.create_task(self._work())
+            for _ in range(ApiConfiguration.mail_workers)
+        ]
+
+    async def stop(self, timeout: float):
+        """Let workers drain the queue, up to timeout, then stop them"""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+        except TimeoutError:
+            logger.warning("%s mail(s) left in queue on shutdown", self.depth)
+        for handle in self._retries:
+            handle.cancel()
+        self._retries.clear()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+mailer = Mailer()
+
+Gauge("mail_queue_depth", "Mails waiting to be sent", function=lambda: mailer.depth)
+for _field, _documentation in (
+    ("enqueued", "Mails accepted in queue"),
+    ("rejected", "Mails rejected because queue was full"),
+    ("sent", "Mails sent"),
+    ("skipped", "Mails not sent because Mailgun is not configured"),
+    ("batches", "Mailgun calls made to send batches of identical mails"),
+    ("retried", "Failed mail sends which have been retried"),
+    ("failed", "Mails given up on after too many attempts"),
+):
+    CallbackCounter(
+        f"mails_{_field}_total",
+        _documentation,
+        function=lambda field=_field: getattr(mailer.metrics, field),
+    )
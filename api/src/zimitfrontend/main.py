@@ -1,3 +1,6 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from http import HTTPStatus
 
 from fastapi import FastAPI
@@ -6,9 +9,48 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, RedirectResponse
 from starlette.requests import Request
 
-from zimitfrontend import __about__
+from zimitfrontend import __about__, recipes, task_watchers, url_check, zimfarm
+from zimitfrontend.blacklist import blacklist_manager
 from zimitfrontend.constants import ApiConfiguration, logger
-from zimitfrontend.routes import hook, offliners, requests, tracker
+from zimitfrontend.mailer import mailer, mailgun_client
+from zimitfrontend.routes import hook, metrics, offliners, requests
+from zimitfrontend.routes import tracker as tracker_routes
+from zimitfrontend.tracing import REQUEST_ID_HEADER, TracingMiddleware
+from zimitfrontend.tracker import tracker
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    try:
+        await blacklist_manager.reload()
+    except Exception as exc:
+        # bundled blacklist is used until location can be loaded
+        logger.error(
+            f"Failed to load blacklist from {blacklist_manager.location}: {exc}"
+        )
+    version = ApiConfiguration.zimit_definition_version
+    try:
+        await offliners.refresh_offliner_definition(version)
+    except Exception as exc:
+        # will be retried on first request
+        logger.error(f"Failed to load offliner definition {version}: {exc}")
+    mailer.start()
+    background_tasks = [
+        asyncio.create_task(offliners.revalidate_offliner_definition(version)),
+        asyncio.create_task(tracker.reconcile_periodically()),
+        asyncio.create_task(blacklist_manager.reload_periodically()),
+        asyncio.create_task(recipes.sweep_periodically()),
+    ]
+    yield
+    await task_watchers.stop_watchers()
+    await mailer.stop(ApiConfiguration.mail_shutdown_timeout)
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await recipes.wait_pending_deletions(ApiConfiguration.zimfarm_requests_timeout)
+    await zimfarm.http_client.aclose()
+    await url_check.probe_client.aclose()
+    await mailgun_client.aclose()
 
 
 class Main:
@@ -17,6 +59,7 @@ class Main:
             title=__about__.__api_title__,
             description=__about__.__api_description__,
             version=__about__.__version__,
+            lifespan=lifespan,
         )
 
         @self.app.get("/api")
@@ -68,13 +111,22 @@ class Main:
             allow_credentials=False,
             allow_methods=["*"],
             allow_headers=["*"],
+            # let UI revalidate task details with If-None-Match, and report
+            # request ids
+            expose_headers=["ETag", REQUEST_ID_HEADER],
         )
+        if ApiConfiguration.metrics_enabled:
+            api.add_middleware(metrics.RequestMetricsMiddleware)
+        api.add_middleware(TracingMiddleware)
 
         api.include_router(router=requests.router)
         api.include_router(router=hook.router)
-        api.include_router(router=tracker.router)
+        api.include_router(router=tracker_routes.router)
         api.include_router(router=offliners.router)
 
+        if ApiConfiguration.metrics_enabled:
+            # at root, where Prometheus expects it
+            self.app.include_router(router=metrics.router)
         self.app.mount(f"/api/{__about__.__api_version__}", api)
 
         return self.app
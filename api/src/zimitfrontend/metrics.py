@@ -0,0 +1,212 @@
+import math
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+# default histogram buckets, in seconds, suited for HTTP calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+LabelValues = tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues) -> str:
+    if not names:
+        return ""
+    labels = ",".join(
+        '{}="{}"'.format(
+            name,
+            value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in zip(names, values, strict=True)
+    )
+    return f"{{{labels}}}"
+
+
+class Metric(ABC):
+    """Metric exposed in Prometheus text format, with optional labels"""
+
+    type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        registry: "Registry | None" = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        (registry or default_registry).register(self)
+
+    def _label_values(self, labels: dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"Metric {self.name} expects labels {self.labelnames}, got {labels}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> Iterator[tuple[str, LabelValues, float]]:
+        """Suffix, label values and value of each sample"""
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for suffix, values, value in self.samples():
+            names = self.labelnames
+            if suffix == "_bucket":
+                names = (*names, "le")
+            lines.append(
+                f"{self.name}{suffix}{_format_labels(names, values)} "
+                f"{_format_value(value)}"
+            )
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        registry: "Registry | None" = None,
+    ):
+        super().__init__(name, documentation, labelnames, registry)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._label_values(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(self._label_values(labels), 0)
+
+    def samples(self) -> Iterator[tuple[str, LabelValues, float]]:
+        for key, value in sorted(self._values.items()):
+            yield "", key, value
+
+
+class Gauge(Metric):
+    """Gauge set explicitly, or read from a function when metrics are collected"""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        function: Callable[[], float] | None = None,
+        registry: "Registry | None" = None,
+    ):
+        super().__init__(name, documentation, labelnames, registry)
+        self._values: dict[LabelValues, float] = {}
+        self.function = function
+
+    def set(self, value: float, **labels: str):
+        self._values[self._label_values(labels)] = value
+
+    def samples(self) -> Iterator[tuple[str, LabelValues, float]]:
+        if self.function:
+            yield "", (), self.function()
+            return
+        for key, value in sorted(self._values.items()):
+            yield "", key, value
+
+
+class CallbackCounter(Metric):
+    """Counter maintained elsewhere, read from a function when metrics are collected"""
+
+    type = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        function: Callable[[], float],
+        registry: "Registry | None" = None,
+    ):
+        super().__init__(name, documentation, registry=registry)
+        self.function = function
+
+    def samples(self) -> Iterator[tuple[str, LabelValues, float]]:
+        yield "", (), self.function()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        registry: "Registry | None" = None,
+    ):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = (*sorted(buckets), math.inf)
+        # count of observations in each bucket (not cumulative), sum and count
+        self._values: dict[LabelValues, tuple[list[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._label_values(labels)
+        counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0, 0)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe duration of the block, in seconds, even if it raises"""
+        started_on = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_on, **labels)
+
+    def get_count(self, **labels: str) -> int:
+        entry = self._values.get(self._label_values(labels))
+        return entry[2] if entry else 0
+
+    def samples(self) -> Iterator[tuple[str, LabelValues, float]]:
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts, strict=True):
+                cumulative += bucket_count
+                yield "_bucket", (*key, _format_value(bound)), cumulative
+            yield "_sum", key, total
+            yield "_count", key, count
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """All metrics, in Prometheus text exposition format"""
+        return "".join(f"{metric.render()}\n" for metric in self.metrics.values())
+
+
+default_registry = Registry()
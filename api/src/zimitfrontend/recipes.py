@@ -0,0 +1,247 @@
+import asyncio
+import re
+import sqlite3
+import time
+from http import HTTPStatus
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from zimitfrontend.constants import ApiConfiguration, logger
+from zimitfrontend.metrics import CallbackCounter, Gauge
+from zimitfrontend.zimfarm import DELETE, GET, query_api
+
+# name of recipes created by create_task: `{prefix}{hostname}_{ident}`
+RECIPE_NAME_PATTERN = re.compile(
+    rf"^{re.escape(ApiConfiguration.recipe_name_prefix)}.+_[0-9a-f]{{8}}$"
+)
+# number of recipes retrieved per call when listing Zimfarm recipes
+RECIPES_PAGE_SIZE = 200
+
+
+class RecipeJournal:
+    """Names of recipes created on the Zimfarm and not known to be deleted yet
+
+    Journal is kept in a SQLite database, so that recipes left behind by a crash
+    are not forgotten when it is persisted on disk. Otherwise, those are only found
+    back by sweeps thanks to their name.
+    """
+
+    def __init__(self, path: Path | str):
+        self.path = path
+        # journal is created on import, but used from the event loop thread
+        self._connection = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS recipe "
+            "(name TEXT PRIMARY KEY, recorded_on REAL NOT NULL)"
+        )
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM recipe").fetchone()[0]
+
+    def __contains__(self, name: str) -> bool:
+        return (
+            self._connection.execute(
+                "SELECT 1 FROM recipe WHERE name = ?", (name,)
+            ).fetchone()
+            is not None
+        )
+
+    def record(self, name: str, recorded_on: float | None = None):
+        """Record a recipe, keeping first record time if already recorded"""
+        self._connection.execute(
+            "INSERT OR IGNORE INTO recipe (name, recorded_on) VALUES (?, ?)",
+            (name, time.time() if recorded_on is None else recorded_on),
+        )
+
+    def remove(self, name: str):
+        self._connection.execute("DELETE FROM recipe WHERE name = ?", (name,))
+
+    def get_recorded_before(self, timestamp: float) -> list[str]:
+        return [
+            name
+            for (name,) in self._connection.execute(
+                "SELECT name FROM recipe WHERE recorded_on < ? ORDER BY recorded_on",
+                (timestamp,),
+            )
+        ]
+
+
+class JanitorMetrics(BaseModel):
+    # recipes recorded in journal, i.e. created by us or found left behind
+    recipes_recorded: int = 0
+    # recipes deleted from the Zimfarm
+    recipes_deleted: int = 0
+    # recipes which could not be deleted, even after retries
+    recipes_delete_failures: int = 0
+    # recipes deleted by sweeps, i.e. which had been left behind
+    recipes_reclaimed: int = 0
+    # sweeps completed
+    sweeps: int = 0
+
+
+journal = RecipeJournal(ApiConfiguration.recipe_journal_path)
+metrics = JanitorMetrics()
+
+for _field, _documentation in (
+    ("recipes_recorded", "Recipes recorded in journal, created or found left behind"),
+    ("recipes_deleted", "Recipes deleted from the Zimfarm"),
+    ("recipes_delete_failures", "Recipes which could not be deleted after retries"),
+    ("recipes_reclaimed", "Recipes left behind deleted by sweeps"),
+    ("sweeps", "Sweeps of recipes left behind completed"),
+):
+    CallbackCounter(
+        f"janitor_{_field}_total",
+        _documentation,
+        function=lambda field=_field: getattr(metrics, field),
+    )
+Gauge(
+    "janitor_recipes_pending",
+    "Recipes recorded in journal and not known to be deleted yet",
+    function=lambda: len(journal),
+)
+
+# recipe deletions running in background, kept referenced until they complete
+pending_deletions: dict[str, asyncio.Task[bool]] = {}
+
+
+def record_recipe(recipe_name: str):
+    """Record a recipe about to be created, so that it gets deleted in any case"""
+    journal.record(recipe_name)
+    metrics.recipes_recorded += 1
+
+
+def forget_recipe(recipe_name: str):
+    """Forget a recorded recipe, e.g. because the Zimfarm refused to create it"""
+    journal.remove(recipe_name)
+
+
+async def delete_recipe(recipe_name: str) -> bool:
+    """Delete a recipe from the Zimfarm, retrying with backoff on failure
+
+    Returns whether recipe is gone from the Zimfarm.
+    """
+    attempt = 1
+    while True:
+        success, status, resp = await query_api(DELETE, f"/recipes/{recipe_name}")
+        if success or status == HTTPStatus.NOT_FOUND:
+            journal.remove(recipe_name)
+            metrics.recipes_deleted += 1
+            return True
+        if attempt >= ApiConfiguration.recipe_delete_max_attempts:
+            logger.error(
+                "Unable to remove recipe %s via HTTP %s after %s attempts: %s",
+                recipe_name,
+                status,
+                attempt,
+                resp,
+            )
+            # still in journal, will be retried on next sweep
+            metrics.recipes_delete_failures += 1
+            return False
+        logger.warning(
+            "Unable to remove recipe %s via HTTP %s, retrying (%s/%s): %s",
+            recipe_name,
+            status,
+            attempt,
+            ApiConfiguration.recipe_delete_max_attempts,
+            resp,
+        )
+        await asyncio.sleep(
+            ApiConfiguration.recipe_delete_retry_backoff * 2 ** (attempt - 1)
+        )
+        attempt += 1
+
+
+def schedule_recipe_deletion(recipe_name: str) -> asyncio.Task[bool]:
+    """Delete a recipe in background, e.g. once it is not needed anymore"""
+    if task := pending_deletions.get(recipe_name):
+        return task
+    task = asyncio.create_task(delete_recipe(recipe_name))
+    pending_deletions[recipe_name] = task
+    task.add_done_callback(lambda _: pending_deletions.pop(recipe_name, None))
+    return task
+
+
+async def wait_pending_deletions(timeout: float):
+    """Let background recipe deletions complete, up to timeout (e.g. on shutdown)"""
+    if not pending_deletions:
+        return
+    _, pending = await asyncio.wait(list(pending_deletions.values()), timeout=timeout)
+    if not pending:
+        return
+    recipe_names = sorted(
+        name for name, task in pending_deletions.items() if task in pending
+    )
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    logger.warning(
+        "%s recipe(s) left on the Zimfarm: %s",
+        len(recipe_names),
+        ", ".join(recipe_names),
+    )
+
+
+async def _record_left_behind_recipes():
+    """Record Zimfarm recipes named like ours but unknown to the journal
+
+    Those have been left behind by another process, or before journal was lost.
+    """
+    skip = 0
+    while True:
+        success, status, resp = await query_api(
+            GET, "/recipes", params={"skip": skip, "limit": RECIPES_PAGE_SIZE}
+        )
+        if not success:
+            logger.warning("Unable to list recipes via HTTP %s: %s", status, resp)
+            return
+        items = resp.get("items", [])
+        for item in items:
+            name = item.get("name", "")
+            if RECIPE_NAME_PATTERN.match(name) and name not in journal:
+                # recipe might be in the making, only delete it once old enough
+                record_recipe(name)
+        skip += len(items)
+        if not items or skip >= resp.get("meta", {}).get("count", 0):
+            return
+
+
+async def sweep():
+    """Delete recipes recorded for longer than max age, i.e. left behind"""
+    await _record_left_behind_recipes()
+    recipe_names = [
+        name
+        for name in journal.get_recorded_before(
+            time.time() - ApiConfiguration.recipe_max_age
+        )
+        if name not in pending_deletions
+    ]
+    semaphore = asyncio.Semaphore(ApiConfiguration.recipe_sweep_concurrency)
+
+    async def reclaim(recipe_name: str) -> bool:
+        async with semaphore:
+            return await delete_recipe(recipe_name)
+
+    results = await asyncio.gather(*[reclaim(name) for name in recipe_names])
+    nb_reclaimed = sum(results)
+    metrics.recipes_reclaimed += nb_reclaimed
+    metrics.sweeps += 1
+    if recipe_names:
+        logger.info(
+            "Recipes sweep reclaimed %s recipe(s) out of %s left behind",
+            nb_reclaimed,
+            len(recipe_names),
+        )
+
+
+async def sweep_periodically():
+    """Sweep recipes left behind in background, forever"""
+    while True:
+        try:
+            await sweep()
+        except Exception as exc:
+            logger.error("Failed to sweep recipes: %s", exc, exc_info=exc)
+        await asyncio.sleep(ApiConfiguration.recipe_sweep_interval)
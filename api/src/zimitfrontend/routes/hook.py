@@ -2,10 +2,13 @@ from typing import Annotated
 
 from fastapi import APIRouter, Query
 
-from zimitfrontend.constants import logger
+from zimitfrontend.constants import ApiConfiguration
+from zimitfrontend.dedup import pop_subscribers
 from zimitfrontend.routes.schemas import HookStatus, ZimfarmTask
-from zimitfrontend.routes.utils import SUCCESS, process_zimfarm_hook_call
-from zimitfrontend.utils import send_email_via_mailgun
+from zimitfrontend.routes.utils import SUCCESS, notify_task
+from zimitfrontend.task_watchers import wakeup_watcher
+from zimitfrontend.tasks import update_task_cache
+from zimitfrontend.tracker import ONGOING_TASK_STATUSES, tracker
 
 router = APIRouter(
     prefix="/requests/hook",
@@ -22,26 +25,24 @@ router = APIRouter(
         },
     },
 )
-def webhook(
+async def webhook(
     token: Annotated[str | None, Query()] = None,
     target: Annotated[str | None, Query()] = None,
     lang: Annotated[str, Query()] = "en",
     task: ZimfarmTask | None = None,
 ) -> HookStatus:
 
-    result = process_zimfarm_hook_call(token, target, lang, task)
-    if (
-        result.hook_response_status == SUCCESS
-        and result.mail_target
-        and result.mail_subject
-        and result.mail_body
-    ):
-        try:
-            resp = send_email_via_mailgun(
-                result.mail_target, result.mail_subject, result.mail_body
-            )
-            if resp:
-                logger.info(f"Mailgun notif sent: {resp}")
-        except Exception as exc:
-            logger.error(f"Failed to send mailgun notif: {exc}", exc_info=exc)
-    return result.hook_response_status
+    if token == ApiConfiguration.hook_token and task:
+        # let the tracker and task cache know right away that task has completed
+        if task.status not in ONGOING_TASK_STATUSES:
+            await tracker.remove_task(task.id)
+            update_task_cache(task.model_dump(by_alias=True))
+            wakeup_watcher(task.id)
+            # notify clients which have been attached to this task as well
+            for subscriber in pop_subscribers(task.id):
+                notify_task(token, subscriber.email, subscriber.lang, task.model_copy())
+        # hooks without target are only registered to track task completion
+        if not target:
+            return SUCCESS
+
+    return notify_task(token, target, lang, task)
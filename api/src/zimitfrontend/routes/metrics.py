@@ -0,0 +1,97 @@
+import time
+from http import HTTPStatus
+
+from fastapi import APIRouter, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from zimitfrontend.constants import logger
+from zimitfrontend.logging import RateLimitFilter
+from zimitfrontend.metrics import CallbackCounter, Histogram, default_registry
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["all"],
+)
+
+request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Duration of HTTP requests handled, until response headers, by route template",
+    ("method", "route", "status"),
+)
+
+CallbackCounter(
+    "log_records_dropped_total",
+    "Log records dropped because log queue was full",
+    function=lambda: sum(getattr(handler, "dropped", 0) for handler in logger.handlers),
+)
+CallbackCounter(
+    "log_records_suppressed_total",
+    "Log records suppressed by rate limiting",
+    function=lambda: sum(
+        log_filter.suppressed
+        for handler in logger.handlers
+        for log_filter in handler.filters
+        if isinstance(log_filter, RateLimitFilter)
+    ),
+)
+
+
+class RequestMetricsMiddleware:
+    """Observe duration of each HTTP request, labelled by its route template"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started_on = time.perf_counter()
+        response_started = False
+
+        def observe(status: int):
+            request_duration.observe(
+                time.perf_counter() - started_on,
+                method=scope["method"],
+                route=_get_route_template(scope),
+                status=str(status),
+            )
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                # streamed responses (e.g. events) last as long as the client wants
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            if not response_started:
+                observe(HTTPStatus.INTERNAL_SERVER_ERROR)
+            raise
+
+
+def _get_route_template(scope: Scope) -> str:
+    # route is only known once request has been routed
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+@router.get(
+    "",
+    status_code=HTTPStatus.OK,
+    responses={
+        HTTPStatus.OK: {
+            "description": "Metrics in Prometheus text exposition format",
+            "content": {"text/plain": {}},
+        },
+    },
+)
+async def get_metrics() -> Response:
+    return Response(
+        content=default_registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
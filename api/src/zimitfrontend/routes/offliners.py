@@ -1,10 +1,15 @@
+import asyncio
+import math
 from http import HTTPStatus
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
+from pydantic import BaseModel
 
-from zimitfrontend.constants import ApiConfiguration
+from zimitfrontend.cache import TTLCache
+from zimitfrontend.constants import ApiConfiguration, logger
 from zimitfrontend.routes.schemas import OfflinerDefinitionSchema
-from zimitfrontend.zimfarm import query_api
+from zimitfrontend.routes.utils import compute_etag, etag_matches
+from zimitfrontend.zimfarm import GET, query_api
 
 router = APIRouter(
     prefix="/offliner-definition",
@@ -12,28 +17,87 @@ router = APIRouter(
 )
 
 
+class CachedOfflinerDefinition(BaseModel):
+    # validated definition, serialized once for all
+    body: bytes
+    etag: str
+
+
+# definition is fixed for a given version, there is no reason to expire it
+offliner_definitions: TTLCache[str, CachedOfflinerDefinition] = TTLCache(maxsize=10)
+
+
+async def fetch_offliner_definition(version: str) -> CachedOfflinerDefinition:
+    _, status, schema = await query_api(GET, f"/offliners/zimit/{version}")
+    if status != HTTPStatus.OK:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail={
+                "error": (
+                    f"Failed to get offliner defintion on Zimfarm with HTTP {status}"
+                ),
+                "zimfarm_message": schema,
+            },
+        )
+    body = OfflinerDefinitionSchema.model_validate(schema).model_dump_json().encode()
+    return CachedOfflinerDefinition(body=body, etag=compute_etag(body))
+
+
+async def refresh_offliner_definition(version: str) -> None:
+    """Fetch definition from Zimfarm and replace the one in cache, if any"""
+    offliner_definitions.set(
+        version, await fetch_offliner_definition(version), ttl=math.inf
+    )
+
+
+async def revalidate_offliner_definition(version: str) -> None:
+    """Periodically refresh definition in background
+
+    Should the Zimfarm be unavailable, last known definition keeps being served.
+    """
+    while True:
+        await asyncio.sleep(ApiConfiguration.offliner_definition_refresh_interval)
+        try:
+            await refresh_offliner_definition(version)
+        except Exception as exc:
+            logger.warning(f"Failed to revalidate offliner definition {version}: {exc}")
+
+
+async def _load_offliner_definition(
+    version: str,
+) -> tuple[CachedOfflinerDefinition, float]:
+    return await fetch_offliner_definition(version), math.inf
+
+
 @router.get(
     "",
     summary="Get the definition for the zimit offliner",
     status_code=200,
+    response_model=OfflinerDefinitionSchema,
     responses={
         200: {
             "description": "Zimit offliner definition schema",
         },
+        304: {
+            "description": "Zimit offliner definition schema has not been modified",
+        },
     },
 )
-def get_offliner_definition() -> OfflinerDefinitionSchema:
-    _, status, schema = query_api(
-        "GET", f"/offliners/zimit/{ApiConfiguration.zimit_definition_version}"
+async def get_offliner_definition(request: Request) -> Response:
+    version = ApiConfiguration.zimit_definition_version
+    definition = await offliner_definitions.get_or_fetch(
+        version, lambda: _load_offliner_definition(version)
+    )
+    headers = {
+        "ETag": definition.etag,
+        "Cache-Control": (
+            f"public, max-age={int(ApiConfiguration.offliner_definition_max_age)}, "
+            "stale-while-revalidate="
+            f"{int(ApiConfiguration.offliner_definition_refresh_interval)}"
+        ),
+    }
+    if etag_matches(request, definition.etag):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    return Response(
+        content=definition.body, media_type="application/json", headers=headers
     )
-    if status != HTTPStatus.OK:
-        raise HTTPException(
-            status_code=HTTPStatus.BAD_REQUEST,
-            detail={
-                "error": (
-                    f"Failed to get offliner defintion on Zimfarm with HTTP {status}"
-                ),
-                "zimfarm_message": schema,
-            },
-        )
-    return OfflinerDefinitionSchema.model_validate(schema)
@@ -1,19 +1,51 @@
+import asyncio
+import json
 import urllib.parse
 import uuid
+from collections.abc import AsyncIterator
 from http import HTTPStatus
-from typing import Annotated
+from typing import Annotated, Any, cast
 
-from fastapi import APIRouter, HTTPException, Path, Request
+from fastapi import APIRouter, Header, HTTPException, Path, Request, Response
+from fastapi.responses import StreamingResponse
 
-from zimitfrontend.constants import ApiConfiguration, blacklist, logger
+from zimitfrontend import task_watchers
+from zimitfrontend.blacklist import blacklist_hits, blacklist_manager
+from zimitfrontend.cache import TTLCache
+from zimitfrontend.constants import ApiConfiguration, logger
+from zimitfrontend.dedup import (
+    OUTPUT_NAME_FLAGS,
+    Subscriber,
+    attach_client,
+    detach_client,
+    find_task,
+    get_task_fingerprint,
+    record_task,
+)
+from zimitfrontend.recipes import (
+    forget_recipe,
+    record_recipe,
+    schedule_recipe_deletion,
+)
 from zimitfrontend.routes.schemas import (
     TaskCancelRequest,
     TaskCreateRequest,
     TaskCreateResponse,
     TaskInfo,
+    UrlCheckRequest,
+    UrlCheckResponse,
+    ZimfarmTask,
+)
+from zimitfrontend.routes.utils import (
+    compute_etag,
+    etag_matches,
+    get_idempotency_key,
+    get_task_info,
+    notify_task,
 )
-from zimitfrontend.routes.utils import get_task_info
-from zimitfrontend.tracker import AddTaskStatus, tracker
+from zimitfrontend.tasks import get_task, task_cache
+from zimitfrontend.tracker import AddTaskResponse, AddTaskStatus, tracker
+from zimitfrontend.url_check import check_url
 from zimitfrontend.utils import normalize_hostname
 from zimitfrontend.zimfarm import query_api
 
@@ -22,24 +54,33 @@ router = APIRouter(
     tags=["all"],
 )
 
+# reply of task creations, by idempotency key, and key of each task created
+created_tasks: TTLCache[str, TaskCreateResponse] = TTLCache(
+    maxsize=ApiConfiguration.idempotency_cache_size
+)
+created_task_keys: TTLCache[str, str] = TTLCache(
+    maxsize=ApiConfiguration.idempotency_cache_size
+)
+
 
 @router.get(
     "/{task_id}",
     status_code=HTTPStatus.OK,
+    response_model=TaskInfo,
     responses={
         HTTPStatus.OK: {
             "description": "Returns the details about a given task",
         },
+        HTTPStatus.NOT_MODIFIED: {
+            "description": "Details about the task have not been modified",
+        },
     },
 )
-def task_info(
+async def task_info(
     task_id: Annotated[str, Path()],
-) -> TaskInfo:
-    # first try to find the task
-    _, status, task = query_api("GET", f"/tasks/{task_id}")
-    if status == HTTPStatus.NOT_FOUND:
-        # if it fails, try to find the requested task
-        _, status, task = query_api("GET", f"/requested-tasks/{task_id}")
+    request: Request,
+) -> Response:
+    status, task = await get_task(task_id)
     if status != HTTPStatus.OK:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
@@ -48,7 +89,55 @@ def task_info(
                 "zimfarm_message": task,
             },
         )
-    return get_task_info(task)
+    body = get_task_info(task).model_dump_json(by_alias=True).encode()
+    etag = compute_etag(body)
+    # let clients cache task details, but always revalidate them
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get(
+    "/{task_id}/events",
+    status_code=HTTPStatus.OK,
+    response_class=StreamingResponse,
+    responses={
+        HTTPStatus.OK: {
+            "description": "Stream of Server-Sent Events about a given task: `info` "
+            "with TaskInfo fields which changed, `upstream_error`, and `end` once "
+            "task has ended",
+            "content": {"text/event-stream": {}},
+        },
+    },
+)
+async def task_events(
+    task_id: Annotated[str, Path()],
+) -> StreamingResponse:
+    return StreamingResponse(
+        _stream_task_events(task_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _stream_task_events(task_id: str) -> AsyncIterator[str]:
+    queue = task_watchers.subscribe(task_id)
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    queue.get(), timeout=ApiConfiguration.task_events_keepalive
+                )
+            except TimeoutError:
+                # comment line, keeps connection open through proxies
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {event.name}\ndata: {json.dumps(event.data)}\n\n"
+            if event.name == "end":
+                return
+    finally:
+        task_watchers.unsubscribe(task_id, queue)
 
 
 @router.post(
@@ -60,54 +149,98 @@ def task_info(
         },
     },
 )
-def create_task(
-    request: TaskCreateRequest, http_request: Request
+async def create_task(
+    request: TaskCreateRequest,
+    http_request: Request,
+    idempotency_key: Annotated[str | None, Header()] = None,
 ) -> TaskCreateResponse:
     if not http_request.client:
         raise HTTPException(
             HTTPStatus.INTERNAL_SERVER_ERROR, detail="http_request.client is missing"
         )
+    client_host = http_request.client.host
 
-    # check that client can start a task
-    add_task = tracker.add_task(
-        http_request.client.host,
-        request.unique_id,
-        None,
+    # repeated submissions (double click, retry after a timeout, ...) get the reply
+    # of the first one, while in progress or once done, instead of a new task; only
+    # for identified clients, since reply of anonymous ones holds their new unique id
+    # which must not be given to others behind the same IP address (those repeated
+    # submissions are refused by the tracker anyway)
+    if not request.unique_id:
+        response, _ = await _create_task(request, client_host)
+        return response
+    key = get_idempotency_key(
+        unique_id=request.unique_id,
+        idempotency_key=idempotency_key,
+        url=request.url,
+        flags=request.flags,
+        email=request.email,
+        lang=request.lang,
     )
-    if add_task.status != AddTaskStatus.CAN_ADD_TASK:
+    response = await created_tasks.get_or_fetch(
+        key, lambda: _create_task(request, client_host)
+    )
+    created_task_keys.set(response.id, key, ttl=ApiConfiguration.idempotency_window)
+    return response
+
+
+def forget_created_task(task_id: str):
+    """Let a new task be created for the same request, e.g. once it is cancelled"""
+    if key := created_task_keys.get(task_id):
+        created_tasks.pop(key)
+        created_task_keys.pop(task_id)
+
+
+async def _create_task(
+    request: TaskCreateRequest, client_host: str
+) -> tuple[TaskCreateResponse, float]:
+    # check that client can start a task, and hold its slot while task is created
+    # so that concurrent requests (possibly on distinct workers) cannot pass too
+    reservation = await tracker.reserve_task(client_host, request.unique_id)
+    if reservation.status != AddTaskStatus.TASK_ADDED:
         raise HTTPException(
             status_code=HTTPStatus.TOO_MANY_REQUESTS,
             detail={
                 "message": "Too many requests already ongoing for your user",
-                "reason": add_task.status.value,
-                "ongoing_tasks": add_task.ongoing_tasks,
+                "reason": reservation.status.value,
+                "ongoing_tasks": reservation.ongoing_tasks,
             },
         )
 
+    try:
+        return await _create_reserved_task(request, client_host, reservation)
+    except BaseException:
+        await tracker.release_task(
+            cast(str, reservation.new_unique_id or request.unique_id),
+            cast(str, reservation.pending_task_id),
+        )
+        raise
+
+
+async def _create_reserved_task(
+    request: TaskCreateRequest, client_host: str, reservation: AddTaskResponse
+) -> tuple[TaskCreateResponse, float]:
     url = urllib.parse.urlparse(request.url)
 
-    matching_blacklist_entries = [
-        blacklist_entry
-        for blacklist_entry in blacklist
-        if blacklist_entry["host"].lower() in url.geturl().lower()
-    ]
-    matching_blacklist_entry = (
-        matching_blacklist_entries[0] if matching_blacklist_entries else None
-    )
-    if matching_blacklist_entry:
+    if blacklist_match := blacklist_manager.blacklist.match_url(request.url):
+        blacklist_hits.inc(source="create")
         raise HTTPException(
             HTTPStatus.BAD_REQUEST,
-            detail={"error": "blacklisted", "blacklist": matching_blacklist_entry},
+            detail={"error": "blacklisted", "blacklist": blacklist_match.entry},
         )
 
-    # generate recipe name
+    # generate recipe name, prefixed to be told apart from other Zimfarm recipes
     ident = str(uuid.uuid4())[:8]
-    recipe_name = f"{url.hostname}_{ident}"
+    recipe_name = f"{ApiConfiguration.recipe_name_prefix}{url.hostname}_{ident}"
+
+    # output names explicitly requested, if any, before defaults are set
+    output_flags = {
+        flag: request.flags[flag] for flag in OUTPUT_NAME_FLAGS if flag in request.flags
+    }
 
     # build zimit config
     flags = request.flags
     flags["seeds"] = normalize_hostname(request.url)
-    flags["name"] = flags.get("name", recipe_name)
+    flags["name"] = flags.get("name", f"{url.hostname}_{ident}")
     flags["zim-file"] = flags.get("zim-file", url.hostname) + f"_{ident}.zim"
     flags["userAgentSuffix"] = "zimit.kiwix.org+"
     flags["failOnFailedSeed"] = True
@@ -140,6 +273,14 @@ def create_task(
         time_limit = ApiConfiguration.zimit_time_limit
     flags["timeSoftLimit"] = _cap_limit(time_limit, ApiConfiguration.zimit_time_limit)
 
+    # identical request already made by someone else, no need to crawl it again
+    fingerprint = get_task_fingerprint(flags, output_flags)
+    if task := await find_task(fingerprint):
+        return (
+            await _attach_to_task(task, request, client_host, reservation),
+            ApiConfiguration.idempotency_window,
+        )
+
     config = {
         "warehouse_path": "/other",
         "image": {
@@ -170,14 +311,13 @@ def create_task(
         "version": ApiConfiguration.zimit_definition_version,
     }
 
-    # add notification callback if email supplied
+    # add notification callback, to send emails if email supplied and to update
+    # tracker and task cache as soon as the task ends in any case
+    webhook_url = (
+        f"{ApiConfiguration.callback_base_url}?token={ApiConfiguration.hook_token}"
+    )
     if request.email:
-        webhook_url = (
-            f"{ApiConfiguration.callback_base_url}?"
-            f"token={ApiConfiguration.hook_token}"
-            f"&target={request.email}"
-            f"&lang={request.lang}"
-        )
+        webhook_url += f"&target={request.email}&lang={request.lang}"
         payload.update(  # pyright: ignore[reportUnknownMemberType]
             {
                 "notification": {
@@ -186,28 +326,37 @@ def create_task(
                 }
             }
         )
+    else:
+        payload.update(  # pyright: ignore[reportUnknownMemberType]
+            {"notification": {"ended": {"webhook": [webhook_url]}}}
+        )
 
-    # create a unique recipe for that request on the zimfarm
-    success, status, resp = query_api(
+    # create a unique recipe for that request on the zimfarm, journaled beforehand
+    # so that it gets deleted even if we crash before deleting it
+    record_recipe(recipe_name)
+    success, status, resp = await query_api(
         "POST",
         "/recipes",
         payload=payload,  # pyright: ignore[reportUnknownArgumentType]
     )
     if not success:
-        logger.error(f"Unable to create recipe via HTTP {status}: {resp}")
+        logger.error("Unable to create recipe via HTTP %s: %s", status, resp)
         message = f"Unable to create recipe via HTTP {status}: {resp}"
         if status in [HTTPStatus.BAD_REQUEST, HTTPStatus.UNPROCESSABLE_ENTITY]:
             # if Zimfarm replied this is a bad request, then this is most probably
             # a bad request due to user input so we can track it like a bad request
+            forget_recipe(recipe_name)
             raise HTTPException(status_code=status, detail=message)
         else:
-            # otherwise, this is most probably an internal problem in our systems
+            # otherwise, this is most probably an internal problem in our systems,
+            # and recipe might have been created nonetheless (e.g. on timeout)
+            schedule_recipe_deletion(recipe_name)
             raise HTTPException(
                 status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail=message
             )
 
     # request a task for that newly created recipe
-    success, status, resp = query_api(
+    success, status, resp = await query_api(
         "POST",
         "/requested-tasks",
         payload={
@@ -215,8 +364,13 @@ def create_task(
             "worker": ApiConfiguration.task_worker,
         },
     )
+    # recipe is not needed anymore once task has been requested, and must not be
+    # left behind if it could not be requested; in both cases it is removed in
+    # background so that client does not wait for it
+    schedule_recipe_deletion(recipe_name)
+
     if not success:
-        logger.error(f"Unable to request {recipe_name} via HTTP {status}: {resp}")
+        logger.error("Unable to request %s via HTTP %s: %s", recipe_name, status, resp)
         raise HTTPException(
             status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
             detail=f"Unable to request recipe via HTTP {status}): {resp}",
@@ -234,23 +388,71 @@ def create_task(
             detail=f"Couldn't retrieve requested task id: {exc}",
         ) from exc
 
-    # remove newly created recipe (not needed anymore)
-    success, status, resp = query_api("DELETE", f"/recipes/{recipe_name}")
-    if not success:
-        logger.error(f"Unable to remove recipe {recipe_name} via HTTP {status}: {resp}")
+    client_id = cast(str, reservation.new_unique_id or request.unique_id)
+    await tracker.confirm_task(
+        client_host, client_id, cast(str, reservation.pending_task_id), task_id
+    )
+    record_task(fingerprint, task_id, client_id)
 
-    add_task = tracker.add_task(
-        http_request.client.host,
-        request.unique_id,
+    return (
+        TaskCreateResponse(id=task_id, new_unique_id=reservation.new_unique_id),
+        ApiConfiguration.idempotency_window,
+    )
+
+
+async def _attach_to_task(
+    task: Any,
+    request: TaskCreateRequest,
+    client_host: str,
+    reservation: AddTaskResponse,
+) -> TaskCreateResponse:
+    """Attach a request to the task of an identical one, ongoing or succeeded"""
+    task_id = task["id"]
+    client_id = cast(str, reservation.new_unique_id or request.unique_id)
+    pending_task_id = cast(str, reservation.pending_task_id)
+    if task["status"] == "succeeded":
+        await tracker.release_task(client_id, pending_task_id)
+        # nothing to wait for, ZIM is already available
+        if request.email:
+            notify_task(
+                ApiConfiguration.hook_token,
+                request.email,
+                request.lang,
+                ZimfarmTask.model_validate(task),
+            )
+        return TaskCreateResponse(id=task_id, new_unique_id=None)
+
+    await tracker.confirm_task(client_host, client_id, pending_task_id, task_id)
+    attach_client(
         task_id,
+        client_id,
+        (
+            Subscriber(client_id=client_id, email=request.email, lang=request.lang)
+            if request.email
+            else None
+        ),
     )
-    if add_task.status != AddTaskStatus.TASK_ADDED:
-        raise HTTPException(
-            status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
-            detail=f"Failed to store task in tracker: {add_task.status }",
-        )
+    logger.info("Request for %s attached to existing task %s", request.url, task_id)
+    return TaskCreateResponse(id=task_id, new_unique_id=reservation.new_unique_id)
+
 
-    return TaskCreateResponse(id=task_id, new_unique_id=add_task.new_unique_id)
+@router.post(
+    "/check",
+    status_code=HTTPStatus.OK,
+    responses={
+        HTTPStatus.OK: {
+            "description": "Checks whether a URL can be requested, before doing so",
+        },
+    },
+)
+async def check_task_url(request: UrlCheckRequest) -> UrlCheckResponse:
+    result = await check_url(request.url)
+    return UrlCheckResponse(
+        status=result.status.value,
+        url=result.url,
+        blacklist=result.blacklist,
+        reachable=result.reachable,
+    )
 
 
 @router.post(
@@ -261,7 +463,7 @@ def create_task(
         },
     },
 )
-def cancel_task(
+async def cancel_task(
     task_id: Annotated[str, Path()],
     task_cancel_request: TaskCancelRequest,
     http_request: Request,
@@ -271,7 +473,7 @@ def cancel_task(
             HTTPStatus.INTERNAL_SERVER_ERROR, detail="http_request.client is missing"
         )
 
-    status = tracker.add_task(
+    status = await tracker.add_task(
         http_request.client.host,
         task_cancel_request.unique_id,
         None,
@@ -282,10 +484,18 @@ def cancel_task(
             detail=f"task_id {task_id} is not associated with you",
         )
 
+    # task is shared with other clients, only this client gives up on it
+    if task_cancel_request.unique_id and detach_client(
+        task_id, task_cancel_request.unique_id
+    ):
+        await tracker.remove_client_task(task_cancel_request.unique_id, task_id)
+        forget_created_task(task_id)
+        return
+
     # search as requested task
-    _, status, task = query_api("GET", f"/requested-tasks/{task_id}")
+    _, status, task = await query_api("GET", f"/requested-tasks/{task_id}")
     if status == HTTPStatus.OK:
-        _, status, task = query_api("DELETE", f"/requested-tasks/{task_id}")
+        _, status, task = await query_api("DELETE", f"/requested-tasks/{task_id}")
         if status != HTTPStatus.OK:
             raise HTTPException(
                 status_code=HTTPStatus.BAD_REQUEST,
@@ -295,6 +505,10 @@ def cancel_task(
                     "zimfarm_message": task,
                 },
             )
+        task_cache.pop(task_id)
+        forget_created_task(task_id)
+        # requested task is gone, no need to wait for the tracker to notice it
+        await tracker.remove_task(task_id)
         return
     elif status != HTTPStatus.NOT_FOUND:
         raise HTTPException(
@@ -307,7 +521,7 @@ def cancel_task(
         )
 
     # search as running task
-    _, status, task = query_api("GET", f"/tasks/{task_id}")
+    _, status, task = await query_api("GET", f"/tasks/{task_id}")
     if status == HTTPStatus.OK:
         if task["status"] not in [
             "reserved",
@@ -321,7 +535,7 @@ def cancel_task(
                     "error": f"Cannot cancel task in '{task['status']}' status",
                 },
             )
-        _, status, task = query_api("POST", f"/tasks/{task_id}/cancel")
+        _, status, task = await query_api("POST", f"/tasks/{task_id}/cancel")
         if status != HTTPStatus.NO_CONTENT:
             raise HTTPException(
                 status_code=HTTPStatus.BAD_REQUEST,
@@ -330,6 +544,8 @@ def cancel_task(
                     "zimfarm_message": task,
                 },
             )
+        task_cache.pop(task_id)
+        forget_created_task(task_id)
         return
     else:
         raise HTTPException(
@@ -40,6 +40,17 @@ class TaskCreateResponse(CamelModel):
     new_unique_id: str | None
 
 
+class UrlCheckRequest(CamelModel):
+    url: str
+
+
+class UrlCheckResponse(CamelModel):
+    status: str
+    url: str
+    blacklist: dict[str, Any] | None
+    reachable: bool | None
+
+
 class TaskCancelRequest(CamelModel):
     unique_id: str | None
 
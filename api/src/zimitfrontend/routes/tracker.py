@@ -22,7 +22,7 @@ router = APIRouter(
         },
     },
 )
-def post_tracker_status(
+async def post_tracker_status(
     status_request: TrackerStatusRequest, http_request: Request
 ) -> TrackerStatusResponse:
 
@@ -31,7 +31,7 @@ def post_tracker_status(
             HTTPStatus.INTERNAL_SERVER_ERROR, detail="http_request.client is missing"
         )
 
-    tracker_status = tracker.add_task(
+    tracker_status = await tracker.add_task(
         http_request.client.host, status_request.unique_id, None
     )
     return TrackerStatusResponse(
@@ -1,7 +1,13 @@
+import hashlib
+import json
 from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+from starlette.requests import Request
 
 from zimitfrontend.constants import ApiConfiguration, logger
-from zimitfrontend.i18n import change_locale
+from zimitfrontend.emails import email_renderer
+from zimitfrontend.mailer import MailJob, mailer
 from zimitfrontend.routes.schemas import (
     HookProcessingResult,
     HookStatus,
@@ -9,12 +15,65 @@ from zimitfrontend.routes.schemas import (
     TaskInfoFlag,
     ZimfarmTask,
 )
-from zimitfrontend.utils import jinja_env
+from zimitfrontend.utils import normalize_hostname
 
 FAILED = HookStatus(status="failed")
 SUCCESS = HookStatus(status="success")
 
 
+def compute_etag(content: bytes) -> str:
+    """Strong HTTP entity tag of a response content"""
+    return f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether request If-None-Match header matches the current entity tag"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return any(
+        value.strip().removeprefix("W/") in (etag, "*")
+        for value in if_none_match.split(",")
+    )
+
+
+def get_idempotency_key(
+    unique_id: str,
+    idempotency_key: str | None,
+    url: str,
+    flags: dict[str, Any],
+    email: str | None,
+    lang: str,
+) -> str:
+    """Key identifying repetitions of the same task creation by a client
+
+    Idempotency key passed by client is used when present, otherwise key is derived
+    from what is requested.
+    """
+    if idempotency_key:
+        return hashlib.sha256(
+            json.dumps([unique_id, idempotency_key]).encode()
+        ).hexdigest()
+    return hashlib.sha256(
+        json.dumps(
+            [unique_id, normalize_hostname(url), flags, email, lang],
+            sort_keys=True,
+            default=str,
+        ).encode()
+    ).hexdigest()
+
+
+def is_email_webhook(webhook_url: str) -> bool:
+    """Whether a task webhook is meant to send an email
+
+    Our own webhooks without target are only used to track task completion
+    """
+    return not (
+        webhook_url.startswith(ApiConfiguration.callback_base_url)
+        and "target" not in parse_qs(urlparse(webhook_url).query)
+    )
+
+
 def get_task_info(task: Any) -> TaskInfo:
     """Transforms a task object(dict) returned by Zimfarm API
 
@@ -52,6 +111,10 @@ def get_task_info(task: Any) -> TaskInfo:
             zimfarm_task.notification
             and zimfarm_task.notification.ended
             and zimfarm_task.notification.ended.webhook
+            and any(
+                is_email_webhook(webhook)
+                for webhook in zimfarm_task.notification.ended.webhook
+            )
         ),
         partial_zim=bool(
             zimfarm_task.container
@@ -116,26 +179,31 @@ def process_zimfarm_hook_call(
     if task.status != "requested" and (task.files is None or len(task.files) == 0):
         task.status = "failed"
 
-    context = {
-        "base_url": ApiConfiguration.public_url,
-        "download_url": ApiConfiguration.zim_download_url,
-        "size_limit": ApiConfiguration.zimit_size_limit,
-        "time_limit": ApiConfiguration.zimit_time_limit,
-        "contact_us_url": ApiConfiguration.contact_us_url,
-        "task": task.model_dump(),
-        "rtl": lang in ApiConfiguration.rtl_language_codes,
-        "lang": lang,
-    }
-
-    logger.info(f"Translating to {lang}")
-    change_locale(lang)
-    subject = (
-        jinja_env.get_template("email_subject.txt").render(**context).replace("\n", "")
-    )
-    body = jinja_env.get_template("email_body.html").render(**context)
+    subject, body = email_renderer.render(lang, task)
     return HookProcessingResult(
         hook_response_status=SUCCESS,
         mail_target=target,
         mail_subject=subject,
         mail_body=body,
     )
+
+
+def notify_task(
+    token: str | None, target: str | None, lang: str, task: ZimfarmTask | None
+) -> HookStatus:
+    """Queue email about a task status to target, if relevant"""
+    result = process_zimfarm_hook_call(token, target, lang, task)
+    if (
+        result.hook_response_status == SUCCESS
+        and result.mail_target
+        and result.mail_subject
+        and result.mail_body
+    ):
+        mailer.enqueue(
+            MailJob(
+                to=result.mail_target,
+                subject=result.mail_subject,
+                body=result.mail_body,
+            )
+        )
+    return result.hook_response_status
@@ -0,0 +1,160 @@
+import asyncio
+from http import HTTPStatus
+from typing import Any
+
+from pydantic import BaseModel
+
+from zimitfrontend.constants import ApiConfiguration, logger
+from zimitfrontend.routes.utils import get_task_info
+from zimitfrontend.tasks import TERMINAL_TASK_STATUSES, get_task
+
+
+class TaskEvent(BaseModel):
+    # `info` (changed TaskInfo fields), `upstream_error` or `end`
+    name: str
+    data: dict[str, Any] = {}
+
+
+END_EVENT = TaskEvent(name="end")
+
+
+class TaskWatcher:
+    """Watches a task on the Zimfarm on behalf of all its subscribers
+
+    Only TaskInfo fields which changed since previous poll are published, new
+    subscribers first receive the whole TaskInfo. Watch ends once task has reached
+    a terminal status or is not found.
+    """
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.subscribers: list[asyncio.Queue[TaskEvent]] = []
+        # last TaskInfo published, serialized as returned by the API
+        self.info: dict[str, Any] | None = None
+        self.ended = False
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    def cancel(self):
+        if self._task:
+            self._task.cancel()
+
+    async def stop(self):
+        """Stop watching and end streams of all subscribers"""
+        self.cancel()
+        if self._task:
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._publish(END_EVENT)
+
+    def subscribe(self) -> asyncio.Queue[TaskEvent]:
+        queue: asyncio.Queue[TaskEvent] = asyncio.Queue()
+        if self.info is not None:
+            queue.put_nowait(TaskEvent(name="info", data=self.info))
+        if self.ended:
+            queue.put_nowait(END_EVENT)
+        self.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue[TaskEvent]):
+        if queue in self.subscribers:
+            self.subscribers.remove(queue)
+
+    def wakeup(self):
+        """Poll task right away, e.g. because Zimfarm notified it has changed"""
+        self._wakeup.set()
+
+    def _publish(self, event: TaskEvent):
+        for queue in self.subscribers:
+            queue.put_nowait(event)
+
+    async def poll(self):
+        """Retrieve task and publish changes, if any"""
+        status, task = await get_task(self.task_id)
+        if status == HTTPStatus.NOT_FOUND:
+            self._publish(
+                TaskEvent(
+                    name="upstream_error",
+                    data={"error": "Task not found on Zimfarm", "status": status},
+                )
+            )
+            self.ended = True
+            return
+        if status != HTTPStatus.OK:
+            # upstream might only be temporarily unavailable, keep watching
+            self._publish(
+                TaskEvent(
+                    name="upstream_error",
+                    data={
+                        "error": f"Failed to find task on Zimfarm with HTTP {status}",
+                        "status": status,
+                    },
+                )
+            )
+            return
+        info = get_task_info(task).model_dump(mode="json", by_alias=True)
+        changes = {
+            key: value
+            for key, value in info.items()
+            if self.info is None or self.info.get(key) != value
+        }
+        self.info = info
+        if changes:
+            self._publish(TaskEvent(name="info", data=changes))
+        if info["status"] in TERMINAL_TASK_STATUSES:
+            self.ended = True
+
+    async def run(self):
+        while not self.ended:
+            self._wakeup.clear()
+            try:
+                await self.poll()
+            except Exception as exc:
+                logger.error(f"Failed to poll task {self.task_id}: {exc}", exc_info=exc)
+            if self.ended:
+                break
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), timeout=ApiConfiguration.task_events_interval
+                )
+            except TimeoutError:
+                pass
+        self._publish(END_EVENT)
+
+
+# watchers of tasks which have subscribers, by task id
+watchers: dict[str, TaskWatcher] = {}
+
+
+def subscribe(task_id: str) -> asyncio.Queue[TaskEvent]:
+    """Subscribe to events of a task, starting its watcher if needed"""
+    watcher = watchers.get(task_id)
+    if watcher is None:
+        watcher = watchers[task_id] = TaskWatcher(task_id)
+        watcher.start()
+    return watcher.subscribe()
+
+
+def unsubscribe(task_id: str, queue: asyncio.Queue[TaskEvent]):
+    """Unsubscribe from events of a task, stopping its watcher if unneeded"""
+    watcher = watchers.get(task_id)
+    if watcher is None:
+        return
+    watcher.unsubscribe(queue)
+    if not watcher.subscribers:
+        del watchers[task_id]
+        watcher.cancel()
+
+
+def wakeup_watcher(task_id: str):
+    """Let watcher of a task know that task has changed, if it is watched"""
+    if watcher := watchers.get(task_id):
+        watcher.wakeup()
+
+
+async def stop_watchers():
+    """End all watches, e.g. on shutdown"""
+    for task_id in list(watchers.keys()):
+        await watchers.pop(task_id).stop()
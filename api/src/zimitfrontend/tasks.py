@@ -0,0 +1,64 @@
+from http import HTTPStatus
+from typing import Any
+
+from zimitfrontend.cache import TTLCache
+from zimitfrontend.constants import ApiConfiguration
+from zimitfrontend.zimfarm import GET, query_api
+
+TASKS_ENDPOINT = "/tasks"
+REQUESTED_TASKS_ENDPOINT = "/requested-tasks"
+
+# status after which a task will not evolve anymore
+TERMINAL_TASK_STATUSES = ("succeeded", "failed", "canceled")
+
+# status and payload of last Zimfarm reply for each task id
+task_cache: TTLCache[str, tuple[HTTPStatus, Any]] = TTLCache(
+    maxsize=ApiConfiguration.task_cache_size
+)
+# endpoint on which each task has last been found
+task_endpoints: TTLCache[str, str] = TTLCache(maxsize=ApiConfiguration.task_cache_size)
+
+
+def get_task_cache_ttl(task: Any) -> float:
+    """Duration during which a task status can be served from cache"""
+    if task.get("status") in TERMINAL_TASK_STATUSES:
+        return ApiConfiguration.task_cache_ttl_ended
+    return ApiConfiguration.task_cache_ttl_ongoing
+
+
+async def _fetch_task(task_id: str) -> tuple[tuple[HTTPStatus, Any], float]:
+    # a task is first a requested task and then a task, but never goes back, so
+    # start with the endpoint which found the task last time, if known
+    endpoints = [TASKS_ENDPOINT, REQUESTED_TASKS_ENDPOINT]
+    if task_endpoints.get(task_id) == REQUESTED_TASKS_ENDPOINT:
+        endpoints.reverse()
+
+    status, task = HTTPStatus.NOT_FOUND, None
+    for endpoint in endpoints:
+        _, status, task = await query_api(GET, f"{endpoint}/{task_id}")
+        if status == HTTPStatus.OK:
+            task_endpoints.set(
+                task_id, endpoint, ttl=ApiConfiguration.task_cache_ttl_ended
+            )
+        if status != HTTPStatus.NOT_FOUND:
+            break
+    if status != HTTPStatus.OK:
+        return (status, task), 0
+    return (status, task), get_task_cache_ttl(task)
+
+
+async def get_task(task_id: str) -> tuple[HTTPStatus, Any]:
+    """Retrieve a task or requested task from the Zimfarm, through the cache
+
+    Returns HTTP status of Zimfarm reply and the task (or error message)
+    """
+    return await task_cache.get_or_fetch(task_id, lambda: _fetch_task(task_id))
+
+
+def update_task_cache(task: Any) -> None:
+    """Store a task received from the Zimfarm by other means (e.g. webhook)"""
+    task_cache.set(task["id"], (HTTPStatus.OK, task), ttl=get_task_cache_ttl(task))
+    if task.get("status") in TERMINAL_TASK_STATUSES:
+        task_endpoints.set(
+            task["id"], TASKS_ENDPOINT, ttl=ApiConfiguration.task_cache_ttl_ended
+        )
@@ -0,0 +1,218 @@
+import atexit
+import functools
+import inspect
+import queue
+import threading
+import time
+import uuid
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, ParamSpec, TypeVar, cast
+
+from pydantic import BaseModel
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from zimitfrontend.constants import ApiConfiguration, logger
+from zimitfrontend.logging import request_id
+from zimitfrontend.metrics import CallbackCounter
+
+# header carrying the request id, accepted from clients and returned to them
+REQUEST_ID_HEADER = "X-Request-ID"
+
+
+class Span(BaseModel):
+    # id of the request (or background job) the span is part of
+    trace_id: str
+    span_id: str
+    parent_id: str | None = None
+    name: str
+    # epoch timestamp, in seconds
+    start: float
+    # in seconds, set once span has ended
+    duration: float | None = None
+    status: str = "ok"
+    attributes: dict[str, Any] = {}
+
+
+current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+class JsonLinesExporter:
+    """Write ended spans to a file, one JSON object per line
+
+    Spans are handed over to a bounded queue, drained by a writer thread, so that
+    callers never wait for the file; spans are dropped when the queue is full.
+    """
+
+    def __init__(self, path: Path | str, queue_size: int = 10000):
+        self.path = Path(path)
+        self.dropped = 0
+        self._spans: queue.Queue[Span | None] = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(
+            target=self._write, name="spans-exporter", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def export(self, span: Span):
+        try:
+            self._spans.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Wait until all spans exported so far have been written"""
+        self._spans.join()
+
+    def stop(self):
+        """Write spans exported so far, and stop writer thread"""
+        if self._thread.is_alive():
+            self._spans.put(None)
+            self._thread.join()
+
+    def _write(self):
+        while True:
+            spans = [self._spans.get()]
+            # write all spans already queued at once
+            while spans[-1] is not None and not self._spans.empty():
+                spans.append(self._spans.get_nowait())
+            try:
+                with open(self.path, "a") as fh:
+                    fh.writelines(
+                        item.model_dump_json() + "\n" for item in spans if item
+                    )
+            except Exception as exc:
+                logger.warning(f"Failed to export {len(spans)} span(s): {exc}")
+            finally:
+                for _ in spans:
+                    self._spans.task_done()
+            if spans[-1] is None:
+                return
+
+
+# spans are only exported when a destination is configured
+exporter = (
+    JsonLinesExporter(
+        ApiConfiguration.tracing_export_path, ApiConfiguration.tracing_queue_size
+    )
+    if ApiConfiguration.tracing_export_path
+    else None
+)
+
+CallbackCounter(
+    "tracing_spans_dropped_total",
+    "Spans dropped because export queue was full",
+    function=lambda: exporter.dropped if exporter else 0,
+)
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """Time the block as a span, child of current span if any
+
+    Spans of a request share its request id as trace id; spans outside of a request
+    (e.g. background jobs) start a trace of their own.
+    """
+    parent = current_span.get()
+    new_span = Span(
+        trace_id=parent.trace_id if parent else (request_id.get() or _new_id()),
+        span_id=_new_id(),
+        parent_id=parent.span_id if parent else None,
+        name=name,
+        start=time.time(),
+        attributes=attributes,
+    )
+    started_on = time.perf_counter()
+    token = current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as exc:
+        new_span.status = "error"
+        new_span.attributes["error"] = repr(exc)
+        raise
+    finally:
+        current_span.reset(token)
+        new_span.duration = time.perf_counter() - started_on
+        if exporter:
+            exporter.export(new_span)
+
+
+R = TypeVar("R")
+P = ParamSpec("P")
+
+
+def traced(name: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """Decorate a function, sync or async, so that each call is a span"""
+
+    def decorator(func: Callable[P, R]) -> Callable[P, R]:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: P.args, **kwargs: P.kwargs) -> Any:
+                with span(name):
+                    return await func(*args, **kwargs)
+
+            return cast(Callable[P, R], async_wrapper)
+
+        @functools.wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TracingMiddleware:
+    """Assign an id to each HTTP request and trace its handling as a root span
+
+    Request id is generated, and suffixed with the one of the request header when
+    provided (e.g. by a reverse proxy) so that it can be correlated but cannot be
+    chosen by clients; it is returned in the response header.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        current_request_id = _get_request_id(scope)
+        token = request_id.set(current_request_id)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append(
+                    REQUEST_ID_HEADER, current_request_id
+                )
+                root_span.attributes["status"] = message["status"]
+            await send(message)
+
+        try:
+            with span(f"{scope['method']} {scope['path']}") as root_span:
+                await self.app(scope, receive, send_wrapper)
+                # route template is only known once request has been routed
+                if route := scope.get("route"):
+                    root_span.name = f"{scope['method']} {route.path}"
+        finally:
+            request_id.reset(token)
+
+
+def _get_request_id(scope: Scope) -> str:
+    for name, value in scope["headers"]:
+        if name == REQUEST_ID_HEADER.lower().encode():
+            # only keep a reasonable id, it ends up in logs
+            client_request_id = value.decode("latin-1")[:64]
+            if client_request_id.replace("-", "").isalnum():
+                return f"{_new_id()}-{client_request_id}"
+    return _new_id()
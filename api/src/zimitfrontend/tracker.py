@@ -1,21 +1,38 @@
+import asyncio
 import hmac
+import time
+from collections.abc import Callable, Iterable
 from enum import Enum
 from http import HTTPStatus
+from typing import Any, TypeVar
 from uuid import uuid4
 
 from pydantic import BaseModel
 
 from zimitfrontend.constants import ApiConfiguration, logger
-from zimitfrontend.zimfarm import query_api
+from zimitfrontend.metrics import Gauge, Histogram
+from zimitfrontend.tasks import get_task
+from zimitfrontend.tracing import traced
+from zimitfrontend.tracker_store import (
+    ClientInfo,
+    TrackerStore,
+    create_tracker_store,
+)
 
+# status of tasks which have not yet completed
+ONGOING_TASK_STATUSES = (
+    "requested",
+    "cancel_requested",
+    "reserved",
+    "scraper_running",
+    "scraper_started",
+    "started",
+)
 
-class ClientInfo(BaseModel):
-    # Last known address of the client (will be updated for a given client_id)
-    ip_address: str
-    # Unique identifier of the client
-    unique_id: str
-    # List of client tasks known to not yet have completed
-    ongoing_tasks: list[str]
+# prefix of placeholder tasks holding the slot of a task being created
+PENDING_TASK_PREFIX = "pending:"
+
+R = TypeVar("R")
 
 
 class AddTaskStatus(Enum):
@@ -34,6 +51,8 @@ class AddTaskResponse(BaseModel):
     # new_unique_id is populated only when status is TASK_ADDED and unique_id was
     # not already set
     new_unique_id: str | None = None
+    # pending_task_id is populated only by reserve_task, when status is TASK_ADDED
+    pending_task_id: str | None = None
 
 
 def generate_unique_id() -> str:
@@ -55,86 +74,217 @@ def is_valid_unique_id(unique_id: str) -> bool:
     return hmac.compare_digest(digest, expected_digest)
 
 
+def generate_pending_task_id() -> str:
+    return f"{PENDING_TASK_PREFIX}{time.time():.0f}:{uuid4().hex[:8]}"
+
+
+def is_pending_task(task_id: str) -> bool:
+    return task_id.startswith(PENDING_TASK_PREFIX)
+
+
+def is_stale_pending_task(task_id: str) -> bool:
+    """Whether pending task has been reserved for too long, e.g. before a crash"""
+    reserved_on = float(task_id.removeprefix(PENDING_TASK_PREFIX).split(":", 1)[0])
+    return time.time() - reserved_on > ApiConfiguration.tracker_reservation_ttl
+
+
 class Tracker:
-    def __init__(self):
-        self.known_clients: list[ClientInfo] = []
+    def __init__(self, store: TrackerStore | None = None):
+        self.store = store or create_tracker_store("")
         self.ongoing_task_has_finished = self._ongoing_task_has_finished
         self.has_reached_maximum_tasks = self._has_reached_maximum_tasks
+        # counts as of last refresh, exposed as metrics without querying the store
+        self.nb_clients = 0
+        self.nb_ongoing_tasks = 0
 
-    def _refresh_ongoing_tasks(self, ip_address: str, unique_id: str | None):
-        clients_to_refresh = filter(
-            lambda client: client.ip_address == ip_address
-            or (unique_id and client.unique_id == unique_id),
-            self.known_clients,
-        )
-        completed_clients: list[ClientInfo] = []
-        for client in clients_to_refresh:
-            completed_tasks: list[str] = []
-            for task in client.ongoing_tasks:
-                if self.ongoing_task_has_finished(task):
-                    completed_tasks.append(task)
-            for task in completed_tasks:
-                client.ongoing_tasks.remove(task)
-                if len(client.ongoing_tasks) == 0:
-                    completed_clients.append(client)
-        for client in completed_clients:
-            self.known_clients.remove(client)
+    @property
+    def known_clients(self) -> list[ClientInfo]:
+        return self.store.get_clients()
+
+    @known_clients.setter
+    def known_clients(self, clients: Iterable[ClientInfo]):
+        self.store.set_clients(clients)
+
+    async def _run(self, func: Callable[..., R], *args: Any) -> R:
+        """Run store operations in one transaction, in a thread
+
+        Store might do blocking I/O (e.g. SQLite, waiting for other workers to
+        release their lock), which must not block the event loop.
+        """
+
+        def run() -> R:
+            with self.store.transaction():
+                return func(*args)
+
+        return await asyncio.to_thread(run)
+
+    @traced("tracker.remove_task")
+    async def remove_task(self, task_id: str):
+        """Forget a task which has completed, and clients without ongoing task"""
+        await self._run(self.store.remove_task, task_id)
+
+    @traced("tracker.remove_client_task")
+    async def remove_client_task(self, unique_id: str, task_id: str):
+        """Forget a task for one client only, e.g. a shared task it cancelled"""
+        await self._run(self.store.remove_ongoing_task, unique_id, task_id)
+
+    @traced("tracker.refresh")
+    async def refresh(self):
+        """Check status of all ongoing tasks and forget those which have completed
+
+        Pending tasks are not known to the Zimfarm, they are only forgotten once
+        stale.
+        """
+        with refresh_duration.time():
+            task_ids = await self._run(self.store.get_ongoing_tasks)
+            pending_task_ids = {
+                task_id for task_id in task_ids if is_pending_task(task_id)
+            }
+            for task_id in {
+                task_id
+                for task_id in pending_task_ids
+                if is_stale_pending_task(task_id)
+            } | await self._get_completed_tasks(task_ids - pending_task_ids):
+                await self.remove_task(task_id)
+            self.nb_clients, self.nb_ongoing_tasks = await self._run(self._count)
+
+    def _count(self) -> tuple[int, int]:
+        return self.store.count_clients(), self.store.count_ongoing_tasks()
+
+    async def reconcile_periodically(self):
+        """Refresh tracker in background, forever"""
+        while True:
+            await asyncio.sleep(ApiConfiguration.tracker_reconcile_interval)
+            try:
+                await self.refresh()
+            except Exception as exc:
+                logger.error(f"Failed to refresh tracker: {exc}", exc_info=exc)
+
+    async def _get_completed_tasks(self, task_ids: Iterable[str]) -> set[str]:
+        """Tasks which have completed among the ones passed, checked concurrently
+
+        Tasks whose status could not be checked before the deadline are considered
+        to be still ongoing.
+        """
+        semaphore = asyncio.Semaphore(ApiConfiguration.tracker_refresh_concurrency)
+
+        async def has_finished(task_id: str) -> bool:
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(
+                        self.ongoing_task_has_finished(task_id),
+                        timeout=ApiConfiguration.tracker_refresh_timeout,
+                    )
+                except TimeoutError:
+                    logger.warning(
+                        "Timeout while checking ongoing task %s status", task_id
+                    )
+                    return False
+
+        task_ids = list(task_ids)
+        results = await asyncio.gather(*[has_finished(task) for task in task_ids])
+        return {
+            task for task, finished in zip(task_ids, results, strict=True) if finished
+        }
 
     def _has_reached_maximum_tasks(self, client_info: ClientInfo) -> bool:
         return len(client_info.ongoing_tasks) > 0
 
-    def _ongoing_task_has_finished(self, task_id: str) -> bool:
-        # first try to find the requested task
-        success, status, task = query_api("GET", f"/requested-tasks/{task_id}")
-        if status == HTTPStatus.NOT_FOUND:
-            # if it fails, try to find the task
-            success, status, task = query_api("GET", f"/tasks/{task_id}")
-        if not success:
+    async def _ongoing_task_has_finished(self, task_id: str) -> bool:
+        status, task = await get_task(task_id)
+        if status != HTTPStatus.OK:
             logger.warning(
-                f"Unable to find ongoing task {task_id} status via HTTP {status}: "
-                f"{task}"
+                "Unable to find ongoing task %s status via HTTP %s: %s",
+                task_id,
+                status,
+                task,
             )
             # failsafe to `True` to clean the situation, might be that we manually
             # cancelled the requested task which is then simply deleted from DB
             return True
-        return task["status"] not in [
-            "requested",
-            "cancel_requested",
-            "reserved",
-            "scraper_running",
-            "scraper_started",
-            "started",
-        ]
-
-    def add_task(
+        return task["status"] not in ONGOING_TASK_STATUSES
+
+    @traced("tracker.add_task")
+    async def add_task(
         self, ip_address: str, unique_id: str | None, task_id: str | None
     ) -> AddTaskResponse:
+        """Check whether client can add a task, and add it if passed
+
+        Answer is based on what is known by the tracker, kept up-to-date in background
+        """
 
         if unique_id and not is_valid_unique_id(unique_id):
             return AddTaskResponse(
                 status=AddTaskStatus.INVALID_UNIQUE_ID,
             )
 
-        self._refresh_ongoing_tasks(ip_address, unique_id)
+        # check and add in one single transaction, so that concurrent requests of
+        # the same client (possibly on distinct workers) cannot both add a task
+        return await self._run(self._add_task, ip_address, unique_id, task_id)
 
-        if unique_id:
-            if clients_info_by_unique_id := [
-                client for client in self.known_clients if client.unique_id == unique_id
-            ]:
-                if len(clients_info_by_unique_id) > 1:
-                    raise Exception(
-                        f"Too many data for one single unique id: {unique_id}"
-                    )
-                client_info = clients_info_by_unique_id[0]
-                if self.has_reached_maximum_tasks(client_info):
-                    return AddTaskResponse(
-                        status=AddTaskStatus.TOO_MANY_TASKS_FOR_UNIQUE_ID,
-                        ongoing_tasks=client_info.ongoing_tasks,
-                    )
-        elif clients_info_by_ip_address := [
-            client for client in self.known_clients if client.ip_address == ip_address
-        ]:
-            if len(clients_info_by_ip_address) > 1:
+    async def reserve_task(
+        self, ip_address: str, unique_id: str | None
+    ) -> AddTaskResponse:
+        """Check whether client can add a task, and hold its slot if passed
+
+        Slot is held by a pending task, until it is confirmed with the actual task
+        once created, or released. Concurrent requests of the same client are hence
+        refused while a task is being created.
+        """
+        pending_task_id = generate_pending_task_id()
+        response = await self.add_task(ip_address, unique_id, pending_task_id)
+        if response.status == AddTaskStatus.TASK_ADDED:
+            response.pending_task_id = pending_task_id
+        return response
+
+    @traced("tracker.confirm_task")
+    async def confirm_task(
+        self, ip_address: str, unique_id: str, pending_task_id: str, task_id: str
+    ):
+        """Replace a pending task by the actual task, once created"""
+        await self._run(
+            self._confirm_task, ip_address, unique_id, pending_task_id, task_id
+        )
+
+    def _confirm_task(
+        self, ip_address: str, unique_id: str, pending_task_id: str, task_id: str
+    ):
+        # client is gone if pending task has been considered stale meanwhile
+        if self.store.get_client(unique_id):
+            self.store.add_ongoing_task(unique_id, task_id)
+        else:
+            self.store.add_client(
+                ClientInfo(
+                    ip_address=ip_address, unique_id=unique_id, ongoing_tasks={task_id}
+                )
+            )
+        self.store.remove_ongoing_task(unique_id, pending_task_id)
+
+    async def release_task(self, unique_id: str, pending_task_id: str):
+        """Forget a pending task, e.g. because task could not be created"""
+        await self.remove_client_task(unique_id, pending_task_id)
+
+    def _add_task(
+        self, ip_address: str, unique_id: str | None, task_id: str | None
+    ) -> AddTaskResponse:
+        client_info = self.store.get_client(unique_id) if unique_id else None
+        if client_info:
+            if self.has_reached_maximum_tasks(client_info):
+                return AddTaskResponse(
+                    status=AddTaskStatus.TOO_MANY_TASKS_FOR_UNIQUE_ID,
+                    # tasks being created are not known yet to the Zimfarm
+                    ongoing_tasks=sorted(
+                        task_id
+                        for task_id in client_info.ongoing_tasks
+                        if not is_pending_task(task_id)
+                    ),
+                )
+        elif not unique_id and (
+            unique_ids_by_ip_address := self.store.get_unique_ids_by_ip_address(
+                ip_address
+            )
+        ):
+            if len(unique_ids_by_ip_address) > 1:
                 raise Exception(
                     f"Too many data for one single ip address: {ip_address}"
                 )
@@ -155,11 +305,11 @@ class Tracker:
 
         if not unique_id:
             new_unique_id = generate_unique_id()  # generate a new unique ID
-            self.known_clients.append(
+            self.store.add_client(
                 ClientInfo(
                     ip_address=ip_address,
                     unique_id=new_unique_id,
-                    ongoing_tasks=[task_id],
+                    ongoing_tasks={task_id},
                 )
             )
             return AddTaskResponse(
@@ -168,15 +318,12 @@ class Tracker:
                 new_unique_id=new_unique_id,
             )
 
-        if clients_info_by_unique_id := [
-            client for client in self.known_clients if client.unique_id == unique_id
-        ]:
-            client_info = clients_info_by_unique_id[0]
-            client_info.ongoing_tasks.append(task_id)
+        if client_info:
+            self.store.add_ongoing_task(unique_id, task_id)
         else:
-            self.known_clients.append(
+            self.store.add_client(
                 ClientInfo(
-                    ip_address=ip_address, unique_id=unique_id, ongoing_tasks=[task_id]
+                    ip_address=ip_address, unique_id=unique_id, ongoing_tasks={task_id}
                 )
             )
 
@@ -187,4 +334,19 @@ class Tracker:
         )
 
 
-tracker = Tracker()
+tracker = Tracker(create_tracker_store(ApiConfiguration.tracker_database_path))
+
+refresh_duration = Histogram(
+    "tracker_refresh_duration_seconds",
+    "Duration of tracker refreshes, checking status of all ongoing tasks",
+)
+Gauge(
+    "tracker_clients",
+    "Clients known to the tracker, as of last refresh",
+    function=lambda: tracker.nb_clients,
+)
+Gauge(
+    "tracker_ongoing_tasks",
+    "Ongoing tasks known to the tracker, as of last refresh",
+    function=lambda: tracker.nb_ongoing_tasks,
+)
@@ -0,0 +1,339 @@
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
+from contextlib import AbstractContextManager, contextmanager
+from pathlib import Path
+
+from pydantic import BaseModel
+
+
+class ClientInfo(BaseModel):
+    # Last known address of the client (will be updated for a given client_id)
+    ip_address: str
+    # Unique identifier of the client
+    unique_id: str
+    # Client tasks known to not yet have completed
+    ongoing_tasks: set[str]
+
+
+class DuplicateUniqueIdError(Exception):
+    def __init__(self, unique_id: str):
+        super().__init__(f"Too many data for one single unique id: {unique_id}")
+
+
+class TrackerStore(ABC):
+    """Storage of clients known by the tracker and of their ongoing tasks
+
+    Every read and write of a check-and-add sequence must happen inside the same
+    `transaction()` so that it is atomic, including when the store is shared by
+    several processes.
+    """
+
+    @abstractmethod
+    def transaction(self) -> AbstractContextManager[None]:
+        """Context manager in which operations are isolated from other clients"""
+
+    @abstractmethod
+    def get_clients(self) -> list[ClientInfo]:
+        """All known clients"""
+
+    @abstractmethod
+    def set_clients(self, clients: Iterable[ClientInfo]):
+        """Replace all known clients"""
+
+    @abstractmethod
+    def get_client(self, unique_id: str) -> ClientInfo | None:
+        """Client with this unique ID, if known"""
+
+    @abstractmethod
+    def get_unique_ids_by_ip_address(self, ip_address: str) -> set[str]:
+        """Unique ID of all clients last seen with this IP address"""
+
+    @abstractmethod
+    def get_ongoing_tasks(self) -> set[str]:
+        """ID of all tasks known to not yet have completed, for all clients"""
+
+    @abstractmethod
+    def count_clients(self) -> int:
+        """Number of known clients"""
+
+    @abstractmethod
+    def count_ongoing_tasks(self) -> int:
+        """Number of tasks known to not yet have completed, for all clients"""
+
+    @abstractmethod
+    def add_client(self, client: ClientInfo):
+        """Add a new client, raising DuplicateUniqueIdError if already known"""
+
+    @abstractmethod
+    def add_ongoing_task(self, unique_id: str, task_id: str):
+        """Add an ongoing task to an already known client"""
+
+    @abstractmethod
+    def remove_ongoing_task(self, unique_id: str, task_id: str):
+        """Forget a task of one client, and the client if it has no more tasks"""
+
+    @abstractmethod
+    def remove_task(self, task_id: str):
+        """Forget a task, and clients which do not have any ongoing task anymore"""
+
+
+class MemoryTrackerStore(TrackerStore):
+    """Tracker store local to current process, lost on restart"""
+
+    def __init__(self):
+        # clients indexed by unique ID, and unique IDs indexed by IP address and by
+        # ongoing task
+        self._clients_by_unique_id: dict[str, ClientInfo] = {}
+        self._unique_ids_by_ip_address: dict[str, set[str]] = {}
+        self._unique_ids_by_task_id: dict[str, set[str]] = {}
+        self._lock = threading.RLock()
+
+    def transaction(self) -> AbstractContextManager[None]:
+        # store is used from several threads, operations must not interleave
+        return self._lock  # pyright: ignore[reportReturnType]
+
+    def get_clients(self) -> list[ClientInfo]:
+        return list(self._clients_by_unique_id.values())
+
+    def set_clients(self, clients: Iterable[ClientInfo]):
+        self._clients_by_unique_id.clear()
+        self._unique_ids_by_ip_address.clear()
+        self._unique_ids_by_task_id.clear()
+        for client in clients:
+            self.add_client(client)
+
+    def get_client(self, unique_id: str) -> ClientInfo | None:
+        return self._clients_by_unique_id.get(unique_id)
+
+    def get_unique_ids_by_ip_address(self, ip_address: str) -> set[str]:
+        return set(self._unique_ids_by_ip_address.get(ip_address, set()))
+
+    def get_ongoing_tasks(self) -> set[str]:
+        return set(self._unique_ids_by_task_id)
+
+    def count_clients(self) -> int:
+        return len(self._clients_by_unique_id)
+
+    def count_ongoing_tasks(self) -> int:
+        return len(self._unique_ids_by_task_id)
+
+    def add_client(self, client: ClientInfo):
+        if client.unique_id in self._clients_by_unique_id:
+            raise DuplicateUniqueIdError(client.unique_id)
+        self._clients_by_unique_id[client.unique_id] = client
+        self._unique_ids_by_ip_address.setdefault(client.ip_address, set()).add(
+            client.unique_id
+        )
+        for task_id in client.ongoing_tasks:
+            self._unique_ids_by_task_id.setdefault(task_id, set()).add(client.unique_id)
+
+    def add_ongoing_task(self, unique_id: str, task_id: str):
+        self._clients_by_unique_id[unique_id].ongoing_tasks.add(task_id)
+        self._unique_ids_by_task_id.setdefault(task_id, set()).add(unique_id)
+
+    def remove_ongoing_task(self, unique_id: str, task_id: str):
+        client = self._clients_by_unique_id.get(unique_id)
+        if not client or task_id not in client.ongoing_tasks:
+            return
+        client.ongoing_tasks.discard(task_id)
+        unique_ids = self._unique_ids_by_task_id[task_id]
+        unique_ids.discard(unique_id)
+        if not unique_ids:
+            del self._unique_ids_by_task_id[task_id]
+        if len(client.ongoing_tasks) == 0:
+            self._remove_client(client)
+
+    def _remove_client(self, client: ClientInfo):
+        del self._clients_by_unique_id[client.unique_id]
+        unique_ids = self._unique_ids_by_ip_address[client.ip_address]
+        unique_ids.discard(client.unique_id)
+        if not unique_ids:
+            del self._unique_ids_by_ip_address[client.ip_address]
+        for task_id in client.ongoing_tasks:
+            unique_ids = self._unique_ids_by_task_id[task_id]
+            unique_ids.discard(client.unique_id)
+            if not unique_ids:
+                del self._unique_ids_by_task_id[task_id]
+
+    def remove_task(self, task_id: str):
+        for unique_id in self._unique_ids_by_task_id.pop(task_id, set()):
+            client = self._clients_by_unique_id[unique_id]
+            client.ongoing_tasks.discard(task_id)
+            if len(client.ongoing_tasks) == 0:
+                self._remove_client(client)
+
+
+class SQLiteTrackerStore(TrackerStore):
+    """Tracker store persisted in a SQLite database
+
+    Database is in WAL mode so that it can be shared by all API workers running on
+    the same host; transactions take the write lock right away (BEGIN IMMEDIATE) so
+    that check-and-add sequences of concurrent workers are serialized.
+    """
+
+    def __init__(self, path: Path | str, timeout: float = 5):
+        self.path = path
+        self.timeout = timeout
+        # one connection per thread, sqlite3 connections must not be shared
+        self._local = threading.local()
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS client (
+                unique_id TEXT PRIMARY KEY,
+                ip_address TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS client_ip_address ON client(ip_address);
+            CREATE TABLE IF NOT EXISTS ongoing_task (
+                unique_id TEXT NOT NULL REFERENCES client(unique_id) ON DELETE CASCADE,
+                task_id TEXT NOT NULL,
+                PRIMARY KEY (unique_id, task_id)
+            );
+            CREATE INDEX IF NOT EXISTS ongoing_task_task_id ON ongoing_task(task_id);
+            """
+        )
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            self._local.connection = connection
+            self._local.depth = 0
+        return connection
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        connection = self._connection
+        # nested transactions are merged into the outermost one
+        if self._local.depth == 0:
+            connection.execute("BEGIN IMMEDIATE")
+        self._local.depth += 1
+        try:
+            yield
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                connection.execute("ROLLBACK")
+            raise
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            connection.execute("COMMIT")
+
+    def _get_ongoing_tasks_of(self, unique_id: str) -> set[str]:
+        return {
+            task_id
+            for (task_id,) in self._connection.execute(
+                "SELECT task_id FROM ongoing_task WHERE unique_id = ?", (unique_id,)
+            )
+        }
+
+    def get_clients(self) -> list[ClientInfo]:
+        with self.transaction():
+            return [
+                ClientInfo(
+                    ip_address=ip_address,
+                    unique_id=unique_id,
+                    ongoing_tasks=self._get_ongoing_tasks_of(unique_id),
+                )
+                for unique_id, ip_address in self._connection.execute(
+                    "SELECT unique_id, ip_address FROM client ORDER BY rowid"
+                ).fetchall()
+            ]
+
+    def set_clients(self, clients: Iterable[ClientInfo]):
+        with self.transaction():
+            self._connection.execute("DELETE FROM client")
+            for client in clients:
+                self.add_client(client)
+
+    def get_client(self, unique_id: str) -> ClientInfo | None:
+        with self.transaction():
+            row = self._connection.execute(
+                "SELECT ip_address FROM client WHERE unique_id = ?", (unique_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            return ClientInfo(
+                ip_address=row[0],
+                unique_id=unique_id,
+                ongoing_tasks=self._get_ongoing_tasks_of(unique_id),
+            )
+
+    def get_unique_ids_by_ip_address(self, ip_address: str) -> set[str]:
+        return {
+            unique_id
+            for (unique_id,) in self._connection.execute(
+                "SELECT unique_id FROM client WHERE ip_address = ?", (ip_address,)
+            )
+        }
+
+    def get_ongoing_tasks(self) -> set[str]:
+        return {
+            task_id
+            for (task_id,) in self._connection.execute(
+                "SELECT DISTINCT task_id FROM ongoing_task"
+            )
+        }
+
+    def count_clients(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM client").fetchone()[0]
+
+    def count_ongoing_tasks(self) -> int:
+        return self._connection.execute(
+            "SELECT COUNT(DISTINCT task_id) FROM ongoing_task"
+        ).fetchone()[0]
+
+    def add_client(self, client: ClientInfo):
+        with self.transaction():
+            try:
+                self._connection.execute(
+                    "INSERT INTO client (unique_id, ip_address) VALUES (?, ?)",
+                    (client.unique_id, client.ip_address),
+                )
+            except sqlite3.IntegrityError as exc:
+                raise DuplicateUniqueIdError(client.unique_id) from exc
+            for task_id in client.ongoing_tasks:
+                self.add_ongoing_task(client.unique_id, task_id)
+
+    def add_ongoing_task(self, unique_id: str, task_id: str):
+        self._connection.execute(
+            "INSERT OR IGNORE INTO ongoing_task (unique_id, task_id) VALUES (?, ?)",
+            (unique_id, task_id),
+        )
+
+    def remove_ongoing_task(self, unique_id: str, task_id: str):
+        with self.transaction():
+            self._connection.execute(
+                "DELETE FROM ongoing_task WHERE unique_id = ? AND task_id = ?",
+                (unique_id, task_id),
+            )
+            self._connection.execute(
+                "DELETE FROM client WHERE unique_id = ? AND NOT EXISTS ("
+                "SELECT 1 FROM ongoing_task WHERE unique_id = client.unique_id)",
+                (unique_id,),
+            )
+
+    def remove_task(self, task_id: str):
+        with self.transaction():
+            unique_ids = self._connection.execute(
+                "DELETE FROM ongoing_task WHERE task_id = ? RETURNING unique_id",
+                (task_id,),
+            ).fetchall()
+            self._connection.executemany(
+                "DELETE FROM client WHERE unique_id = ? AND NOT EXISTS ("
+                "SELECT 1 FROM ongoing_task WHERE unique_id = client.unique_id)",
+                unique_ids,
+            )
+
+
+def create_tracker_store(database_path: str) -> TrackerStore:
+    """SQLite tracker store at database_path if set, in-memory store otherwise"""
+    if database_path:
+        return SQLiteTrackerStore(database_path)
+    return MemoryTrackerStore()
@@ -0,0 +1,137 @@
+import asyncio
+import ipaddress
+import socket
+from enum import Enum
+from typing import Any
+
+import httpx
+from pydantic import BaseModel
+
+from zimitfrontend.blacklist import (
+    blacklist_hits,
+    blacklist_manager,
+    get_url_hostname,
+)
+from zimitfrontend.cache import TTLCache
+from zimitfrontend.constants import ApiConfiguration, logger
+from zimitfrontend.utils import normalize_hostname
+
+# client used to probe URLs submitted by users, never follows redirects; probes
+# connect to an address, so connections are not reused since they are bound to the
+# hostname they have been opened for
+probe_client = httpx.AsyncClient(
+    timeout=ApiConfiguration.check_url_probe_timeout,
+    follow_redirects=False,
+    limits=httpx.Limits(max_keepalive_connections=0),
+)
+
+# whether each origin (scheme, host and port) has been found reachable
+reachability_cache: TTLCache[str, bool] = TTLCache(
+    maxsize=ApiConfiguration.check_url_cache_size
+)
+
+
+# port probed when URL does not have one, by scheme
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+class UrlCheckStatus(Enum):
+    OK = "ok"
+    INVALID_URL = "invalid_url"
+    BLACKLISTED = "blacklisted"
+    UNREACHABLE = "unreachable"
+
+
+class UrlCheckResult(BaseModel):
+    status: UrlCheckStatus
+    # URL as it would be requested
+    url: str
+    # blacklist entry matching URL, if any
+    blacklist: dict[str, Any] | None = None
+    # whether URL host could be reached, None when it has not been probed
+    reachable: bool | None = None
+
+
+async def _resolve_global_address(hostname: str, port: int) -> str | None:
+    """One address of hostname, provided that all its addresses are public ones
+
+    Probes must not give insight into our own network (localhost, private ranges)
+    """
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(
+            hostname, port, type=socket.SOCK_STREAM
+        )
+    except OSError:
+        return None
+    if not addresses or not all(
+        ipaddress.ip_address(address[4][0]).is_global for address in addresses
+    ):
+        return None
+    return str(addresses[0][4][0])
+
+
+async def _probe(url: httpx.URL) -> tuple[bool, float]:
+    address = await _resolve_global_address(
+        url.host, url.port or DEFAULT_PORTS[url.scheme]
+    )
+    if not address:
+        return False, ApiConfiguration.check_url_cache_ttl
+    try:
+        # connect to the address checked above rather than resolving hostname again,
+        # which might then resolve to another one (DNS rebinding); server still
+        # gets hostname, in Host header and TLS SNI (certificate is checked for it)
+        await probe_client.head(
+            url.copy_with(host=address, userinfo=b""),
+            headers={"Host": url.netloc.decode()},
+            extensions={"sni_hostname": url.host},
+        )
+    except httpx.HTTPError as exc:
+        logger.debug("Failed to probe %s: %s", url, exc)
+        return False, ApiConfiguration.check_url_cache_ttl
+    # any HTTP reply, even an error, means that host is reachable
+    return True, ApiConfiguration.check_url_cache_ttl
+
+
+async def is_reachable(url: str) -> bool:
+    """Whether origin (scheme, host and port) of the URL can be reached, cached"""
+    parsed = httpx.URL(url)
+    if parsed.scheme not in DEFAULT_PORTS or not parsed.host:
+        return False
+    origin = (
+        f"{parsed.scheme}://{parsed.host}:{parsed.port or DEFAULT_PORTS[parsed.scheme]}"
+    )
+    return await reachability_cache.get_or_fetch(origin, lambda: _probe(parsed))
+
+
+async def check_url(url: str) -> UrlCheckResult:
+    """Check whether URL can be requested, without reaching the Zimfarm"""
+    normalized_url = normalize_hostname(url)
+    hostname = get_url_hostname(normalized_url)
+    if not hostname:
+        return UrlCheckResult(status=UrlCheckStatus.INVALID_URL, url=normalized_url)
+
+    # not cached since the blacklist is reloaded on changes
+    if blacklist_match := blacklist_manager.blacklist.match_host(hostname):
+        blacklist_hits.inc(source="check")
+        return UrlCheckResult(
+            status=UrlCheckStatus.BLACKLISTED,
+            url=normalized_url,
+            blacklist=blacklist_match.entry,
+        )
+
+    if not ApiConfiguration.check_url_probe_timeout:
+        return UrlCheckResult(status=UrlCheckStatus.OK, url=normalized_url)
+
+    # zimit seeds must have a scheme, probe like it would be crawled
+    probe_url = (
+        normalized_url if "://" in normalized_url else f"https://{normalized_url}"
+    )
+    try:
+        reachable = await is_reachable(probe_url)
+    except httpx.InvalidURL:
+        return UrlCheckResult(status=UrlCheckStatus.INVALID_URL, url=normalized_url)
+    return UrlCheckResult(
+        status=UrlCheckStatus.OK if reachable else UrlCheckStatus.UNREACHABLE,
+        url=normalized_url,
+        reachable=reachable,
+    )
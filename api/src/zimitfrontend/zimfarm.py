@@ -1,22 +1,52 @@
+import asyncio
 import datetime
 import json
 import logging
-from collections.abc import Callable
+import re
+import time
+from collections.abc import Awaitable, Callable
 from http import HTTPStatus
 from typing import Any, ParamSpec, TypeVar, cast
 
-import requests
-from requests.auth import HTTPBasicAuth
+import httpx
 
 from zimitfrontend.constants import ApiConfiguration
+from zimitfrontend.metrics import Counter, Histogram
+from zimitfrontend.tracing import span
 
 GET = "GET"
 POST = "POST"
 PATCH = "PATCH"
 DELETE = "DELETE"
 
+# methods which are safe to send again when Zimfarm replied with a transient error
+IDEMPOTENT_METHODS = (GET, DELETE)
+TRANSIENT_STATUSES = (
+    HTTPStatus.BAD_GATEWAY,
+    HTTPStatus.SERVICE_UNAVAILABLE,
+    HTTPStatus.GATEWAY_TIMEOUT,
+)
+
+# path segments which are not identifiers, kept as is in path templates
+PATH_WORD_PATTERN = re.compile(r"^[a-z][a-z-]{0,19}$")
+
 logger = logging.getLogger(__name__)
 
+request_duration = Histogram(
+    "zimfarm_request_duration_seconds",
+    "Duration of Zimfarm API calls, retries included, by path template and status",
+    ("method", "path", "status"),
+)
+token_refreshes = Counter(
+    "zimfarm_token_refreshes_total",
+    "Zimfarm access token refreshes, by result",
+    ("result",),
+)
+token_refresh_duration = Histogram(
+    "zimfarm_token_refresh_duration_seconds",
+    "Duration of Zimfarm access token refreshes",
+)
+
 
 class ZimfarmAPIError(Exception):
     pass
@@ -27,6 +57,28 @@ def getnow():
     return datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
 
 
+def create_http_client() -> httpx.AsyncClient:
+    """HTTP client with a pool of keep-alive connections to reuse across calls
+
+    Connection errors are retried by the transport itself, transient HTTP errors
+    are retried in `query_api`.
+    """
+    return httpx.AsyncClient(
+        timeout=ApiConfiguration.zimfarm_requests_timeout,
+        limits=httpx.Limits(
+            max_connections=ApiConfiguration.zimfarm_pool_size,
+            max_keepalive_connections=ApiConfiguration.zimfarm_keepalive_connections,
+            keepalive_expiry=ApiConfiguration.zimfarm_keepalive_expiry,
+        ),
+        transport=httpx.AsyncHTTPTransport(
+            retries=ApiConfiguration.zimfarm_max_retries
+        ),
+    )
+
+
+http_client = create_http_client()
+
+
 class ZimfarmClientTokenProvider:
     """Client to generate access tokens to authenticate with Zimfarm API"""
 
@@ -36,43 +88,41 @@ class ZimfarmClientTokenProvider:
         self._expires_at: datetime.datetime = datetime.datetime.fromtimestamp(
             0, datetime.UTC
         ).replace(tzinfo=None)
+        self._refresh_task: asyncio.Task[None] | None = None
 
-    def _generate_oauth_access_token(self) -> None:
+    async def _generate_oauth_access_token(self) -> None:
         """Generate oauth access token and update expires_at."""
-        response = requests.post(
+        response = await http_client.post(
             f"{ApiConfiguration.zimfarm_oauth_issuer}/oauth2/token",
             data={
                 "grant_type": "client_credentials",
                 "audience": ApiConfiguration.zimfarm_oauth_audience_id,
             },
-            auth=HTTPBasicAuth(
+            auth=(
                 ApiConfiguration.zimfarm_oauth_client_id,
                 ApiConfiguration.zimfarm_oauth_client_secret,
             ),
-            timeout=ApiConfiguration.zimfarm_requests_timeout,
         )
         response.raise_for_status()
         payload = response.json()
         self._access_token = cast(str, payload["access_token"])
         self._expires_at = getnow() + datetime.timedelta(seconds=payload["expires_in"])
 
-    def _generate_local_access_token(self) -> None:
+    async def _generate_local_access_token(self) -> None:
         if self._refresh_token:
-            response = requests.post(
+            response = await http_client.post(
                 f"{ApiConfiguration.zimfarm_api_url}/auth/refresh",
                 json={
                     "refresh_token": self._refresh_token,
                 },
-                timeout=ApiConfiguration.zimfarm_requests_timeout,
             )
         else:
-            response = requests.post(
+            response = await http_client.post(
                 f"{ApiConfiguration.zimfarm_api_url}/auth/authorize",
                 json={
                     "username": ApiConfiguration.zimfarm_username,
                     "password": ApiConfiguration.zimfarm_password,
                 },
-                timeout=ApiConfiguration.zimfarm_requests_timeout,
             )
 
         response.raise_for_status()
@@ -83,27 +133,72 @@ class ZimfarmClientTokenProvider:
             payload["expires_time"]
         ).replace(tzinfo=None)
 
-    def get_access_token(self, *, force: bool = False) -> str:
-        """Retrieve or generate access token depending on if token has expired."""
+    async def _generate_access_token(self) -> None:
+        if ApiConfiguration.auth_mode == "oauth":
+            await self._generate_oauth_access_token()
+        elif ApiConfiguration.auth_mode == "local":
+            await self._generate_local_access_token()
+        else:
+            raise ValueError(
+                f"Unknown cms authentication mode: {ApiConfiguration.auth_mode}. "
+                "Allowed values are: 'local', 'oauth'"
+            )
+
+    async def _timed_generate_access_token(self) -> None:
+        with token_refresh_duration.time(), span("zimfarm token refresh"):
+            try:
+                await self._generate_access_token()
+            except Exception:
+                token_refreshes.inc(result="failure")
+                raise
+        token_refreshes.inc(result="success")
+
+    def _on_refresh_done(self, task: asyncio.Task[None]) -> None:
+        # retrieve exception of background refreshes nobody awaited
+        if not task.cancelled() and (exc := task.exception()):
+            logger.error(f"Failed to refresh Zimfarm access token: {exc}")
+
+    def _refresh(self) -> asyncio.Task[None]:
+        """Start a token refresh, unless one is already in flight, and return it
+
+        There is only one event loop thread, so checking and setting the in-flight
+        task cannot be interleaved: all concurrent callers share a single refresh.
+        """
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(
+                self._timed_generate_access_token()
+            )
+            self._refresh_task.add_done_callback(self._on_refresh_done)
+        return self._refresh_task
+
+    async def get_access_token(self, *, force: bool = False) -> str:
+        """Retrieve or generate access token depending on if token has expired.
+
+        When token is about to expire (within the renewal window), a refresh is
+        started in the background and current token is returned. Callers only wait
+        when there is no usable token.
+        """
         now = getnow()
-        if (
-            self._access_token is None
-            or force
-            or now >= (self._expires_at - ApiConfiguration.zimfarm_token_renewal_window)
-        ):
-            if ApiConfiguration.auth_mode == "oauth":
-                self._generate_oauth_access_token()
-            elif ApiConfiguration.auth_mode == "local":
-                self._generate_local_access_token()
-            else:
-                raise ValueError(
-                    f"Unknown cms authentication mode: {ApiConfiguration.auth_mode}. "
-                    "Allowed values are: 'local', 'oauth'"
-                )
+        if self._access_token is None or force or now >= self._expires_at:
+            # shield the shared refresh from cancellation of one of its waiters
+            await asyncio.shield(self._refresh())
+        elif now >= (self._expires_at - ApiConfiguration.zimfarm_token_renewal_window):
+            self._refresh()
         if self._access_token is None:
             raise ValueError("Failed to generate access token.")
         return self._access_token
 
+    async def invalidate(self, token: str) -> None:
+        """Renew access token after it has been rejected by the Zimfarm
+
+        Nothing is done if token has already been renewed meanwhile (e.g. because of
+        another request rejected concurrently).
+        """
+        if token == self._access_token:
+            await self.get_access_token(force=True)
+        elif self._refresh_task and not self._refresh_task.done():
+            await asyncio.shield(self._refresh_task)
+
     @property
     def access_token(self):
         return self._access_token
@@ -118,6 +213,18 @@ def get_url(path: str) -> str:
     )
 
 
+def get_path_template(path: str) -> str:
+    """Path with identifiers replaced, e.g. `/tasks/{id}/cancel`, to label metrics"""
+    segments = path.strip("/").split("/")
+    return "/" + "/".join(
+        [segments[0]]
+        + [
+            segment if PATH_WORD_PATTERN.match(segment) else "{id}"
+            for segment in segments[1:]
+        ]
+    )
+
+
 def get_token_headers(token: str) -> dict[str, str]:
     return {
         "Authorization": f"Bearer {token}",
@@ -125,11 +232,13 @@ def get_token_headers(token: str) -> dict[str, str]:
     }
 
 
-def authenticate(*, force: bool = False) -> None:
+async def authenticate(*, force: bool = False) -> None:
     logger.debug(
-        f"authenticate() with force={force}, auth_mode={ApiConfiguration.auth_mode}"
+        "authenticate() with force=%s, auth_mode=%s",
+        force,
+        ApiConfiguration.auth_mode,
     )
-    zimfarm_client_token_provider.get_access_token(force=force)
+    await zimfarm_client_token_provider.get_access_token(force=force)
 
 
 # Generic type variable for the return type of the wrapped function
@@ -139,16 +248,43 @@ R = TypeVar("R")
 P = ParamSpec("P")
 
 
-def auth_required(func: Callable[P, R]) -> Callable[P, R]:
-    def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
-        authenticate()
-        return func(*args, **kwargs)
+def auth_required(func: Callable[P, Awaitable[R]]) -> Callable[P, Awaitable[R]]:
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        await authenticate()
+        return await func(*args, **kwargs)
 
     return wrapper
 
 
+async def _send_request(
+    method: str, url: str, headers: dict[str, str], payload: Any, params: Any
+) -> httpx.Response:
+    """Send request, retrying with backoff on transient errors if safe to do so"""
+    attempt = 0
+    while True:
+        response = await http_client.request(
+            method, url=url, headers=headers, json=payload, params=params
+        )
+        if (
+            method not in IDEMPOTENT_METHODS
+            or response.status_code not in TRANSIENT_STATUSES
+            or attempt >= ApiConfiguration.zimfarm_max_retries
+        ):
+            return response
+        attempt += 1
+        logger.warning(
+            "Zimfarm replied HTTP %s to %s %s, retrying (%s/%s)",
+            response.status_code,
+            method,
+            url,
+            attempt,
+            ApiConfiguration.zimfarm_max_retries,
+        )
+        await asyncio.sleep(ApiConfiguration.zimfarm_retry_backoff * 2 ** (attempt - 1))
+
+
 @auth_required
-def query_api(
+async def query_api(
     method: str, path: str, payload: Any | None = None, params: Any | None = None
 ) -> tuple[bool, HTTPStatus, Any]:
     if not zimfarm_client_token_provider.access_token:
@@ -157,18 +293,31 @@ def query_api(
             HTTPStatus.INTERNAL_SERVER_ERROR,
             "Authentication on Zimfarm failed",
         )
+    token = await zimfarm_client_token_provider.get_access_token()
+    path_template = get_path_template(path)
+    started_on = time.perf_counter()
+    status = "error"
     try:
-        req = requests.request(
-            method.lower(),
-            url=get_url(path),
-            headers=get_token_headers(zimfarm_client_token_provider.get_access_token()),
-            json=payload,
-            params=params,
-            timeout=ApiConfiguration.zimfarm_requests_timeout,
-        )
+        with span(f"zimfarm {method.upper()} {path_template}", path=path) as call:
+            req = await _send_request(
+                method.upper(),
+                url=get_url(path),
+                headers=get_token_headers(token),
+                payload=payload,
+                params=params,
+            )
+            status = str(req.status_code)
+            call.attributes["status"] = req.status_code
     except Exception as exc:
         logger.exception(exc)
         return (False, HTTPStatus.REQUEST_TIMEOUT, f"ConnectionError -- {exc}")
+    finally:
+        request_duration.observe(
+            time.perf_counter() - started_on,
+            method=method.upper(),
+            path=path_template,
+            status=status,
+        )
 
     try:
         resp: Any = req.json() if req.text else {}
@@ -190,7 +339,7 @@ def query_api(
 
     # Unauthorised error: attempt to re-auth as scheduler might have restarted?
     if req.status_code == HTTPStatus.UNAUTHORIZED:
-        authenticate(force=True)
+        await zimfarm_client_token_provider.invalidate(token)
 
     reason = resp["error"] if "error" in resp else str(resp)
     if "error_description" in resp:
@@ -199,5 +348,5 @@ def query_api(
 
 
 @auth_required
-def test_connection():
-    return query_api(GET, "/auth/test")
+async def test_connection():
+    return await query_api(GET, "/auth/test")
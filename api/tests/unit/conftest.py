@@ -0,0 +1,90 @@
+import asyncio
+import datetime
+import inspect
+from typing import Any, cast
+
+import httpx
+import pytest
+
+from zimitfrontend import tasks, zimfarm
+
+ZIMFARM_API_URL = "https://api.zimfarm.test/v2"
+
+ZimfarmReply = tuple[int, Any]
+
+
+@pytest.fixture()
+def zimfarm_calls() -> list[str]:
+    """Requests received by the fake Zimfarm API, e.g. `GET /tasks/task1`"""
+    return []
+
+
+@pytest.fixture()
+def zimfarm_api(
+    monkeypatch: pytest.MonkeyPatch, zimfarm_calls: list[str]
+) -> dict[str, Any]:
+    """Replies of a fake Zimfarm API, by method and path, e.g. `GET /tasks/task1`
+
+    A reply is a (status, payload) tuple, a list of them returned in turn (the last
+    one being returned again afterwards), or a function of the request returning (or
+    awaitable of) such a tuple. Unknown paths are answered with a 404.
+
+    Authentication endpoints issue a new access token, valid for an hour, on each
+    call.
+    """
+
+    async def issue_token(_: httpx.Request) -> ZimfarmReply:
+        nb_tokens = sum(call.startswith("POST /auth/") for call in zimfarm_calls)
+        # let concurrent callers pile up while token is being generated
+        await asyncio.sleep(0.01)
+        return 200, {
+            "access_token": f"token{nb_tokens}",
+            "refresh_token": f"refresh{nb_tokens}",
+            "expires_time": (
+                zimfarm.getnow() + datetime.timedelta(hours=1)
+            ).isoformat(),
+        }
+
+    replies: dict[str, Any] = {
+        "POST /auth/authorize": issue_token,
+        "POST /auth/refresh": issue_token,
+    }
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        call = f"{request.method} {request.url.path.removeprefix('/v2')}"
+        zimfarm_calls.append(call)
+        reply: Any = replies.get(call, (404, {"error": "Not found"}))
+        if isinstance(reply, list):
+            replies_in_turn = cast(list[Any], reply)
+            reply = (
+                replies_in_turn.pop(0)
+                if len(replies_in_turn) > 1
+                else replies_in_turn[0]
+            )
+        if callable(reply):
+            reply = reply(request)
+            if inspect.isawaitable(reply):
+                reply = await reply
+        status, payload = reply
+        if payload is None:
+            return httpx.Response(status)
+        return httpx.Response(status, json=payload)
+
+    monkeypatch.setattr(
+        zimfarm,
+        "http_client",
+        httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+    monkeypatch.setattr(
+        zimfarm, "zimfarm_client_token_provider", zimfarm.ZimfarmClientTokenProvider()
+    )
+    monkeypatch.setattr(zimfarm.ApiConfiguration, "zimfarm_api_url", ZIMFARM_API_URL)
+    monkeypatch.setattr(zimfarm.ApiConfiguration, "auth_mode", "local")
+    monkeypatch.setattr(zimfarm.ApiConfiguration, "zimfarm_max_retries", 0)
+    monkeypatch.setattr(zimfarm.ApiConfiguration, "zimfarm_retry_backoff", 0)
+    # every lookup reaches the fake API
+    monkeypatch.setattr(tasks.ApiConfiguration, "task_cache_ttl_ongoing", 0)
+    monkeypatch.setattr(tasks.ApiConfiguration, "task_cache_ttl_ended", 0)
+    tasks.task_cache.clear()
+    tasks.task_endpoints.clear()
+    return replies
@@ -0,0 +1,41 @@
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from zimitfrontend.routes import metrics
+
+
+def test_request_metrics_middleware():
+    api = FastAPI()
+
+    @api.get("/items/{item_id}")
+    async def get_item(item_id: str) -> dict[str, str]:  # pyright: ignore
+        if item_id == "missing":
+            raise HTTPException(404)
+        return {"id": item_id}
+
+    api.add_middleware(metrics.RequestMetricsMiddleware)
+    api.include_router(metrics.router)
+    client = TestClient(api)
+
+    def get_count(**labels: str) -> int:
+        return metrics.request_duration.get_count(**labels)
+
+    counts = (
+        get_count(method="GET", route="/items/{item_id}", status="200"),
+        get_count(method="GET", route="/items/{item_id}", status="404"),
+        get_count(method="GET", route="unmatched", status="404"),
+    )
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/items/missing")
+    client.get("/nothing")
+    assert (
+        get_count(method="GET", route="/items/{item_id}", status="200"),
+        get_count(method="GET", route="/items/{item_id}", status="404"),
+        get_count(method="GET", route="unmatched", status="404"),
+    ) == (counts[0] + 2, counts[1] + 1, counts[2] + 1)
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'route="/items/{item_id}",status="200"' in response.text
+    assert "# TYPE zimfarm_request_duration_seconds histogram" in response.text
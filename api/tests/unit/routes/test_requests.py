@@ -0,0 +1,191 @@
+import asyncio
+import json
+from http import HTTPStatus
+from typing import Any
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from zimitfrontend.routes import requests
+from zimitfrontend.routes.schemas import TaskCreateRequest, TaskCreateResponse
+from zimitfrontend.task_watchers import TaskEvent
+from zimitfrontend.tracker import Tracker
+from zimitfrontend.tracker_store import MemoryTrackerStore
+
+
+@pytest.fixture()
+def created_tasks(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    """Ids of tasks actually created, a new one on every call"""
+    created_tasks: list[str] = []
+
+    async def create_task(
+        _: TaskCreateRequest, __: str
+    ) -> tuple[TaskCreateResponse, float]:
+        created_tasks.append(f"task{len(created_tasks) + 1}")
+        task_id = created_tasks[-1]
+        # let concurrent submissions pile up while task is being created
+        await asyncio.sleep(0.01)
+        return TaskCreateResponse(id=task_id, new_unique_id=None), 60
+
+    monkeypatch.setattr(requests, "_create_task", create_task)
+    requests.created_tasks.clear()
+    requests.created_task_keys.clear()
+    return created_tasks
+
+
+def get_http_request() -> Request:
+    return Request({"type": "http", "client": ("172.16.1.1", 1234)})
+
+
+def get_task_create_request(
+    url: str, unique_id: str | None = "client1"
+) -> TaskCreateRequest:
+    return TaskCreateRequest(
+        url=url, lang="en", email=None, flags={"pageLimit": 1}, unique_id=unique_id
+    )
+
+
+@pytest.mark.anyio
+async def test_create_task_is_idempotent(created_tasks: list[str]):
+    responses = await asyncio.gather(
+        *[
+            requests.create_task(
+                get_task_create_request("https://example.com"), get_http_request()
+            )
+            for _ in range(5)
+        ]
+    )
+    assert {response.id for response in responses} == {"task1"}
+
+    # same request once task has been created
+    response = await requests.create_task(
+        get_task_create_request("https://EXAMPLE.com"), get_http_request()
+    )
+    assert response.id == "task1"
+    assert len(created_tasks) == 1
+
+    # another request
+    response = await requests.create_task(
+        get_task_create_request("https://example.org"), get_http_request()
+    )
+    assert response.id == "task2"
+
+
+@pytest.mark.anyio
+async def test_create_task_replies_only_to_same_client(created_tasks: list[str]):
+    await requests.create_task(
+        get_task_create_request("https://example.com"), get_http_request()
+    )
+    # another client, possibly behind same IP address, never gets a reply to others
+    for unique_id in ("client2", None, None):
+        response = await requests.create_task(
+            get_task_create_request("https://example.com", unique_id=unique_id),
+            get_http_request(),
+        )
+        assert response.id == f"task{len(created_tasks)}"
+    assert len(created_tasks) == 4
+
+
+@pytest.mark.anyio
+async def test_create_task_with_idempotency_key(created_tasks: list[str]):
+    first = await requests.create_task(
+        get_task_create_request("https://example.com"), get_http_request(), "key1"
+    )
+    second = await requests.create_task(
+        get_task_create_request("https://example.com"), get_http_request(), "key2"
+    )
+    assert first.id != second.id
+    assert len(created_tasks) == 2
+
+
+@pytest.mark.anyio
+async def test_forget_created_task(created_tasks: list[str]):
+    await requests.create_task(
+        get_task_create_request("https://example.com"), get_http_request()
+    )
+    requests.forget_created_task("task1")
+    response = await requests.create_task(
+        get_task_create_request("https://example.com"), get_http_request()
+    )
+    assert response.id == "task2"
+    assert len(created_tasks) == 2
+
+
+@pytest.mark.anyio
+async def test_failed_creation_releases_tracker_slot(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    tracker = Tracker(MemoryTrackerStore())
+    monkeypatch.setattr(requests, "tracker", tracker)
+    with pytest.raises(HTTPException) as exc_info:
+        await requests._create_task(  # pyright: ignore
+            get_task_create_request("https://www.youtube.com/watch", unique_id=None),
+            "172.16.1.1",
+        )
+    assert exc_info.value.status_code == HTTPStatus.BAD_REQUEST
+    assert tracker.known_clients == []
+
+
+@pytest.mark.anyio
+async def test_stream_task_events(monkeypatch: pytest.MonkeyPatch):
+    queue: asyncio.Queue[TaskEvent] = asyncio.Queue()
+    unsubscribed: list[str] = []
+
+    def subscribe(_: str) -> asyncio.Queue[TaskEvent]:
+        return queue
+
+    def unsubscribe(task_id: str, _: asyncio.Queue[TaskEvent]):
+        unsubscribed.append(task_id)
+
+    monkeypatch.setattr(requests.task_watchers, "subscribe", subscribe)
+    monkeypatch.setattr(requests.task_watchers, "unsubscribe", unsubscribe)
+    monkeypatch.setattr(requests.ApiConfiguration, "task_events_keepalive", 0.01)
+
+    stream = requests._stream_task_events("task1")  # pyright: ignore
+    assert await anext(stream) == ": keepalive\n\n"
+    queue.put_nowait(TaskEvent(name="info", data={"progress": 50}))
+    queue.put_nowait(TaskEvent(name="end"))
+    assert [chunk async for chunk in stream] == [
+        'event: info\ndata: {"progress": 50}\n\n',
+        "event: end\ndata: {}\n\n",
+    ]
+    assert unsubscribed == ["task1"]
+
+
+@pytest.mark.anyio
+async def test_task_info_is_conditional(monkeypatch: pytest.MonkeyPatch):
+    task = {
+        "id": "task1",
+        "status": "started",
+        "config": {"warehouse_path": "/other", "offliner": {"seeds": "x"}},
+        "files": None,
+        "notification": None,
+        "container": {"progress": {"overall": 10}},
+        "rank": None,
+        "version": "initial",
+    }
+
+    async def get_task(_: str) -> tuple[HTTPStatus, Any]:
+        return HTTPStatus.OK, task
+
+    def get_request(if_none_match: str | None = None) -> Request:
+        headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+        return Request({"type": "http", "headers": headers})
+
+    monkeypatch.setattr(requests, "get_task", get_task)
+
+    response = await requests.task_info("task1", get_request())
+    assert response.status_code == HTTPStatus.OK
+    assert json.loads(bytes(response.body))["progress"] == 10
+    etag = response.headers["ETag"]
+
+    response = await requests.task_info("task1", get_request(etag))
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.body == b""
+    assert response.headers["ETag"] == etag
+
+    task["container"] = {"progress": {"overall": 20}}
+    response = await requests.task_info("task1", get_request(etag))
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["ETag"] != etag
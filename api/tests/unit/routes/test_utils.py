@@ -1,6 +1,7 @@
 from typing import Any
 
 import pytest
+from starlette.requests import Request
 
 from zimitfrontend.constants import ApiConfiguration
 from zimitfrontend.routes.schemas import (
@@ -12,6 +13,9 @@ from zimitfrontend.routes.schemas import (
 from zimitfrontend.routes.utils import (
     FAILED,
     SUCCESS,
+    compute_etag,
+    etag_matches,
+    get_idempotency_key,
     get_task_info,
     process_zimfarm_hook_call,
 )
@@ -136,6 +140,63 @@ from zimitfrontend.routes.utils import (
             ),
             id="no_limit_info",
         ),
+        pytest.param(
+            {
+                "id": "6341c25f-aac9-41aa-b9bb-3ddee058a0bf",
+                "config": {"warehouse_path": "/other", "offliner": {}},
+                "notification": {
+                    "ended": {
+                        "webhook": [f"{ApiConfiguration.callback_base_url}?token=abc"]
+                    }
+                },
+                "status": "bla",
+                "rank": 456,
+                "offliner": "zimit",
+                "version": "initial",
+            },
+            TaskInfo(
+                id="6341c25f-aac9-41aa-b9bb-3ddee058a0bf",
+                download_link=None,
+                partial_zim=False,
+                has_email=False,
+                status="bla",
+                flags=[],
+                progress=0,
+                rank=456,
+                offliner_definition_version="initial",
+            ),
+            id="tracking_webhook",
+        ),
+        pytest.param(
+            {
+                "id": "6341c25f-aac9-41aa-b9bb-3ddee058a0bf",
+                "config": {"warehouse_path": "/other", "offliner": {}},
+                "notification": {
+                    "ended": {
+                        "webhook": [
+                            f"{ApiConfiguration.callback_base_url}?token=abc"
+                            "&target=bob@acme.com&lang=en"
+                        ]
+                    }
+                },
+                "status": "bla",
+                "rank": 456,
+                "offliner": "zimit",
+                "version": "initial",
+            },
+            TaskInfo(
+                id="6341c25f-aac9-41aa-b9bb-3ddee058a0bf",
+                download_link=None,
+                partial_zim=False,
+                has_email=True,
+                status="bla",
+                flags=[],
+                progress=0,
+                rank=456,
+                offliner_definition_version="initial",
+            ),
+            id="email_webhook",
+        ),
     ],
 )
 def test_convert_zimfarm_task_to_info(task: Any, expected: TaskInfo):
@@ -365,3 +426,56 @@ def test_convert_hook_to_mail(
     assert result.mail_target == expected.mail_target
     assert result.mail_subject == expected.mail_subject
     assert result.mail_body == expected.mail_body
+
+
+@pytest.mark.parametrize(
+    "if_none_match,expected",
+    [
+        pytest.param(None, False, id="no_header"),
+        pytest.param('"abc"', False, id="other_etag"),
+        pytest.param(compute_etag(b"content"), True, id="same_etag"),
+        pytest.param(f"W/{compute_etag(b'content')}", True, id="weak_etag"),
+        pytest.param(f'"abc", {compute_etag(b"content")}', True, id="etag_list"),
+        pytest.param("*", True, id="wildcard"),
+    ],
+)
+def test_etag_matches(if_none_match: str | None, *, expected: bool):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    request = Request({"type": "http", "headers": headers})
+    assert etag_matches(request, compute_etag(b"content")) == expected
+
+
+def test_get_idempotency_key():
+    def get_key(
+        unique_id: str = "client1",
+        idempotency_key: str | None = None,
+        url: str = "https://Example.com/a",
+        flags: dict[str, Any] | None = None,
+        email: str | None = None,
+        lang: str = "en",
+    ) -> str:
+        return get_idempotency_key(
+            unique_id,
+            idempotency_key,
+            url,
+            {"b": 1} if flags is None else flags,
+            email,
+            lang,
+        )
+
+    key = get_key()
+    # same request, with same normalized URL and same flags in any order
+    assert key == get_key(url="https://example.com/a")
+    # another request, or another client
+    assert key != get_key(url="https://example.com/b")
+    assert key != get_key(flags={"b": 2})
+    assert key != get_key(email="user@example.com")
+    assert key != get_key(lang="fr")
+    assert key != get_key(unique_id="client2")
+    # key passed by client takes precedence, but is scoped to the client
+    assert get_key(idempotency_key="key1", flags={}) == get_key(
+        idempotency_key="key1", url="https://example.com/b", lang="fr"
+    )
+    assert get_key(idempotency_key="key1") != get_key(
+        unique_id="client2", idempotency_key="key1"
+    )
@@ -0,0 +1,156 @@
+import json
+from pathlib import Path
+from typing import Any
+
+import httpx
+import pytest
+
+from zimitfrontend.blacklist import Blacklist, BlacklistManager, get_url_hostname
+
+ENTRIES = [
+    {"host": "kiwix.org", "reason": "already_zimed"},
+    {"host": "library.kiwix.org", "reason": "self"},
+    {"host": "ted.com", "reason": "already_zimed", "libraryUrl": "https://a.b"},
+    {"host": "YouTube.com.", "reason": "too_big"},
+]
+
+
+@pytest.fixture()
+def blacklist() -> Blacklist:
+    return Blacklist(ENTRIES)
+
+
+@pytest.mark.parametrize(
+    "url, expected_host",
+    [
+        pytest.param("https://ted.com", "ted.com", id="host"),
+        pytest.param("https://www.ted.com/talks", "ted.com", id="subdomain"),
+        pytest.param("TED.com/talks", "ted.com", id="no_scheme_uppercase"),
+        pytest.param("https://ted.com.:443/", "ted.com", id="fqdn_port"),
+        pytest.param("https://user@m.youtube.com", "youtube.com", id="normalized"),
+        pytest.param("https://kiwix.org", "kiwix.org", id="parent"),
+        pytest.param("https://library.kiwix.org", "library.kiwix.org", id="specific"),
+        pytest.param("https://a.library.kiwix.org", "library.kiwix.org", id="sub"),
+        pytest.param("https://posted.com", None, id="not_label_boundary"),
+        pytest.param("https://ted.com.br", None, id="not_suffix"),
+        pytest.param("https://example.com/?u=ted.com", None, id="query_string"),
+        pytest.param("https://[invalid", None, id="invalid"),
+    ],
+)
+def test_match_url(blacklist: Blacklist, url: str, expected_host: str | None):
+    match = blacklist.match_url(url)
+    if expected_host is None:
+        assert match is None
+    else:
+        assert match
+        assert match.host == expected_host
+        assert match.entry in ENTRIES
+        assert match.reason == match.entry["reason"]
+
+
+def test_match_returns_entry(blacklist: Blacklist):
+    match = blacklist.match_host("www.ted.com")
+    assert match
+    assert match.entry == ENTRIES[2]
+    assert len(blacklist) == len(ENTRIES)
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("https://www.Example.com:8080/path", "www.example.com"),
+        ("example.com", "example.com"),
+        ("http://", None),
+    ],
+)
+def test_get_url_hostname(url: str, expected: str | None):
+    assert get_url_hostname(url) == expected
+
+
+def test_from_json_validates():
+    assert len(Blacklist.from_json(json.dumps({"blacklist": ENTRIES}).encode())) == 4
+    for invalid in [
+        {},
+        {"blacklist": [{"reason": "a"}]},
+        {"blacklist": [{"host": "."}]},
+    ]:
+        with pytest.raises(ValueError):
+            Blacklist.from_json(json.dumps(invalid).encode())
+
+
+def write_blacklist(path: Path, hosts: list[str]):
+    path.write_text(json.dumps({"blacklist": [{"host": host} for host in hosts]}))
+
+
+@pytest.mark.anyio
+async def test_manager_reloads_file_on_change(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    def failing_read_bytes(_: Path) -> bytes:
+        raise OSError("Resource temporarily unavailable")
+
+    path = tmp_path / "blacklist.json"
+    write_blacklist(path, ["example.com"])
+    manager = BlacklistManager(str(path))
+
+    assert await manager.reload()
+    assert manager.version == 1
+    assert manager.nb_entries == 1
+    assert manager.blacklist.match_host("www.example.com")
+
+    # unchanged file is not loaded again
+    assert not await manager.reload()
+    assert manager.version == 1
+
+    write_blacklist(path, ["example.com", "example.org"])
+    assert await manager.reload()
+    assert manager.version == 2
+    assert manager.blacklist.match_host("example.org")
+
+    # invalid version is not swapped in
+    path.write_text("not json")
+    with pytest.raises(ValueError):
+        await manager.reload()
+    assert manager.version == 2
+    assert manager.blacklist.match_host("example.org")
+
+    # failed read is retried even though file has not changed since
+    path.write_text("{}")
+    monkeypatch.setattr(Path, "read_bytes", failing_read_bytes)
+    with pytest.raises(OSError):
+        await manager.reload()
+    monkeypatch.undo()
+    with pytest.raises(ValueError):
+        await manager.reload()
+    write_blacklist(path, ["example.net"])
+    assert await manager.reload()
+    assert manager.version == 3
+
+
+@pytest.mark.anyio
+async def test_manager_reloads_url_on_change(monkeypatch: pytest.MonkeyPatch):
+    content = {"blacklist": [{"host": "example.com"}]}
+    requests: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        etag = f'"{len(content["blacklist"])}"'
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304)
+        return httpx.Response(200, json=content, headers={"ETag": etag})
+
+    class MockedAsyncClient(httpx.AsyncClient):
+        def __init__(self, **kwargs: Any):
+            super().__init__(transport=httpx.MockTransport(handler), **kwargs)
+
+    monkeypatch.setattr(httpx, "AsyncClient", MockedAsyncClient)
+    manager = BlacklistManager("https://example.net/blacklist.json")
+
+    assert await manager.reload()
+    assert not await manager.reload()
+    assert requests[-1].headers["If-None-Match"] == '"1"'
+
+    content["blacklist"].append({"host": "example.org"})
+    assert await manager.reload()
+    assert manager.version == 2
+    assert manager.nb_entries == 2
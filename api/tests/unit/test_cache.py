@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from zimitfrontend.cache import TTLCache
+
+
+def test_get_set():
+    cache: TTLCache[str, int] = TTLCache(maxsize=10)
+    assert cache.get("a") is None
+    cache.set("a", 1, ttl=60)
+    assert cache.get("a") == 1
+    cache.pop("a")
+    assert cache.get("a") is None
+
+
+def test_expiry():
+    cache: TTLCache[str, int] = TTLCache(maxsize=10)
+    cache.set("a", 1, ttl=0)
+    cache.set("b", 2, ttl=60)
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert len(cache) == 1
+
+
+def test_evict_least_recently_used():
+    cache: TTLCache[str, int] = TTLCache(maxsize=2)
+    cache.set("a", 1, ttl=60)
+    cache.set("b", 2, ttl=60)
+    assert cache.get("a") == 1  # a is now more recently used than b
+    cache.set("c", 3, ttl=60)
+    assert len(cache) == 2
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+@pytest.mark.anyio
+async def test_get_or_fetch_single_flight():
+    cache: TTLCache[str, int] = TTLCache(maxsize=10)
+    nb_fetches = 0
+
+    async def fetch() -> tuple[int, float]:
+        nonlocal nb_fetches
+        nb_fetches += 1
+        await asyncio.sleep(0.01)
+        return 42, 60
+
+    values = await asyncio.gather(*[cache.get_or_fetch("a", fetch) for _ in range(10)])
+    assert values == [42] * 10
+    assert nb_fetches == 1
+
+    assert await cache.get_or_fetch("a", fetch) == 42
+    assert nb_fetches == 1
+
+
+@pytest.mark.anyio
+async def test_get_or_fetch_not_cached():
+    cache: TTLCache[str, int] = TTLCache(maxsize=10)
+    nb_fetches = 0
+
+    async def fetch() -> tuple[int, float]:
+        nonlocal nb_fetches
+        nb_fetches += 1
+        return nb_fetches, 0
+
+    assert await cache.get_or_fetch("a", fetch) == 1
+    assert await cache.get_or_fetch("a", fetch) == 2
+    assert len(cache) == 0
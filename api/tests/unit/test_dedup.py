@@ -0,0 +1,113 @@
+from http import HTTPStatus
+from typing import Any
+
+import pytest
+
+from zimitfrontend import dedup
+from zimitfrontend.dedup import (
+    Subscriber,
+    attach_client,
+    detach_client,
+    find_task,
+    get_task_fingerprint,
+    pop_subscribers,
+    record_task,
+)
+
+
+@pytest.fixture()
+def tasks(monkeypatch: pytest.MonkeyPatch) -> dict[str, Any]:
+    tasks: dict[str, Any] = {}
+
+    async def get_task(task_id: str) -> tuple[HTTPStatus, Any]:
+        if task_id not in tasks:
+            return HTTPStatus.NOT_FOUND, "Not found"
+        return HTTPStatus.OK, tasks[task_id]
+
+    monkeypatch.setattr(dedup, "get_task", get_task)
+    dedup.task_ids_by_fingerprint.clear()
+    dedup.shared_tasks.clear()
+    return tasks
+
+
+def test_get_task_fingerprint():
+    flags = {"seeds": "https://example.com", "pageLimit": 1}
+    fingerprint = get_task_fingerprint(
+        {**flags, "name": "example.com_0123abcd", "zim-file": "a_0123abcd.zim"}, {}
+    )
+    # generated output names are ignored
+    assert fingerprint == get_task_fingerprint(
+        {**flags, "name": "example.com_4567cdef", "zim-file": "a_4567cdef.zim"}, {}
+    )
+    # but not flags which change what is crawled, or names requested explicitly
+    assert fingerprint != get_task_fingerprint({**flags, "pageLimit": 2}, {})
+    assert fingerprint != get_task_fingerprint(flags, {"name": "custom"})
+
+
+@pytest.mark.parametrize(
+    "status, is_found",
+    [
+        ("requested", True),
+        ("scraper_running", True),
+        ("succeeded", True),
+        ("cancel_requested", False),
+        ("failed", False),
+        ("canceled", False),
+    ],
+)
+@pytest.mark.anyio
+async def test_find_task(tasks: dict[str, Any], status: str, *, is_found: bool):
+    tasks["task1"] = {"id": "task1", "status": status}
+    record_task("fingerprint1", "task1", "client1")
+    assert (await find_task("fingerprint1") is not None) == is_found
+    assert await find_task("fingerprint2") is None
+
+
+@pytest.mark.anyio
+async def test_find_task_when_disabled(
+    tasks: dict[str, Any], monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(dedup.ApiConfiguration, "dedup_enabled", False)
+    tasks["task1"] = {"id": "task1", "status": "requested"}
+    record_task("fingerprint1", "task1", "client1")
+    assert await find_task("fingerprint1") is None
+    assert not detach_client("task1", "client1")
+
+
+@pytest.mark.anyio
+async def test_find_task_gone(tasks: dict[str, Any]):
+    record_task("fingerprint1", "task1", "client1")
+    assert await find_task("fingerprint1") is None
+    # fingerprint is forgotten
+    tasks["task1"] = {"id": "task1", "status": "requested"}
+    assert await find_task("fingerprint1") is None
+
+
+@pytest.mark.usefixtures("tasks")
+def test_attach_detach_clients():
+    record_task("fingerprint1", "task1", "client1")
+    subscriber = Subscriber(client_id="client2", email="a@example.com", lang="fr")
+    attach_client("task1", "client2", subscriber)
+    attach_client("task1", "client3", None)
+
+    # task is still needed by others when one of its clients cancels it
+    assert detach_client("task1", "client1")
+    assert detach_client("task1", "client3")
+    assert pop_subscribers("task1") == [subscriber]
+    assert pop_subscribers("task1") == []
+    assert not detach_client("task1", "client2")
+    # unknown client and task
+    assert not detach_client("task1", "client4")
+    assert not detach_client("task2", "client1")
+
+
+@pytest.mark.usefixtures("tasks")
+def test_detached_client_is_not_notified():
+    record_task("fingerprint1", "task1", "client1")
+    attach_client(
+        "task1",
+        "client2",
+        Subscriber(client_id="client2", email="a@example.com", lang="fr"),
+    )
+    assert detach_client("task1", "client2")
+    assert pop_subscribers("task1") == []
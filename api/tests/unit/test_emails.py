@@ -0,0 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from zimitfrontend import i18n
+from zimitfrontend.emails import (
+    EmailRenderer,
+    get_translation,
+    resolve_locale,
+    translate_to,
+)
+from zimitfrontend.routes.schemas import ZimfarmTask
+
+
+@pytest.fixture
+def renderer() -> EmailRenderer:
+    return EmailRenderer()
+
+
+def get_task(task_id: str, status: str) -> ZimfarmTask:
+    return ZimfarmTask.model_validate(
+        {
+            "id": task_id,
+            "status": status,
+            "config": {
+                "warehouse_path": "/other",
+                "offliner": {"seeds": "https://www.acme.com"},
+            },
+            "files": None,
+            "notification": None,
+            "container": None,
+            "rank": None,
+            "offliner": "zimit",
+            "version": "initial",
+        }
+    )
+
+
+def test_translate_to():
+    translate = translate_to("fr")
+    assert translate("email.requested.subject", taskId="6341c") == (
+        "Tâche Youzim.it 6341c demandée"
+    )
+    # missing placeholders are left as is
+    assert translate("email.requested.subject") == "Tâche Youzim.it %{taskId} demandée"
+    assert translate_to("en")("email.requested.title") == "ZIM requested!"
+
+
+def test_unknown_locales_fall_back_to_english():
+    assert resolve_locale("fr") == "fr"
+    assert resolve_locale("zh-hans") == "zh-hans"
+    assert resolve_locale("qqq") == "en"
+    assert resolve_locale("xx" * 100) == "en"
+    get_translation.cache_clear()
+    for index in range(10):
+        assert translate_to(f"xx{index}")("email.requested.title") == "ZIM requested!"
+    # translations of unknown locales are not cached separately
+    assert get_translation.cache_info().currsize == 1
+
+
+def test_render_does_not_change_global_locale(renderer: EmailRenderer):
+    i18n.change_locale("en")
+    subject, _ = renderer.render("fr", get_task("6341c25f", "requested"))
+    assert subject == "Tâche Youzim.it 6341c demandée"
+    assert i18n.t("email.requested.title") == "ZIM requested!"
+
+
+def test_render_concurrently_in_several_locales(renderer: EmailRenderer):
+    def render(index: int) -> tuple[str, str]:
+        lang = ("en", "fr")[index % 2]
+        return lang, renderer.render(lang, get_task(f"task{index:04}", "requested"))[0]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(render, range(200)))
+
+    for index, (lang, subject) in enumerate(results):
+        task_id = f"task{index:04}"[:5]
+        assert subject == (
+            f"Youzim.it task {task_id} requested"
+            if lang == "en"
+            else f"Tâche Youzim.it {task_id} demandée"
+        )
+
+
+def test_render_is_memoized(renderer: EmailRenderer):
+    requested = renderer.render("en", get_task("6341c25f", "requested"))
+    assert renderer.render("en", get_task("6341c25f", "requested")) is requested
+    assert renderer.render("fr", get_task("6341c25f", "requested")) != requested
+    assert renderer.render("en", get_task("6341c25f", "failed")) != requested
+    renderer.clear()
+    assert renderer.render("en", get_task("6341c25f", "requested")) is not requested
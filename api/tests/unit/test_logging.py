@@ -0,0 +1,120 @@
+import io
+import json
+import logging
+import queue
+import time
+
+import pytest
+
+from zimitfrontend.logging import (
+    JsonFormatter,
+    NonBlockingQueueHandler,
+    RateLimitFilter,
+    get_logger,
+    request_id,
+)
+
+
+def make_record(
+    msg: str, *args: object, name: str = "test", lineno: int = 0
+) -> logging.LogRecord:
+    return logging.LogRecord(name, logging.WARNING, "", lineno, msg, args, None)
+
+
+def test_rate_limit_filter(monkeypatch: pytest.MonkeyPatch):
+    now = 1000.0
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    rate_limit = RateLimitFilter(rate=2, interval=60)
+
+    passed = [
+        rate_limit.filter(make_record("Unable to find task %s", task_id))
+        for task_id in range(5)
+    ]
+    assert passed == [True, True, False, False, False]
+    # other messages, loggers and call sites are limited separately
+    assert rate_limit.filter(make_record("Other"))
+    assert rate_limit.filter(make_record("Unable to find task %s", 1, name="other"))
+    assert rate_limit.filter(make_record("Unable to find task %s", 1, lineno=10))
+    assert rate_limit.suppressed == 3
+
+    now += 60
+    record = make_record("Unable to find task %s", 6)
+    assert rate_limit.filter(record)
+    assert record.getMessage() == (
+        "Unable to find task 6 (3 similar message(s) suppressed)"
+    )
+
+
+def test_rate_limit_filter_forgets_least_recent_messages(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(time, "monotonic", lambda: 1000.0)
+    monkeypatch.setattr(RateLimitFilter, "max_tracked", 2)
+    rate_limit = RateLimitFilter(rate=1, interval=60)
+    assert rate_limit.filter(make_record("first"))
+    assert rate_limit.filter(make_record("second"))
+    assert not rate_limit.filter(make_record("first"))
+    # tracking is capped, even when all messages are within the current interval
+    assert rate_limit.filter(make_record("third"))
+    assert len(rate_limit._windows) == 2  # pyright: ignore
+    assert not rate_limit.filter(make_record("first"))
+    # second was the least recently logged, it has been forgotten
+    assert rate_limit.filter(make_record("second"))
+
+
+def test_json_formatter():
+    token = request_id.set("req1")
+    try:
+        record = make_record("Task %s failed", "task1")
+        get_logger("json", console=None).handlers[0].filter(record)
+    finally:
+        request_id.reset(token)
+    try:
+        raise ValueError("boom")
+    except ValueError as exc:
+        record.exc_info = (type(exc), exc, exc.__traceback__)
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["level"] == "WARNING"
+    assert entry["logger"] == "test"
+    assert entry["message"] == "Task task1 failed"
+    assert entry["request_id"] == "req1"
+    assert "ValueError: boom" in entry["exception"]
+
+
+def test_queue_handler_drops_records_when_full():
+    records: queue.Queue[logging.LogRecord] = queue.Queue(maxsize=2)
+    handler = NonBlockingQueueHandler(records)
+    for index in range(4):
+        handler.handle(make_record("message %s", index))
+    assert handler.dropped == 2
+    assert [records.get_nowait().getMessage() for _ in range(2)] == [
+        "message 0",
+        "message 1",
+    ]
+
+    handler.handle(make_record("message %s", 4))
+    assert [records.get_nowait().getMessage() for _ in range(2)] == [
+        "message 4",
+        "2 log record(s) dropped, log queue was full",
+    ]
+
+
+def test_get_logger_with_queue():
+    console = io.StringIO()
+    logger = get_logger(
+        "queued", console=console, json_output=True, queue_size=10, rate_limit=1
+    )
+    token = request_id.set("req1")
+    try:
+        for index in range(3):
+            logger.warning("Unable to find task %s", index)
+    finally:
+        request_id.reset(token)
+    (handler,) = logger.handlers
+    assert isinstance(handler, NonBlockingQueueHandler)
+    deadline = time.monotonic() + 1
+    while not console.getvalue() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    (entry,) = (json.loads(line) for line in console.getvalue().splitlines())
+    assert entry["message"] == "Unable to find task 0"
+    assert entry["request_id"] == "req1"
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import time
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+
+from zimitfrontend import mailer
+from zimitfrontend.mailer import Mailer, MailJob
+
+
+def get_sender(sent: list[MailJob], nb_failures: int = 0, delay: float = 0):
+    """Stand-in for Mailgun, failing the given number of first sends"""
+    nb_calls = 0
+
+    async def send(jobs: list[MailJob]) -> str:
+        nonlocal nb_calls
+        nb_calls += 1
+        await asyncio.sleep(delay)
+        if nb_calls <= nb_failures:
+            raise Exception("Bad gateway")
+        sent.extend(jobs)
+        return f"<{nb_calls}@mg>"
+
+    return send
+
+
+@pytest.fixture(autouse=True)
+def mail_config(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(mailer.ApiConfiguration, "mail_retry_backoff", 0)
+    monkeypatch.setattr(mailer.ApiConfiguration, "mail_max_attempts", 3)
+    monkeypatch.setattr(mailer.ApiConfiguration, "mail_workers", 2)
+
+
+def get_job(index: int = 0, task_id: int | None = None) -> MailJob:
+    task_id = index if task_id is None else task_id
+    return MailJob(
+        to=f"bob{index}@acme.com",
+        subject=f"Task {task_id} ended",
+        body=f"<p>Task {task_id} done</p>",
+    )
+
+
+@pytest.mark.anyio
+async def test_mailer_sends_queued_mails():
+    sent: list[MailJob] = []
+    queue = Mailer(send=get_sender(sent))
+    for index in range(5):
+        assert queue.enqueue(get_job(index))
+    assert queue.depth == 5
+    queue.start()
+    await queue.stop(timeout=1)
+    assert queue.depth == 0
+    assert sorted(job.to for job in sent) == [
+        f"bob{index}@acme.com" for index in range(5)
+    ]
+    assert queue.metrics.enqueued == 5
+    assert queue.metrics.sent == 5
+    assert queue.metrics.retried == 0
+
+
+@pytest.mark.anyio
+async def test_mailer_retries_failed_sends():
+    sent: list[MailJob] = []
+    queue = Mailer(send=get_sender(sent, nb_failures=2))
+    queue.start()
+    queue.enqueue(get_job())
+    await queue.stop(timeout=1)
+    assert len(sent) == 1
+    assert sent[0].attempts == 3
+    assert queue.metrics.retried == 2
+    assert queue.metrics.sent == 1
+    assert len(queue.dead_letters) == 0
+
+
+@pytest.mark.anyio
+async def test_mailer_keeps_sending_while_waiting_for_retry(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(mailer.ApiConfiguration, "mail_retry_backoff", 0.2)
+    monkeypatch.setattr(mailer.ApiConfiguration, "mail_workers", 1)
+    sent: list[MailJob] = []
+    queue = Mailer(send=get_sender(sent, nb_failures=1))
+    queue.start()
+    queue.enqueue(get_job(0))
+    queue.enqueue(get_job(1))
+    await asyncio.sleep(0.1)
+    # only worker is not stuck waiting to retry first mail
+    assert [job.to for job in sent] == ["bob1@acme.com"]
+    assert queue.depth == 1
+    await queue.stop(timeout=1)
+    assert [job.to for job in sent] == ["bob1@acme.com", "bob0@acme.com"]
+    assert queue.depth == 0
+
+
+@pytest.mark.anyio
+async def test_mailer_skips_mails_when_mailgun_is_not_configured():
+    async def send(jobs: list[MailJob]) -> None:  # noqa: ARG001
+        return None
+
+    queue = Mailer(send=send)
+    queue.start()
+    queue.enqueue(get_job())
+    await queue.stop(timeout=1)
+    assert queue.metrics.skipped == 1
+    assert queue.metrics.sent == 0
+    assert queue.metrics.batches == 0
+
+
+@pytest.mark.anyio
+async def test_mailer_dead_letters_mails_failing_too_often():
+    sent: list[MailJob] = []
+    queue = Mailer(send=get_sender(sent, nb_failures=3))
+    queue.start()
+    queue.enqueue(get_job())
+    await queue.stop(timeout=1)
+    assert sent == []
+    assert queue.metrics.failed == 1
+    assert [(job.to, job.attempts, job.error) for job in queue.dead_letters] == [
+        ("bob0@acme.com", 3, "Bad gateway")
+    ]
+
+
+@pytest.mark.anyio
+async def test_mailer_rejects_mails_when_full(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(mailer.ApiConfiguration, "mail_queue_size", 2)
+    queue = Mailer(send=get_sender([]))
+    assert queue.enqueue(get_job(0))
+    assert queue.enqueue(get_job(1))
+    assert not queue.enqueue(get_job(2))
+    assert queue.depth == 2
+    assert queue.metrics.rejected == 1
+    assert [job.to for job in queue.dead_letters] == ["bob2@acme.com"]
+
+
+@pytest.mark.anyio
+async def test_mailer_stop_does_not_wait_forever():
+    sent: list[MailJob] = []
+    queue = Mailer(send=get_sender(sent, delay=10))
+    queue.start()
+    for index in range(3):
+        queue.enqueue(get_job(index))
+    await queue.stop(timeout=0.1)
+    assert sent == []
+    # third mail was never picked by the two workers
+    assert queue.depth == 1
+
+
+@pytest.mark.anyio
+async def test_mailer_batches_identical_mails(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(mailer.ApiConfiguration, "mail_batch_size", 3)
+    batches: list[list[MailJob]] = []
+
+    async def send(jobs: list[MailJob]) -> str:
+        batches.append(jobs)
+        return "<1@mg>"
+
+    queue = Mailer(send=send)
+    queue.enqueue(get_job(0, task_id=1))
+    queue.enqueue(get_job(1, task_id=1))
+    # already waiting for this recipient
+    queue.enqueue(get_job(0, task_id=1))
+    queue.enqueue(get_job(2, task_id=1))
+    # batch is full
+    queue.enqueue(get_job(3, task_id=1))
+    queue.enqueue(get_job(0, task_id=2))
+    assert queue.depth == 5
+    queue.start()
+    await queue.stop(timeout=1)
+    assert queue.depth == 0
+    assert len(batches) == 3
+    assert queue.metrics.batches == 3
+    assert queue.metrics.sent == 5
+    assert sorted((job.subject, job.to) for batch in batches for job in batch) == [
+        ("Task 1 ended", "bob0@acme.com"),
+        ("Task 1 ended", "bob1@acme.com"),
+        ("Task 1 ended", "bob2@acme.com"),
+        ("Task 1 ended", "bob3@acme.com"),
+        ("Task 2 ended", "bob0@acme.com"),
+    ]
+
+
+@pytest.mark.anyio
+async def test_rate_limiter_spreads_messages():
+    rate_limiter = mailer.RateLimiter(rate=100)
+    started_on = time.monotonic()
+    await asyncio.gather(*[rate_limiter.acquire(5) for _ in range(3)])
+    # first call is not delayed, last one waits for the 10 messages before it
+    assert 0.1 <= time.monotonic() - started_on < 0.5
+
+
+@pytest.mark.anyio
+async def test_send_via_mailgun(monkeypatch: pytest.MonkeyPatch):
+    requests: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"id": "<123@mg>", "message": "Queued"})
+
+    monkeypatch.setattr(
+        mailer,
+        "mailgun_client",
+        httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+    monkeypatch.setattr(mailer, "rate_limiter", mailer.RateLimiter(rate=0))
+    monkeypatch.setattr(mailer.ApiConfiguration, "mailgun_api_key", "key")
+
+    assert await mailer.send_via_mailgun([get_job(0)]) == "<123@mg>"
+    assert await mailer.send_via_mailgun([get_job(0), get_job(1, task_id=0)]) == (
+        "<123@mg>"
+    )
+    single, batch = (parse_qs(request.content.decode()) for request in requests)
+    assert single["to"] == ["bob0@acme.com"]
+    assert single["subject"] == ["Task 0 ended"]
+    assert "recipient-variables" not in single
+    assert batch["to"] == ["bob0@acme.com", "bob1@acme.com"]
+    assert json.loads(batch["recipient-variables"][0]) == {
+        "bob0@acme.com": {},
+        "bob1@acme.com": {},
+    }
@@ -0,0 +1,77 @@
+import pytest
+
+from zimitfrontend.metrics import CallbackCounter, Counter, Gauge, Histogram, Registry
+
+
+@pytest.fixture
+def registry() -> Registry:
+    return Registry()
+
+
+def test_counter(registry: Registry):
+    counter = Counter("hits_total", "Hits", ("source",), registry=registry)
+    counter.inc(source="create")
+    counter.inc(2, source="check")
+    counter.inc(source="create")
+    assert counter.get(source="create") == 2
+    assert registry.render() == (
+        "# HELP hits_total Hits\n"
+        "# TYPE hits_total counter\n"
+        'hits_total{source="check"} 2\n'
+        'hits_total{source="create"} 2\n'
+    )
+
+
+def test_counter_requires_its_labels(registry: Registry):
+    counter = Counter("hits_total", "Hits", ("source",), registry=registry)
+    with pytest.raises(ValueError):
+        counter.inc()
+    with pytest.raises(ValueError):
+        counter.inc(source="create", other="value")
+
+
+def test_metric_names_are_unique(registry: Registry):
+    Counter("hits_total", "Hits", registry=registry)
+    with pytest.raises(ValueError):
+        Gauge("hits_total", "Hits", registry=registry)
+
+
+def test_callback_metrics(registry: Registry):
+    values = {"depth": 3, "sent": 10}
+    Gauge("depth", "Depth", function=lambda: values["depth"], registry=registry)
+    CallbackCounter("sent_total", "Sent", lambda: values["sent"], registry=registry)
+    values["depth"] = 4
+    assert registry.render() == (
+        "# HELP depth Depth\n"
+        "# TYPE depth gauge\n"
+        "depth 4\n"
+        "# HELP sent_total Sent\n"
+        "# TYPE sent_total counter\n"
+        "sent_total 10\n"
+    )
+
+
+def test_histogram(registry: Registry):
+    histogram = Histogram(
+        "duration_seconds",
+        "Duration",
+        ("path",),
+        buckets=(0.1, 1),
+        registry=registry,
+    )
+    histogram.observe(0.05, path='/a"b')
+    histogram.observe(0.5, path='/a"b')
+    histogram.observe(2, path='/a"b')
+    with histogram.time(path="/c"):
+        pass
+    assert histogram.get_count(path='/a"b') == 3
+    assert histogram.get_count(path="/c") == 1
+    assert registry.render().splitlines()[:7] == [
+        "# HELP duration_seconds Duration",
+        "# TYPE duration_seconds histogram",
+        'duration_seconds_bucket{path="/a\\"b",le="0.1"} 1',
+        'duration_seconds_bucket{path="/a\\"b",le="1"} 2',
+        'duration_seconds_bucket{path="/a\\"b",le="+Inf"} 3',
+        'duration_seconds_sum{path="/a\\"b"} 2.55',
+        'duration_seconds_count{path="/a\\"b"} 3',
+    ]
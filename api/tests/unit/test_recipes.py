@@ -0,0 +1,169 @@
+import asyncio
+import time
+from http import HTTPStatus
+from typing import Any
+
+import httpx
+import pytest
+
+from zimitfrontend import recipes
+from zimitfrontend.recipes import (
+    JanitorMetrics,
+    RecipeJournal,
+    pending_deletions,
+    schedule_recipe_deletion,
+    wait_pending_deletions,
+)
+
+
+@pytest.fixture()
+def zimfarm_recipes(
+    zimfarm_api: dict[str, Any], monkeypatch: pytest.MonkeyPatch
+) -> list[str]:
+    """Names of recipes on the fake Zimfarm"""
+    recipe_names: list[str] = []
+
+    def list_recipes(request: httpx.Request) -> tuple[int, Any]:
+        skip, limit = int(request.url.params["skip"]), int(request.url.params["limit"])
+        return HTTPStatus.OK, {
+            "meta": {"count": len(recipe_names), "skip": skip},
+            "items": [{"name": name} for name in recipe_names[skip : skip + limit]],
+        }
+
+    zimfarm_api["GET /recipes"] = list_recipes
+    monkeypatch.setattr(recipes, "journal", RecipeJournal(":memory:"))
+    monkeypatch.setattr(recipes, "metrics", JanitorMetrics())
+    monkeypatch.setattr(recipes, "RECIPES_PAGE_SIZE", 2)
+    monkeypatch.setattr(recipes.ApiConfiguration, "recipe_delete_retry_backoff", 0)
+    monkeypatch.setattr(recipes.ApiConfiguration, "recipe_delete_max_attempts", 3)
+    return recipe_names
+
+
+def get_recipe_deleter(recipe_names: list[str], name: str, delay: float = 0):
+    async def delete_recipe(_: httpx.Request) -> tuple[int, Any]:
+        await asyncio.sleep(delay)
+        if name not in recipe_names:
+            return HTTPStatus.NOT_FOUND, {"error": "Not found"}
+        recipe_names.remove(name)
+        return HTTPStatus.NO_CONTENT, None
+
+    return delete_recipe
+
+
+def get_deletes(zimfarm_calls: list[str]) -> list[str]:
+    return [call for call in zimfarm_calls if call.startswith("DELETE ")]
+
+
+@pytest.mark.anyio
+async def test_delete_recipe_retries(
+    zimfarm_api: dict[str, Any], zimfarm_recipes: list[str], zimfarm_calls: list[str]
+):
+    zimfarm_recipes.append("recipe1")
+    zimfarm_api["DELETE /recipes/recipe1"] = [
+        (HTTPStatus.BAD_GATEWAY, {"error": "Bad gateway"}),
+        (HTTPStatus.BAD_GATEWAY, {"error": "Bad gateway"}),
+        get_recipe_deleter(zimfarm_recipes, "recipe1"),
+    ]
+    recipes.record_recipe("recipe1")
+    assert await recipes.delete_recipe("recipe1")
+    assert get_deletes(zimfarm_calls) == ["DELETE /recipes/recipe1"] * 3
+    assert zimfarm_recipes == []
+    assert "recipe1" not in recipes.journal
+    assert recipes.metrics.recipes_deleted == 1
+
+
+@pytest.mark.anyio
+async def test_delete_recipe_gives_up(
+    zimfarm_api: dict[str, Any], zimfarm_recipes: list[str], zimfarm_calls: list[str]
+):
+    zimfarm_recipes.append("recipe1")
+    zimfarm_api["DELETE /recipes/recipe1"] = (
+        HTTPStatus.BAD_GATEWAY,
+        {"error": "Bad gateway"},
+    )
+    recipes.record_recipe("recipe1")
+    assert not await recipes.delete_recipe("recipe1")
+    assert len(get_deletes(zimfarm_calls)) == 3
+    # kept in journal, for next sweep
+    assert "recipe1" in recipes.journal
+    assert recipes.metrics.recipes_delete_failures == 1
+
+
+@pytest.mark.anyio
+async def test_schedule_recipe_deletion(
+    zimfarm_api: dict[str, Any], zimfarm_recipes: list[str], zimfarm_calls: list[str]
+):
+    zimfarm_recipes.append("recipe1")
+    zimfarm_api["DELETE /recipes/recipe1"] = get_recipe_deleter(
+        zimfarm_recipes, "recipe1", delay=0.01
+    )
+    task = schedule_recipe_deletion("recipe1")
+    # already scheduled deletion is not duplicated
+    assert schedule_recipe_deletion("recipe1") is task
+    assert "recipe1" in pending_deletions
+
+    assert await task
+    await asyncio.sleep(0)
+    assert pending_deletions == {}
+    assert len(get_deletes(zimfarm_calls)) == 1
+
+
+@pytest.mark.anyio
+async def test_wait_pending_deletions(
+    zimfarm_api: dict[str, Any], zimfarm_recipes: list[str]
+):
+    zimfarm_api["DELETE /recipes/recipe1"] = get_recipe_deleter(
+        zimfarm_recipes, "recipe1", delay=10
+    )
+    task = schedule_recipe_deletion("recipe1")
+    await wait_pending_deletions(timeout=0.01)
+    assert task.cancelled()
+    await asyncio.sleep(0)
+    assert pending_deletions == {}
+
+
+@pytest.mark.anyio
+async def test_sweep(
+    zimfarm_api: dict[str, Any],
+    zimfarm_recipes: list[str],
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(recipes.ApiConfiguration, "recipe_max_age", 60)
+    zimfarm_recipes.extend(
+        [
+            # in journal for long, e.g. after a crash
+            "zimit-frontend_old.example.com_0123abcd",
+            # in journal, task being requested
+            "zimit-frontend_new.example.com_4567cdef",
+            # unknown, e.g. journal lost on restart
+            "zimit-frontend_lost.example.com_89abcdef",
+            "manual_recipe",  # not one of ours
+            "example.com_0123abcd",  # not one of ours, e.g. another deployment
+        ]
+    )
+    for name in [*zimfarm_recipes, "zimit-frontend_gone.example.com_01234567"]:
+        zimfarm_api[f"DELETE /recipes/{name}"] = get_recipe_deleter(
+            zimfarm_recipes, name
+        )
+    recipes.journal.record("zimit-frontend_old.example.com_0123abcd", time.time() - 120)
+    recipes.journal.record("zimit-frontend_new.example.com_4567cdef")
+    recipes.journal.record(
+        "zimit-frontend_gone.example.com_01234567", time.time() - 120
+    )
+
+    await recipes.sweep()
+    assert zimfarm_recipes == [
+        "zimit-frontend_new.example.com_4567cdef",
+        "zimit-frontend_lost.example.com_89abcdef",
+        "manual_recipe",
+        "example.com_0123abcd",
+    ]
+    assert recipes.metrics.recipes_reclaimed == 2
+    assert "zimit-frontend_lost.example.com_89abcdef" in recipes.journal
+
+    # recipe left behind is reclaimed once old enough
+    monkeypatch.setattr(recipes.ApiConfiguration, "recipe_max_age", -1)
+    await recipes.sweep()
+    assert zimfarm_recipes == ["manual_recipe", "example.com_0123abcd"]
+    assert len(recipes.journal) == 0
+    assert recipes.metrics.sweeps == 2
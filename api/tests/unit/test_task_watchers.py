@@ -0,0 +1,134 @@
+import asyncio
+from http import HTTPStatus
+from typing import Any
+
+import pytest
+
+from zimitfrontend import task_watchers
+from zimitfrontend.task_watchers import TaskEvent, subscribe, unsubscribe
+
+
+def get_task(status: str, progress: int | None = None) -> dict[str, Any]:
+    return {
+        "id": "task1",
+        "status": status,
+        "config": {"warehouse_path": "/other", "offliner": {"seeds": "x"}},
+        "files": None,
+        "notification": None,
+        "container": {"progress": {"overall": progress}},
+        "rank": None,
+        "version": "initial",
+    }
+
+
+@pytest.fixture()
+def task_replies(
+    zimfarm_api: dict[str, Any], monkeypatch: pytest.MonkeyPatch
+) -> list[tuple[HTTPStatus, Any]]:
+    """Replies of the fake Zimfarm to task lookups, in turn, then the last one"""
+    replies: list[tuple[HTTPStatus, Any]] = []
+    zimfarm_api["GET /tasks/task1"] = replies
+    monkeypatch.setattr(task_watchers.ApiConfiguration, "task_events_interval", 0.01)
+    monkeypatch.setattr(task_watchers, "watchers", {})
+    return replies
+
+
+def get_nb_lookups(zimfarm_calls: list[str]) -> int:
+    return zimfarm_calls.count("GET /tasks/task1")
+
+
+async def get_events(queue: asyncio.Queue[TaskEvent]) -> list[TaskEvent]:
+    events: list[TaskEvent] = []
+    while not events or events[-1].name != "end":
+        events.append(await asyncio.wait_for(queue.get(), timeout=1))
+    return events
+
+
+@pytest.mark.anyio
+async def test_watcher_publishes_changes_until_task_ends(
+    task_replies: list[tuple[HTTPStatus, Any]], zimfarm_calls: list[str]
+):
+    task_replies += [
+        (HTTPStatus.OK, get_task("requested")),
+        (HTTPStatus.OK, get_task("started", 10)),
+        (HTTPStatus.OK, get_task("started", 10)),
+        (HTTPStatus.BAD_GATEWAY, {"error": "Bad gateway"}),
+        (HTTPStatus.OK, get_task("started", 50)),
+        (HTTPStatus.OK, get_task("succeeded", 100)),
+    ]
+    first, second = subscribe("task1"), subscribe("task1")
+    # a single watcher for both subscribers
+    assert len(task_watchers.watchers) == 1
+
+    events = await get_events(first)
+    assert await get_events(second) == events
+    assert [event.name for event in events] == [
+        "info",
+        "info",
+        "upstream_error",
+        "info",
+        "info",
+        "end",
+    ]
+    assert events[0].data["status"] == "requested"
+    assert events[0].data["offlinerDefinitionVersion"] == "initial"
+    assert events[1].data == {"status": "started", "progress": 10}
+    assert events[2].data["status"] == HTTPStatus.BAD_GATEWAY
+    assert events[3].data == {"progress": 50}
+    assert events[4].data == {"status": "succeeded", "progress": 100}
+    assert get_nb_lookups(zimfarm_calls) == 6
+
+    unsubscribe("task1", first)
+    assert len(task_watchers.watchers) == 1
+    unsubscribe("task1", second)
+    assert task_watchers.watchers == {}
+
+
+@pytest.mark.anyio
+async def test_watcher_sends_whole_info_to_late_subscribers(
+    task_replies: list[tuple[HTTPStatus, Any]], zimfarm_calls: list[str]
+):
+    task_replies += [(HTTPStatus.OK, get_task("succeeded", 100))]
+    first = subscribe("task1")
+    await get_events(first)
+    events = await get_events(subscribe("task1"))
+    assert [event.name for event in events] == ["info", "end"]
+    assert events[0].data["status"] == "succeeded"
+    assert events[0].data["id"] == "task1"
+    assert get_nb_lookups(zimfarm_calls) == 1
+
+
+@pytest.mark.anyio
+async def test_watcher_ends_when_task_is_not_found(
+    task_replies: list[tuple[HTTPStatus, Any]]
+):
+    task_replies.append((HTTPStatus.NOT_FOUND, {"error": "Not found"}))
+    events = await get_events(subscribe("task1"))
+    assert [event.name for event in events] == ["upstream_error", "end"]
+
+
+@pytest.mark.anyio
+async def test_watcher_is_stopped_without_subscribers(
+    task_replies: list[tuple[HTTPStatus, Any]], zimfarm_calls: list[str]
+):
+    task_replies += [(HTTPStatus.OK, get_task("started", 10))]
+    queue = subscribe("task1")
+    watcher = task_watchers.watchers["task1"]
+    await asyncio.wait_for(queue.get(), timeout=1)
+    unsubscribe("task1", queue)
+    assert task_watchers.watchers == {}
+    await asyncio.sleep(0.05)
+    assert watcher._task and watcher._task.cancelled()  # pyright: ignore
+    nb_lookups = get_nb_lookups(zimfarm_calls)
+    await asyncio.sleep(0.05)
+    assert get_nb_lookups(zimfarm_calls) == nb_lookups
+
+
+@pytest.mark.anyio
+async def test_stop_watchers_ends_streams(task_replies: list[tuple[HTTPStatus, Any]]):
+    task_replies += [(HTTPStatus.OK, get_task("started", 10))]
+    queue = subscribe("task1")
+    assert (await asyncio.wait_for(queue.get(), timeout=1)).name == "info"
+    await task_watchers.stop_watchers()
+    assert [event.name for event in await get_events(queue)] == ["end"]
+    assert task_watchers.watchers == {}
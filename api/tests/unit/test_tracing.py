@@ -0,0 +1,137 @@
+import json
+import logging
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from zimitfrontend import tracing
+from zimitfrontend.logging import RequestIdFilter, request_id
+from zimitfrontend.tracing import (
+    REQUEST_ID_HEADER,
+    JsonLinesExporter,
+    TracingMiddleware,
+    span,
+    traced,
+)
+
+
+@pytest.fixture()
+def spans_path(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Path]:
+    path = tmp_path / "spans.jsonl"
+    exporter = JsonLinesExporter(path)
+    monkeypatch.setattr(tracing, "exporter", exporter)
+    yield path
+    exporter.stop()
+
+
+def read_spans(path: Path) -> list[dict[str, Any]]:
+    if tracing.exporter:
+        tracing.exporter.flush()
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_span_nesting(spans_path: Path):
+    with span("parent", key="value") as parent:
+        with span("child") as child:
+            assert child.parent_id == parent.span_id
+            assert child.trace_id == parent.trace_id
+    with span("other") as other:
+        assert other.parent_id is None
+        assert other.trace_id != parent.trace_id
+
+    spans = read_spans(spans_path)
+    assert [item["name"] for item in spans] == ["child", "parent", "other"]
+    assert spans[1]["attributes"] == {"key": "value"}
+    assert all(item["duration"] >= 0 for item in spans)
+
+
+def test_span_uses_request_id_as_trace_id(spans_path: Path):  # noqa: ARG001
+    token = request_id.set("req1")
+    try:
+        with span("call") as call:
+            assert call.trace_id == "req1"
+    finally:
+        request_id.reset(token)
+
+
+def test_span_records_error(spans_path: Path):
+    with pytest.raises(ValueError):
+        with span("failing"):
+            raise ValueError("boom")
+    (failing,) = read_spans(spans_path)
+    assert failing["status"] == "error"
+    assert failing["attributes"]["error"] == "ValueError('boom')"
+
+
+@pytest.mark.anyio
+async def test_traced(spans_path: Path):
+    @traced("sync_func")
+    def sync_func(value: int) -> int:
+        return value + 1
+
+    @traced("async_func")
+    async def async_func(value: int) -> int:
+        return sync_func(value) * 2
+
+    assert await async_func(1) == 4
+    sync_span, async_span = read_spans(spans_path)
+    assert (sync_span["name"], async_span["name"]) == ("sync_func", "async_func")
+    assert sync_span["parent_id"] == async_span["span_id"]
+
+
+def test_middleware(spans_path: Path):
+    app = FastAPI()
+    app.add_middleware(TracingMiddleware)
+
+    def get_item(item_id: str) -> dict[str, str | None]:
+        with span("lookup"):
+            return {"item_id": item_id, "request_id": request_id.get()}
+
+    app.add_api_route("/items/{item_id}", get_item, methods=["GET"])
+
+    client = TestClient(app)
+    response = client.get("/items/abc", headers={REQUEST_ID_HEADER: "client-id-1"})
+    # id passed by client is kept, but prefixed so that it cannot be chosen
+    current_request_id = response.headers[REQUEST_ID_HEADER]
+    assert current_request_id.endswith("-client-id-1")
+    assert current_request_id != "client-id-1"
+    assert response.json() == {"item_id": "abc", "request_id": current_request_id}
+
+    # unsafe ids are replaced
+    response = client.get("/items/abc", headers={REQUEST_ID_HEADER: "bad id\n"})
+    generated_id = response.headers[REQUEST_ID_HEADER]
+    assert generated_id != "bad id\n"
+    assert response.json()["request_id"] == generated_id
+
+    lookup, root, _, _ = read_spans(spans_path)
+    assert root["name"] == "GET /items/{item_id}"
+    assert root["trace_id"] == current_request_id
+    assert root["attributes"] == {"status": 200}
+    assert lookup["parent_id"] == root["span_id"]
+
+
+def test_exporter_drops_spans_when_queue_is_full(tmp_path: Path):
+    exporter = JsonLinesExporter(tmp_path / "spans.jsonl", queue_size=1)
+    exporter.stop()
+    # writer thread is gone, so queue is not drained anymore
+    for index in range(3):
+        exporter.export(
+            tracing.Span(trace_id="t", span_id=str(index), name="s", start=0)
+        )
+    assert exporter.dropped == 2
+
+
+def test_request_id_filter():
+    record = logging.LogRecord("test", logging.INFO, "", 0, "message", None, None)
+    assert RequestIdFilter().filter(record)
+    assert record.request_id_prefix == ""  # pyright: ignore
+    token = request_id.set("req1")
+    try:
+        RequestIdFilter().filter(record)
+    finally:
+        request_id.reset(token)
+    assert record.request_id_prefix == "[req1] "  # pyright: ignore
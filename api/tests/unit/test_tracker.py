@@ -1,3 +1,7 @@
+import asyncio
+import time
+from pathlib import Path
+
 import pytest
 
 from zimitfrontend.constants import ApiConfiguration
@@ -8,6 +12,11 @@ from zimitfrontend.tracker import (
     generate_unique_id,
     is_valid_unique_id,
 )
+from zimitfrontend.tracker_store import (
+    MemoryTrackerStore,
+    SQLiteTrackerStore,
+    TrackerStore,
+)
 
 CLIENT_1_IP = "172.16.1.1"
 CLIENT_1_ID = (
@@ -55,9 +64,16 @@ TASK_ID7 = "task_id7"
 TASK_ID8 = "task_id8"
 
 
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request: pytest.FixtureRequest, tmp_path: Path) -> TrackerStore:
+    if request.param == "sqlite":
+        return SQLiteTrackerStore(tmp_path / "tracker.db")
+    return MemoryTrackerStore()
+
+
 @pytest.fixture()
-def tracker() -> Tracker:
-    tracker = Tracker()
+def tracker(store: TrackerStore) -> Tracker:
+    tracker = Tracker(store)
     # known digest key for tests
     ApiConfiguration.digest_key = bytes.fromhex("723a207d91341918")
     # test initial status
@@ -65,27 +81,24 @@ def tracker() -> Tracker:
         ClientInfo(
             ip_address=CLIENT_1_IP,
             unique_id=CLIENT_1_ID,
-            ongoing_tasks=[TASK_ID4, TASK_ID1],
+            ongoing_tasks={TASK_ID4, TASK_ID1},
         ),
         ClientInfo(
-            ip_address=CLIENT_3_IP, unique_id=CLIENT_3_ID, ongoing_tasks=[TASK_ID2]
+            ip_address=CLIENT_3_IP, unique_id=CLIENT_3_ID, ongoing_tasks={TASK_ID2}
         ),
         ClientInfo(
-            ip_address=CLIENT_4_IP, unique_id=CLIENT_4_ID1, ongoing_tasks=[TASK_ID5]
+            ip_address=CLIENT_4_IP, unique_id=CLIENT_4_ID1, ongoing_tasks={TASK_ID5}
         ),
         ClientInfo(  # two unique IDs for one IP, this is a bug
-            ip_address=CLIENT_4_IP, unique_id=CLIENT_4_ID2, ongoing_tasks=[TASK_ID6]
+            ip_address=CLIENT_4_IP, unique_id=CLIENT_4_ID2, ongoing_tasks={TASK_ID6}
         ),
         ClientInfo(
-            ip_address=CLIENT_5_IP1, unique_id=CLIENT_5_ID, ongoing_tasks=[TASK_ID7]
-        ),
-        ClientInfo(  # two client IPs for one unique ID, this is a bug
-            ip_address=CLIENT_5_IP1, unique_id=CLIENT_5_ID, ongoing_tasks=[TASK_ID8]
+            ip_address=CLIENT_5_IP1, unique_id=CLIENT_5_ID, ongoing_tasks={TASK_ID7}
         ),
     ]
 
     # test logic to get which ongoing task has already finished
-    def custom_ongoing_task_has_finished(task_id: str):
+    async def custom_ongoing_task_has_finished(task_id: str):
         return task_id in [
             TASK_ID1,
             TASK_ID4,
@@ -200,7 +213,8 @@ def tracker() -> Tracker:
         ),
     ],
 )
-def test_add_task(
+@pytest.mark.anyio
+async def test_add_task(
     tracker: Tracker,
     ip_address: str,
     unique_id: str,
@@ -210,7 +224,8 @@ def test_add_task(
     *,
     new_unique_id_is_set: bool,
 ):
-    result = tracker.add_task(ip_address, unique_id, task_id)
+    await tracker.refresh()
+    result = await tracker.add_task(ip_address, unique_id, task_id)
     assert result.status == expected_status
     assert result.ongoing_tasks == expected_ongoing_tasks
     assert (not new_unique_id_is_set) or (
@@ -218,18 +233,27 @@ def test_add_task(
     )
 
 
-def test_duplicate_ip(tracker: Tracker):
+@pytest.mark.anyio
+async def test_duplicate_ip(tracker: Tracker):
     with pytest.raises(Exception, match="Too many data for one single ip address"):
-        tracker.add_task(CLIENT_5_IP1, None, None)
+        await tracker.add_task(CLIENT_4_IP, None, None)
 
 
 def test_duplicate_unique_id(tracker: Tracker):
     with pytest.raises(Exception, match="Too many data for one single unique id"):
-        tracker.add_task(CLIENT_5_IP1, CLIENT_5_ID, None)
+        tracker.known_clients = [
+            *tracker.known_clients,
+            ClientInfo(  # two client IPs for one unique ID, this is a bug
+                ip_address=CLIENT_5_IP2,
+                unique_id=CLIENT_5_ID,
+                ongoing_tasks={TASK_ID8},
+            ),
+        ]
 
 
-def test_custom_max_tasks(tracker: Tracker):
-    result = tracker.add_task(CLIENT_3_IP, CLIENT_3_ID, None)
+@pytest.mark.anyio
+async def test_custom_max_tasks(tracker: Tracker):
+    result = await tracker.add_task(CLIENT_3_IP, CLIENT_3_ID, None)
     assert result.status == AddTaskStatus.TOO_MANY_TASKS_FOR_UNIQUE_ID
     assert result.ongoing_tasks == [TASK_ID2]
     assert result.new_unique_id is None
@@ -239,12 +263,190 @@ def test_custom_max_tasks(tracker: Tracker):
 
     tracker.has_reached_maximum_tasks = fake_has_reached_maximum_tasks
 
-    result = tracker.add_task(CLIENT_3_IP, CLIENT_3_ID, TASK_ID8)
+    result = await tracker.add_task(CLIENT_3_IP, CLIENT_3_ID, TASK_ID8)
     assert result.status == AddTaskStatus.TASK_ADDED
     assert result.ongoing_tasks is None
     assert result.new_unique_id is None
 
 
+@pytest.mark.anyio
+async def test_refresh_checks_tasks_concurrently(tracker: Tracker):
+    tracker.known_clients = [
+        ClientInfo(
+            ip_address=CLIENT_1_IP,
+            unique_id=CLIENT_1_ID,
+            ongoing_tasks={f"task{idx}" for idx in range(20)},
+        )
+    ]
+
+    async def slow_ongoing_task_has_finished(task_id: str) -> bool:  # noqa: ARG001
+        await asyncio.sleep(0.05)
+        return True
+
+    tracker.ongoing_task_has_finished = slow_ongoing_task_has_finished
+
+    started_on = time.monotonic()
+    await tracker.refresh()
+    assert time.monotonic() - started_on < 0.5
+    assert tracker.known_clients == []
+    result = await tracker.add_task(CLIENT_1_IP, CLIENT_1_ID, None)
+    assert result.status == AddTaskStatus.CAN_ADD_TASK
+
+
+@pytest.mark.anyio
+async def test_refresh_deadline(tracker: Tracker, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(ApiConfiguration, "tracker_refresh_timeout", 0.05)
+
+    async def stuck_ongoing_task_has_finished(task_id: str) -> bool:
+        if task_id == TASK_ID4:
+            await asyncio.sleep(10)
+        return True
+
+    tracker.ongoing_task_has_finished = stuck_ongoing_task_has_finished
+
+    # status of TASK_ID4 is unknown, it is considered to be still ongoing
+    await tracker.refresh()
+    result = await tracker.add_task(CLIENT_1_IP, CLIENT_1_ID, None)
+    assert result.status == AddTaskStatus.TOO_MANY_TASKS_FOR_UNIQUE_ID
+    assert result.ongoing_tasks == [TASK_ID4]
+
+
+@pytest.mark.anyio
+async def test_refresh_counts(tracker: Tracker):
+    assert (tracker.nb_clients, tracker.nb_ongoing_tasks) == (0, 0)
+    await tracker.refresh()
+    # client 1 is forgotten along with its finished tasks
+    assert (tracker.nb_clients, tracker.nb_ongoing_tasks) == (4, 4)
+
+
+@pytest.mark.anyio
+async def test_add_task_answers_from_memory(tracker: Tracker):
+    # tasks of client 1 have finished, but tracker has not been refreshed yet
+    result = await tracker.add_task(CLIENT_1_IP, CLIENT_1_ID, None)
+    assert result.status == AddTaskStatus.TOO_MANY_TASKS_FOR_UNIQUE_ID
+    assert result.ongoing_tasks == [TASK_ID1, TASK_ID4]
+
+
+@pytest.mark.anyio
+async def test_remove_task(tracker: Tracker):
+    await tracker.remove_task(TASK_ID1)
+    result = await tracker.add_task(CLIENT_1_IP, CLIENT_1_ID, None)
+    assert result.ongoing_tasks == [TASK_ID4]
+
+    # client is forgotten once it has no more ongoing task
+    await tracker.remove_task(TASK_ID4)
+    assert CLIENT_1_ID not in [client.unique_id for client in tracker.known_clients]
+    result = await tracker.add_task(CLIENT_1_IP, None, None)
+    assert result.status == AddTaskStatus.CAN_ADD_TASK
+
+    # unknown tasks are ignored
+    await tracker.remove_task("unknown_task")
+
+
+def test_store_counts(tracker: Tracker):
+    assert tracker.store.count_clients() == 5
+    assert tracker.store.count_ongoing_tasks() == 6
+    # a task shared by two clients is counted once
+    tracker.store.add_ongoing_task(CLIENT_3_ID, TASK_ID1)
+    assert tracker.store.count_ongoing_tasks() == 6
+    tracker.store.remove_task(TASK_ID2)
+    assert tracker.store.count_clients() == 5
+    assert tracker.store.count_ongoing_tasks() == 5
+
+
+@pytest.mark.anyio
+async def test_sqlite_store_is_persisted(tmp_path: Path):
+    ApiConfiguration.digest_key = bytes.fromhex("723a207d91341918")
+    tracker = Tracker(SQLiteTrackerStore(tmp_path / "tracker.db"))
+    await tracker.add_task(CLIENT_1_IP, CLIENT_1_ID, TASK_ID1)
+
+    # e.g. another worker, or same worker after a restart
+    other_tracker = Tracker(SQLiteTrackerStore(tmp_path / "tracker.db"))
+    result = await other_tracker.add_task(CLIENT_1_IP, CLIENT_1_ID, TASK_ID2)
+    assert result.status == AddTaskStatus.TOO_MANY_TASKS_FOR_UNIQUE_ID
+    assert result.ongoing_tasks == [TASK_ID1]
+
+    await other_tracker.remove_task(TASK_ID1)
+    assert tracker.known_clients == []
+
+
+@pytest.mark.anyio
+async def test_sqlite_store_check_and_add_is_atomic(tmp_path: Path):
+    ApiConfiguration.digest_key = bytes.fromhex("723a207d91341918")
+    SQLiteTrackerStore(tmp_path / "tracker.db")
+
+    async def add_task(task_id: str) -> AddTaskStatus:
+        # one store per call, like distinct workers sharing the database
+        tracker = Tracker(SQLiteTrackerStore(tmp_path / "tracker.db"))
+        return (await tracker.add_task(CLIENT_1_IP, CLIENT_1_ID, task_id)).status
+
+    statuses = await asyncio.gather(*[add_task(f"task{idx}") for idx in range(20)])
+
+    assert statuses.count(AddTaskStatus.TASK_ADDED) == 1
+    assert statuses.count(AddTaskStatus.TOO_MANY_TASKS_FOR_UNIQUE_ID) == 19
+
+
+@pytest.mark.anyio
+async def test_remove_client_task(tracker: Tracker):
+    # task shared by two clients
+    await tracker.add_task(CLIENT_2_IP, CLIENT_2_VALID_ID, TASK_ID2)
+
+    await tracker.remove_client_task(CLIENT_2_VALID_ID, TASK_ID2)
+    result = await tracker.add_task(CLIENT_2_IP, CLIENT_2_VALID_ID, None)
+    assert result.status == AddTaskStatus.CAN_ADD_TASK
+    result = await tracker.add_task(CLIENT_3_IP, CLIENT_3_ID, None)
+    assert result.ongoing_tasks == [TASK_ID2]
+
+    await tracker.remove_client_task(CLIENT_1_IP, TASK_ID1)
+    await tracker.remove_client_task(CLIENT_1_ID, TASK_ID1)
+    result = await tracker.add_task(CLIENT_1_IP, CLIENT_1_ID, None)
+    assert result.ongoing_tasks == [TASK_ID4]
+
+
+@pytest.mark.anyio
+async def test_reserve_task(tracker: Tracker, monkeypatch: pytest.MonkeyPatch):
+    reservation = await tracker.reserve_task(CLIENT_2_IP, None)
+    assert reservation.status == AddTaskStatus.TASK_ADDED
+    assert reservation.new_unique_id and reservation.pending_task_id
+    # slot is held while task is being created
+    result = await tracker.reserve_task(CLIENT_2_IP, None)
+    assert result.status == AddTaskStatus.TOO_MANY_TASKS_FOR_IP_ADDRESS
+    result = await tracker.add_task(CLIENT_2_IP, reservation.new_unique_id, None)
+    assert result.status == AddTaskStatus.TOO_MANY_TASKS_FOR_UNIQUE_ID
+    assert result.ongoing_tasks == []
+
+    # pending task is not checked on the Zimfarm
+    checked: list[str] = []
+
+    async def ongoing_task_has_finished(task_id: str) -> bool:
+        checked.append(task_id)
+        return False
+
+    tracker.ongoing_task_has_finished = ongoing_task_has_finished
+    await tracker.refresh()
+    assert reservation.pending_task_id not in checked
+
+    await tracker.confirm_task(
+        CLIENT_2_IP, reservation.new_unique_id, reservation.pending_task_id, TASK_ID3
+    )
+    result = await tracker.add_task(CLIENT_2_IP, reservation.new_unique_id, None)
+    assert result.ongoing_tasks == [TASK_ID3]
+
+    # failed creation releases the slot
+    reservation = await tracker.reserve_task(CLIENT_3_IP, CLIENT_2_VALID_ID)
+    assert reservation.pending_task_id
+    await tracker.release_task(CLIENT_2_VALID_ID, reservation.pending_task_id)
+    result = await tracker.add_task(CLIENT_3_IP, CLIENT_2_VALID_ID, None)
+    assert result.status == AddTaskStatus.CAN_ADD_TASK
+
+    # slot is freed once stale, e.g. worker crashed while creating task
+    reservation = await tracker.reserve_task(CLIENT_3_IP, CLIENT_2_VALID_ID)
+    monkeypatch.setattr(ApiConfiguration, "tracker_reservation_ttl", -1)
+    await tracker.refresh()
+    result = await tracker.add_task(CLIENT_3_IP, CLIENT_2_VALID_ID, None)
+    assert result.status == AddTaskStatus.CAN_ADD_TASK
+
+
 def test_generate_validate_id():
     assert is_valid_unique_id(generate_unique_id())
 
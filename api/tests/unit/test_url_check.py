@@ -0,0 +1,121 @@
+import httpx
+import pytest
+
+from zimitfrontend import url_check
+from zimitfrontend.url_check import UrlCheckStatus, check_url
+
+
+@pytest.fixture()
+def probes(monkeypatch: pytest.MonkeyPatch) -> list[httpx.Request]:
+    """Probes sent to websites, of which only example.com is up"""
+    probes: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        probes.append(request)
+        if request.headers["Host"].split(":")[0] != "example.com":
+            raise httpx.ConnectError("Connection refused", request=request)
+        return httpx.Response(405)
+
+    monkeypatch.setattr(
+        url_check,
+        "probe_client",
+        httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+
+    async def resolve_global_address(hostname: str, _: int) -> str | None:
+        return None if hostname == "internal.example.org" else "93.184.216.34"
+
+    monkeypatch.setattr(url_check, "_resolve_global_address", resolve_global_address)
+    url_check.reachability_cache.clear()
+    return probes
+
+
+@pytest.mark.parametrize(
+    "url, expected_status, expected_url",
+    [
+        pytest.param(
+            "https://Example.com/Page", UrlCheckStatus.OK, "https://example.com/Page"
+        ),
+        pytest.param("example.com", UrlCheckStatus.OK, "example.com"),
+        pytest.param(
+            "https://www.youtube.com/watch",
+            UrlCheckStatus.BLACKLISTED,
+            "https://www.youtube.com/watch",
+        ),
+        pytest.param("https://down.example.org", UrlCheckStatus.UNREACHABLE, None),
+        pytest.param("https://internal.example.org", UrlCheckStatus.UNREACHABLE, None),
+        pytest.param("https://", UrlCheckStatus.INVALID_URL, None),
+    ],
+)
+@pytest.mark.usefixtures("probes")
+@pytest.mark.anyio
+async def test_check_url(
+    url: str,
+    expected_status: UrlCheckStatus,
+    expected_url: str | None,
+):
+    result = await check_url(url)
+    assert result.status == expected_status
+    assert result.url == (expected_url or url)
+    assert (result.blacklist is not None) == (
+        expected_status == UrlCheckStatus.BLACKLISTED
+    )
+
+
+@pytest.mark.anyio
+async def test_check_url_caches_reachability_by_host(probes: list[httpx.Request]):
+    assert (await check_url("https://example.com/a")).reachable
+    assert (await check_url("https://EXAMPLE.com/b")).reachable
+    assert len(probes) == 1
+
+
+@pytest.mark.anyio
+async def test_check_url_caches_reachability_by_origin(probes: list[httpx.Request]):
+    for url in (
+        "https://example.com/a",
+        "http://example.com/a",
+        "https://example.com:443/b",
+        "https://example.com:8443/a",
+    ):
+        assert (await check_url(url)).reachable
+    assert [str(probe.url) for probe in probes] == [
+        "https://93.184.216.34/a",
+        "http://93.184.216.34/a",
+        "https://93.184.216.34:8443/a",
+    ]
+
+
+@pytest.mark.anyio
+async def test_probe_connects_to_resolved_address(probes: list[httpx.Request]):
+    assert (await check_url("https://user@example.com/page?q=1")).reachable
+    (probe,) = probes
+    assert probe.method == "HEAD"
+    assert str(probe.url) == "https://93.184.216.34/page?q=1"
+    assert probe.headers["Host"] == "example.com"
+    assert probe.extensions["sni_hostname"] == "example.com"
+
+
+@pytest.mark.anyio
+async def test_check_url_without_probe(
+    probes: list[httpx.Request], monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(url_check.ApiConfiguration, "check_url_probe_timeout", 0)
+    result = await check_url("https://down.example.org")
+    assert result.status == UrlCheckStatus.OK
+    assert result.reachable is None
+    assert probes == []
+
+
+@pytest.mark.parametrize(
+    "hostname, expected",
+    [
+        ("127.0.0.1", None),
+        ("10.1.2.3", None),
+        ("::1", None),
+        ("1.1.1.1", "1.1.1.1"),
+        ("2606:4700:4700::1111", "2606:4700:4700::1111"),
+    ],
+)
+@pytest.mark.anyio
+async def test_resolve_global_address(hostname: str, expected: str | None):
+    assert await url_check._resolve_global_address(hostname, 443) == expected
@@ -0,0 +1,201 @@
+import asyncio
+import datetime
+from typing import Any
+
+import httpx
+import pytest
+
+from zimitfrontend import zimfarm
+from zimitfrontend.zimfarm import ZimfarmClientTokenProvider, getnow, query_api
+
+
+@pytest.mark.usefixtures("zimfarm_api")
+@pytest.mark.anyio
+async def test_concurrent_callers_share_refresh(zimfarm_calls: list[str]):
+    provider = ZimfarmClientTokenProvider()
+    tokens = await asyncio.gather(*[provider.get_access_token() for _ in range(20)])
+    assert zimfarm_calls == ["POST /auth/authorize"]
+    assert set(tokens) == {"token1"}
+
+
+@pytest.mark.anyio
+async def test_refresh_in_background_within_renewal_window(
+    zimfarm_api: dict[str, Any], zimfarm_calls: list[str]
+):
+    def issue_short_lived_token(_: httpx.Request) -> tuple[int, Any]:
+        nb_tokens = len(zimfarm_calls)
+        # token expires within the default renewal window (2 minutes)
+        return 200, {
+            "access_token": f"token{nb_tokens}",
+            "refresh_token": f"refresh{nb_tokens}",
+            "expires_time": (getnow() + datetime.timedelta(minutes=1)).isoformat(),
+        }
+
+    zimfarm_api["POST /auth/authorize"] = issue_short_lived_token
+    zimfarm_api["POST /auth/refresh"] = issue_short_lived_token
+    provider = ZimfarmClientTokenProvider()
+    assert await provider.get_access_token() == "token1"
+
+    # old token is still valid, it is returned while refresh happens in background
+    tokens = await asyncio.gather(*[provider.get_access_token() for _ in range(20)])
+    assert set(tokens) == {"token1"}
+    await asyncio.sleep(0.05)
+    assert zimfarm_calls == ["POST /auth/authorize", "POST /auth/refresh"]
+    assert provider.access_token == "token2"
+
+
+@pytest.mark.usefixtures("zimfarm_api")
+@pytest.mark.anyio
+async def test_invalidate_stale_token(zimfarm_calls: list[str]):
+    provider = ZimfarmClientTokenProvider()
+    await provider.get_access_token()
+
+    # many requests rejected with the same token only trigger one refresh
+    await asyncio.gather(*[provider.invalidate("token1") for _ in range(20)])
+    assert len(zimfarm_calls) == 2
+    assert provider.access_token == "token2"
+
+    # late rejection of an already replaced token does not trigger a refresh
+    await provider.invalidate("token1")
+    assert len(zimfarm_calls) == 2
+
+
+@pytest.mark.anyio
+async def test_unauthorized_callers_share_forced_refresh(
+    zimfarm_api: dict[str, Any], zimfarm_calls: list[str]
+):
+    def get_task(request: httpx.Request) -> tuple[int, Any]:
+        # e.g. Zimfarm restarted and does not know first token anymore
+        if request.headers["Authorization"] == "Bearer token1":
+            return 401, {"error": "Token expired"}
+        return 200, {"id": "task1"}
+
+    zimfarm_api["GET /tasks/task1"] = get_task
+    results = await asyncio.gather(
+        *[query_api("GET", "/tasks/task1") for _ in range(10)]
+    )
+    assert {result[1] for result in results} == {401}
+    assert [call for call in zimfarm_calls if call.startswith("POST ")] == [
+        "POST /auth/authorize",
+        "POST /auth/refresh",
+    ]
+    assert zimfarm.zimfarm_client_token_provider.access_token == "token2"
+
+    assert await query_api("GET", "/tasks/task1") == (True, 200, {"id": "task1"})
+    assert len(zimfarm_calls) == 13
+
+
+@pytest.mark.anyio
+async def test_failed_background_refresh_surfaces_on_next_call(
+    zimfarm_api: dict[str, Any], zimfarm_calls: list[str]
+):
+    def issue_short_lived_token(_: httpx.Request) -> tuple[int, Any]:
+        # token expires within the renewal window, and soon
+        return 200, {
+            "access_token": f"token{len(zimfarm_calls)}",
+            "refresh_token": f"refresh{len(zimfarm_calls)}",
+            "expires_time": (getnow() + datetime.timedelta(seconds=0.2)).isoformat(),
+        }
+
+    zimfarm_api["POST /auth/authorize"] = issue_short_lived_token
+    zimfarm_api["POST /auth/refresh"] = (500, {"error": "Internal error"})
+    provider = ZimfarmClientTokenProvider()
+    assert await provider.get_access_token() == "token1"
+    nb_failures = zimfarm.token_refreshes.get(result="failure")
+
+    # refresh fails in background, token is still valid meanwhile
+    assert await provider.get_access_token() == "token1"
+    await asyncio.sleep(0.01)
+    assert zimfarm_calls == ["POST /auth/authorize", "POST /auth/refresh"]
+    assert zimfarm.token_refreshes.get(result="failure") == nb_failures + 1
+
+    # failed refresh is not reused: next call once token expired refreshes again,
+    # and fails since there is no usable token
+    await asyncio.sleep(0.2)
+    with pytest.raises(httpx.HTTPStatusError):
+        await provider.get_access_token()
+    assert zimfarm_calls[-1] == "POST /auth/refresh"
+    assert len(zimfarm_calls) == 3
+
+    zimfarm_api["POST /auth/refresh"] = issue_short_lived_token
+    assert await provider.get_access_token() == "token4"
+
+
+@pytest.mark.anyio
+async def test_transient_errors_are_retried_with_backoff(
+    zimfarm_api: dict[str, Any],
+    zimfarm_calls: list[str],
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(zimfarm.ApiConfiguration, "zimfarm_max_retries", 3)
+    monkeypatch.setattr(zimfarm.ApiConfiguration, "zimfarm_retry_backoff", 0.5)
+    zimfarm_api["GET /tasks/task1"] = [
+        (503, {"error": "Unavailable"}),
+        (502, {"error": "Bad gateway"}),
+        (200, {"id": "task1"}),
+    ]
+    await zimfarm.authenticate()
+    zimfarm_calls.clear()
+
+    sleeps: list[float] = []
+    original_sleep = asyncio.sleep
+
+    async def sleep(delay: float):
+        sleeps.append(delay)
+        await original_sleep(0)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    assert await query_api("GET", "/tasks/task1") == (True, 200, {"id": "task1"})
+    assert zimfarm_calls == ["GET /tasks/task1"] * 3
+    assert sleeps == [0.5, 1.0]
+
+
+@pytest.mark.parametrize(
+    "method, nb_calls",
+    [
+        pytest.param("GET", 3, id="get"),
+        pytest.param("DELETE", 3, id="delete"),
+        pytest.param("POST", 1, id="post"),
+        pytest.param("PATCH", 1, id="patch"),
+    ],
+)
+@pytest.mark.anyio
+async def test_only_idempotent_methods_are_retried(
+    zimfarm_api: dict[str, Any],
+    zimfarm_calls: list[str],
+    monkeypatch: pytest.MonkeyPatch,
+    method: str,
+    nb_calls: int,
+):
+    monkeypatch.setattr(zimfarm.ApiConfiguration, "zimfarm_max_retries", 2)
+    zimfarm_api[f"{method} /requested-tasks"] = (503, {"error": "Unavailable"})
+    await zimfarm.authenticate()
+    zimfarm_calls.clear()
+
+    # retries are capped, and last reply is returned
+    assert await query_api(method, "/requested-tasks") == (
+        False,
+        503,
+        "Unavailable",
+    )
+    assert zimfarm_calls == [f"{method} /requested-tasks"] * nb_calls
+
+
+@pytest.mark.parametrize(
+    "path,expected",
+    [
+        pytest.param("/recipes", "/recipes", id="collection"),
+        pytest.param("/recipes/www.acme.com_1a2b3c4d", "/recipes/{id}", id="recipe"),
+        pytest.param(
+            "/tasks/6341c25f-aac9-41aa-b9bb-3ddee058a0bf/cancel",
+            "/tasks/{id}/cancel",
+            id="task_action",
+        ),
+        pytest.param(
+            "/offliners/zimit/1.2.0", "/offliners/zimit/{id}", id="offliner_version"
+        ),
+        pytest.param("auth/test", "/auth/test", id="relative"),
+    ],
+)
+def test_get_path_template(path: str, expected: str):
+    assert zimfarm.get_path_template(path) == expected
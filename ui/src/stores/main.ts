@@ -13,9 +13,11 @@ export type RootState = {
   formValues: NameValue[]
   taskId: string
   taskData: TaskData | undefined
+  taskEtag: string | undefined
   taskNotFound: boolean
   snackbarDisplayed: boolean
   snackbarContent: string
+  snackbarColor: string
   trackerStatus: TrackerStatusResponse | undefined
   blacklistReason: BlacklistEntry | undefined
 }
@@ -56,6 +58,13 @@ export type TrackerStatusResponse = {
   ongoingTasks: string[] | undefined
 }
 
+export type CheckUrlResponse = {
+  status: string
+  url: string
+  blacklist: BlacklistEntry | null
+  reachable: boolean | null
+}
+
 export type PostRequestResponse = {
   id: string
   newUniqueId: string | undefined
@@ -112,9 +121,11 @@ export const useMainStore = defineStore('main', {
       formValues: [] as NameValue[],
       taskId: '',
       taskData: undefined,
+      taskEtag: undefined,
       taskNotFound: false,
       snackbarDisplayed: false,
       snackbarContent: '',
+      snackbarColor: 'red',
       trackerStatus: undefined,
       blacklistReason: undefined
     }) as RootState,
@@ -133,9 +144,19 @@ export const useMainStore = defineStore('main', {
         text: this.t('requestStatus.refreshing')
       })
       try {
-        this.taskData = (
-          await axios.get<TaskData>(this.config.zimit_ui_api + '/requests/' + this.taskId)
-        ).data
+        // only send entity tag of the task data we currently have
+        const etag = this.taskData?.id == this.taskId ? this.taskEtag : undefined
+        const response = await axios.get<TaskData>(
+          this.config.zimit_ui_api + '/requests/' + this.taskId,
+          {
+            headers: etag ? { 'If-None-Match': etag } : {},
+            validateStatus: (status) => (status >= 200 && status < 300) || status == 304
+          }
+        )
+        if (response.status != 304) {
+          this.taskData = response.data
+          this.taskEtag = response.headers['etag']
+        }
         this.taskNotFound = false
       } catch (error) {
         this.handleError(this.t('requestStatus.errorRefreshing'), error)
@@ -144,6 +165,20 @@ export const useMainStore = defineStore('main', {
         this.setLoading({ loading: false })
       }
     },
+    watchTask(): EventSource {
+      // receives changed task fields until task has ended
+      const eventSource = new EventSource(
+        this.config.zimit_ui_api + '/requests/' + this.taskId + '/events'
+      )
+      eventSource.addEventListener('info', (event: MessageEvent<string>) => {
+        const changes = JSON.parse(event.data) as Partial<TaskData>
+        this.taskData = { ...this.taskData, ...changes } as TaskData
+        this.taskEtag = undefined
+        this.taskNotFound = false
+      })
+      eventSource.addEventListener('end', () => eventSource.close())
+      return eventSource
+    },
     setLoading(payload: LoadingPayload) {
       //toggle GUI loader
       this.loading = payload.loading
@@ -225,6 +260,10 @@ export const useMainStore = defineStore('main', {
         text: this.t('newRequest.creatingRequest')
       })
       try {
+        // cheap pre-flight check, so that bad URLs never reach request creation
+        if (!(await this.checkUrl(payload.url))) {
+          return
+        }
         const response = (
           await axios.post<PostRequestResponse>(this.config.zimit_ui_api + '/requests', payload)
         ).data
@@ -243,6 +282,32 @@ export const useMainStore = defineStore('main', {
         this.setLoading({ loading: false })
       }
     },
+    async checkUrl(url: string): Promise<boolean> {
+      try {
+        const response = (
+          await axios.post<CheckUrlResponse>(this.config.zimit_ui_api + '/requests/check', {
+            url: url
+          })
+        ).data
+        if (response.status == 'blacklisted' && response.blacklist) {
+          this.blacklistReason = response.blacklist
+          return false
+        }
+        if (response.status == 'invalid_url') {
+          this.handleError(this.t('newRequest.urlInvalid'), undefined)
+          return false
+        }
+        // probe might have been refused (e.g. HEAD requests, bots) while crawl can
+        // still succeed, only warn user
+        if (response.status == 'unreachable') {
+          this.showWarning(this.t('newRequest.urlUnreachable'))
+        }
+      } catch (error) {
+        // check is only a shortcut, request creation does its own checks anyway
+        console.error('Failed to check URL:', error)
+      }
+      return true
+    },
     async cancelRequest() {
       const payload = {
         uniqueId: localStorage.getItem('uniqueId')
@@ -273,6 +338,12 @@ export const useMainStore = defineStore('main', {
         console.error(message, ':', error)
       }
       this.snackbarContent = message
+      this.snackbarColor = 'red'
+      this.snackbarDisplayed = true
+    },
+    showWarning(message: string) {
+      this.snackbarContent = message
+      this.snackbarColor = 'warning'
       this.snackbarDisplayed = true
     }
   },